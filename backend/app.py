@@ -1,19 +1,56 @@
 import os
-from flask import Flask, request, jsonify
+import sys
+import time
+import base64
+from datetime import datetime
+from flask import Flask, Response, request, jsonify, stream_with_context
 from database import db
-from models import Video
+from models import Video, Resolution
+from sqlalchemy import and_, or_, func
+from sqlalchemy.orm import load_only
 from werkzeug.utils import secure_filename
 from flask_cors import CORS
 import uuid
+import json
 import redis
 from rq import Queue
 from tasks import process_video_task
 
+# Storage drivers, progress snapshots and the redis keys the services write are
+# shared with the services rather than copied
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services'))
+from common.storage import get_storage
+from common.progress import progress_snapshot, PROGRESS_CHANNEL, FINAL_STAGES
+from common.heartbeat import NODES_KEY, HEARTBEAT_INTERVAL_S
+from common.lifecycle import USAGE_KEY as DISK_USAGE_KEY, STAGE_PREFIXES
+from common.scheduler import chunking_job_timeout, PRIORITY_TIERS as JOB_PRIORITIES
+
 
 TEMP_UPLOAD_FOLDER = 'temp_uploads'
 
 CHUNKER_SERVICE_METHOD = 'chunker.chunk_video_task'
 
+# Resumable uploads: parts are streamed to disk in blocks of this size
+UPLOAD_STREAM_BLOCK_SIZE = 1024 * 1024  # 1MB
+UPLOAD_SESSION_TTL = 24 * 60 * 60  # Abandoned upload sessions expire after a day
+
+# Nodes in the services' registry (NODES_KEY) count as stale after missing a heartbeat
+NODE_STALE_AFTER_S = 2 * HEARTBEAT_INTERVAL_S
+
+# Video listing pages
+LISTING_PAGE_SIZE = 50
+LISTING_MAX_PAGE_SIZE = 200
+
+# Server-sent progress streams
+SSE_KEEPALIVE_S = 15  # Comment line sent on idle streams so proxies keep them open
+
+# Stages the workers measure disk usage of, published under DISK_USAGE_KEY
+DISK_USAGE_STAGES = (*STAGE_PREFIXES, 'cache')
+
+# Shared object storage the workers read uploads from (see
+# services/common/storage.py); uploads are written under the backend's directory
+storage = get_storage(root=os.getenv('STORAGE_ROOT', '.'))
+
 # Connect to Redis
 redis_conn = redis.Redis(host='localhost', port=6379)
 
@@ -40,8 +77,144 @@ os.makedirs(TEMP_UPLOAD_FOLDER, exist_ok=True)
 @app.cli.command('create_db')
 def create_db():
     db.create_all()
+    # create_all skips tables that already exist; add indexes introduced since
+    for index in Video.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
     print("Database created.")
 
+def parse_optional_count(params, name):
+    """A positive integer param; missing or empty means unset (None)."""
+    value = params.get(name)
+    if value is None or value == '':
+        return None
+    # bool is an int subclass, and int() would silently truncate 2.5 to 2
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"{name} must be an integer: {value}")
+    try:
+        count = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"{name} must be an integer: {value}")
+    if count < 1:
+        raise ValueError(f"{name} must be positive: {value}")
+    return count
+
+def parse_upload_size(value):
+    """Declared byte size of a resumable upload; a non-negative integer."""
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"size must be an integer: {value}")
+    try:
+        size = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"size must be an integer: {value}")
+    if size < 0:
+        raise ValueError(f"size must not be negative: {value}")
+    return size
+
+def parse_processing_params(params):
+    """
+    Extract the processing fields sent by the frontend (enum names).
+    chunkSize (MB) and maxNodes are optional overrides; when unset the
+    chunker sizes chunks from the source and the live workers.
+    """
+    return {
+        "chunk_size": parse_optional_count(params, 'chunkSize'),
+        "max_nodes": parse_optional_count(params, 'maxNodes'),
+        "resolution": params.get('resolution'),
+        "audio_bitrate": params.get('audioBitrate'),
+        "video_bitrate": params.get('videoBitrate'),
+        "audio_codec": params.get('audioCodec'),
+        "video_codec": params.get('videoCodec'),
+        "crf_value": params.get('crfValue'),
+        "preset": params.get('preset'),
+    }
+
+def parse_job_options(params):
+    """
+    Options that only steer the pipeline and live in the redis video hash,
+    not in the database:
+    - renditions: optional ABR ladder, a list of Resolution names produced
+      from a single decode (stored comma-separated)
+    - priority: scheduling tier, one of high / normal / low
+    - targetSizeMb: size the output should land near; the chunker picks the
+      CRF from trial encodes (stored as target_size_mb)
+    """
+    options = {}
+
+    renditions = params.get('renditions')
+    if renditions:
+        options['renditions'] = ','.join(Resolution[name].name for name in renditions)
+
+    priority = params.get('priority')
+    if priority:
+        if priority not in JOB_PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        options['priority'] = priority
+
+    target_size_mb = params.get('targetSizeMb')
+    if target_size_mb:
+        if float(target_size_mb) <= 0:
+            raise ValueError(f"targetSizeMb must be positive: {target_size_mb}")
+        options['target_size_mb'] = float(target_size_mb)
+
+    return options
+
+def register_uploaded_video(original_filename, file_uid, ext, file_size, processing, job_options=None):
+    """
+    Record a fully uploaded file in the database and redis. Returns the new
+    Video row; publish_uploaded_video() then hands the file to the chunker.
+    """
+    stored_filename = f"{file_uid}{ext}"
+
+    # Create database entry
+    video = Video(
+        filename=original_filename,
+        stored_filename=stored_filename,
+        status='uploaded',
+        uploader_ip=request.remote_addr,
+        size=file_size,
+        **processing
+    )
+
+    db.session.add(video)
+    db.session.commit()
+
+    # Redis cannot store None, so unset parameters are left out of the hash
+    video_metadata = {
+        "size": file_size,
+        **{key: value for key, value in processing.items() if value is not None},
+        "status": "uploaded"
+    }
+    video_metadata.update(job_options or {})
+
+    print(f"[Backend] Added video with metadata to redis hashstore: {file_uid}")
+    redis_conn.hset(f'video:{file_uid}', mapping=video_metadata)
+
+    return video
+
+def publish_uploaded_video(file_uid, ext, save_path, file_size):
+    """Store a registered upload where the chunker can fetch it and enqueue it for chunking."""
+    storage.store_file(save_path)
+    storage.release_file(save_path)
+
+    # Enqueue video into processing_video queue
+    chunking_queue.enqueue(
+        CHUNKER_SERVICE_METHOD,
+        file_uid,
+        ext,
+        job_timeout=chunking_job_timeout(file_size)
+    )
+
+def upload_part_path(file_uid, ext):
+    """Path of the in-progress file for a resumable upload."""
+    return os.path.join(app.config['UPLOAD_FOLDER'], f"{file_uid}{ext}.part")
+
+def get_upload_session(upload_id):
+    """Load a resumable upload session from redis, or None if unknown."""
+    session = redis_conn.hgetall(f'upload:{upload_id}')
+    if not session:
+        return None
+    return {key.decode(): value.decode() for key, value in session.items()}
+
 # Upload route
 @app.route('/api/upload', methods=['POST'])
 def upload_video():
@@ -55,23 +228,16 @@ def upload_video():
         # 🆕 Parse processing parameters
         params = request.form.get('params')
         if params:
-            import json
             params = json.loads(params)
         else:
             params = {}
 
         # 🆕 Extract individual fields safely        
-        resolution = params.get('resolution')
-        
-        audio_bitrate = params.get('audioBitrate')
-        video_bitrate = params.get('videoBitrate')
-        
-        audio_codec = params.get('audioCodec')
-        video_codec = params.get('videoCodec')
-
-        crf_value = params.get('crfValue')
-        preset = params.get('preset')
-        
+        try:
+            processing = parse_processing_params(params)
+            job_options = parse_job_options(params)
+        except (ValueError, KeyError) as e:
+            return jsonify({"error": f"Invalid params: {e}"}), 400
 
         for file in files:
             if file.filename == '':
@@ -89,48 +255,10 @@ def upload_video():
             save_path = os.path.join(app.config['UPLOAD_FOLDER'], stored_filename)
             file.save(save_path)
 
+            # Step 4: Create database entry and enqueue for chunking
             file_size = os.path.getsize(save_path)
-
-            # Step 4: Create database entry
-            video = Video(
-                filename=original_filename,
-                stored_filename=stored_filename,
-                status='uploaded',
-                uploader_ip=request.remote_addr,  
-                size=file_size,
-                resolution=resolution,
-                video_bitrate=video_bitrate,
-                audio_bitrate=audio_bitrate,
-                crf_value=crf_value,
-                preset=preset,
-                video_codec=video_codec,
-                audio_codec=audio_codec
-            )
-
-            db.session.add(video)
-            db.session.commit()
-
-            video_metadata = {
-                "size": file_size,
-                "resolution": resolution,
-                "video_bitrate": video_bitrate,
-                "audio_bitrate": audio_bitrate,
-                "crf_value": crf_value,
-                "preset": preset,
-                "video_codec": video_codec,
-                "audio_codec": audio_codec,
-                "status": "uploaded"
-            }
-
-            print(f"[Backend] Added video with metadata to redis hashstore: {file_uid}")
-            redis_conn.hset(f'video:{file_uid}', mapping=video_metadata)
-
-            # Enqueue video into processing_video queue
-            chunking_queue.enqueue(
-                CHUNKER_SERVICE_METHOD, 
-                file_uid,
-                ext
-            )
+            video = register_uploaded_video(original_filename, file_uid, ext, file_size, processing, job_options)
+            publish_uploaded_video(file_uid, ext, save_path, file_size)
 
             uploaded_files.append(video.to_dict())
 
@@ -144,41 +272,455 @@ def upload_video():
             "error": str(e)
         }), 500
 
+# Resumable upload: init
+@app.route('/api/uploads', methods=['POST'])
+def init_upload():
+    """
+    Start a resumable upload. Expects JSON {filename, size, params} and
+    returns an upload_id to PUT parts against.
+    """
+    try:
+        body = request.get_json(silent=True) or {}
+        if not body.get('filename') or body.get('size') is None:
+            return jsonify({"error": "filename and size are required"}), 400
+
+        try:
+            size = parse_upload_size(body['size'])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Reject bad params now rather than after the whole file is sent
+        params = body.get('params') or {}
+        try:
+            parse_processing_params(params)
+            parse_job_options(params)
+        except (ValueError, KeyError) as e:
+            return jsonify({"error": f"Invalid params: {e}"}), 400
+
+        original_filename = secure_filename(body['filename'])
+        file_uid = str(uuid.uuid4())
+        ext = os.path.splitext(original_filename)[1]  # preserve extension
+
+        # Create the empty part file so offsets can be checked against it
+        open(upload_part_path(file_uid, ext), 'wb').close()
+
+        session_key = f'upload:{file_uid}'
+        redis_conn.hset(session_key, mapping={
+            "filename": original_filename,
+            "ext": ext,
+            "size": size,
+            "params": json.dumps(params)
+        })
+        redis_conn.expire(session_key, UPLOAD_SESSION_TTL)
+
+        return jsonify({"upload_id": file_uid, "offset": 0}), 201
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Resumable upload: current offset (used by clients to resume)
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload_status(upload_id):
+    session = get_upload_session(upload_id)
+    if session is None:
+        return jsonify({"error": "Unknown upload"}), 404
+
+    offset = os.path.getsize(upload_part_path(upload_id, session['ext']))
+    return jsonify({
+        "upload_id": upload_id,
+        "offset": offset,
+        "size": int(session['size'])
+    }), 200
+
+# Resumable upload: write a part at an offset
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def upload_part(upload_id):
+    """
+    Write the raw request body at the offset given in the Upload-Offset
+    header. The body is streamed to disk in fixed-size blocks, so memory use
+    does not depend on part size. Offsets past the bytes already received are
+    rejected with 409 and the current offset, letting clients resume.
+    """
+    try:
+        session = get_upload_session(upload_id)
+        if session is None:
+            return jsonify({"error": "Unknown upload"}), 404
+
+        part_path = upload_part_path(upload_id, session['ext'])
+        received = os.path.getsize(part_path)
+
+        offset = request.headers.get('Upload-Offset', type=int)
+        if offset is None:
+            return jsonify({"error": "Upload-Offset header is required"}), 400
+        if offset > received:
+            return jsonify({"error": "Offset is past the received data", "offset": received}), 409
+
+        # Refuse an oversized part before any of it is written
+        total_size = int(session['size'])
+        if request.content_length is not None and offset + request.content_length > total_size:
+            return jsonify({"error": "Part exceeds declared upload size"}), 400
+
+        with open(part_path, 'r+b') as f:
+            f.seek(offset)
+            while True:
+                block = request.stream.read(UPLOAD_STREAM_BLOCK_SIZE)
+                if not block:
+                    break
+                if f.tell() + len(block) > total_size:
+                    return jsonify({"error": "Part exceeds declared upload size"}), 400
+                f.write(block)
+            offset = f.tell()
+
+        redis_conn.expire(f'upload:{upload_id}', UPLOAD_SESSION_TTL)
+
+        return jsonify({"upload_id": upload_id, "offset": max(offset, received)}), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Resumable upload: finalize and start chunking
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    try:
+        session = get_upload_session(upload_id)
+        if session is None:
+            return jsonify({"error": "Unknown upload"}), 404
+
+        ext = session['ext']
+        part_path = upload_part_path(upload_id, ext)
+        received = os.path.getsize(part_path)
+        if received != int(session['size']):
+            return jsonify({"error": "Upload is incomplete", "offset": received}), 409
+
+        # Validate before the session and part file are consumed, so a bad
+        # request leaves the upload intact
+        params = json.loads(session['params'])
+        try:
+            processing = parse_processing_params(params)
+            job_options = parse_job_options(params)
+        except (ValueError, KeyError) as e:
+            return jsonify({"error": f"Invalid params: {e}"}), 400
+
+        # Register first: if that fails the session and part file are left
+        # as they were, so the client can retry the completion
+        video = register_uploaded_video(session['filename'], upload_id, ext, received, processing, job_options)
+
+        # Rename in place; the chunker reads the file where it already is
+        save_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{upload_id}{ext}")
+        os.replace(part_path, save_path)
+        redis_conn.delete(f'upload:{upload_id}')
+        publish_uploaded_video(upload_id, ext, save_path, received)
+
+        return jsonify({
+            "uploaded": [video.to_dict()],
+            "message": "Video uploaded successfully and parameters stored."
+        }), 201
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def enum_value(member):
+    return member.value if member is not None else None
+
+def format_resolution(resolution):
+    return f'{resolution.value[0]}x{resolution.value[1]}' if resolution is not None else None
+
+def format_datetime(value):
+    return value.isoformat() if value else None
+
+# Fields a listing can select with ?fields=: name -> (columns to load, serializer)
+LISTING_FIELDS = {
+    "id": (('id',), lambda video: video.id),
+    "video_id": (('stored_filename',), lambda video: os.path.splitext(video.stored_filename)[0]),
+    "filename": (('filename',), lambda video: video.filename),
+    "stored_filename": (('stored_filename',), lambda video: video.stored_filename),
+    "status": (('status',), lambda video: video.status),
+    "uploader_ip": (('uploader_ip',), lambda video: video.uploader_ip),
+    "size": (('size',), lambda video: video.size),
+    "resolution": (('resolution',), lambda video: format_resolution(video.resolution)),
+    "video_bitrate": (('video_bitrate',), lambda video: enum_value(video.video_bitrate)),
+    "audio_bitrate": (('audio_bitrate',), lambda video: enum_value(video.audio_bitrate)),
+    "crf_value": (('crf_value',), lambda video: enum_value(video.crf_value)),
+    "preset": (('preset',), lambda video: enum_value(video.preset)),
+    "video_codec": (('video_codec',), lambda video: video.video_codec),
+    "audio_codec": (('audio_codec',), lambda video: video.audio_codec),
+    "created_at": (('created_at',), lambda video: format_datetime(video.created_at)),
+    "updated_at": (('updated_at',), lambda video: format_datetime(video.updated_at)),
+}
+
+def parse_datetime(value):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid timestamp: {value}")
+
+def encode_cursor(video):
+    """Opaque cursor pointing just past a video in (created_at, id) order."""
+    position = json.dumps({"created_at": video.created_at.isoformat(), "id": video.id})
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(position['created_at']), int(position['id'])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+
+def apply_listing_filters(query, args):
+    """Filter a Video query by ?status= (comma-separated) and ?created_after=/?created_before=."""
+    statuses = [status for status in args.get('status', '').split(',') if status]
+    if statuses:
+        query = query.filter(Video.status.in_(statuses))
+    if args.get('created_after'):
+        query = query.filter(Video.created_at >= parse_datetime(args['created_after']))
+    if args.get('created_before'):
+        query = query.filter(Video.created_at < parse_datetime(args['created_before']))
+    return query
+
 @app.route('/api/videos', methods=['GET'])
 def get_all_videos():
+    """
+    One page of videos, newest first. Query parameters:
+        status          comma-separated statuses to include
+        created_after   ISO timestamp, inclusive
+        created_before  ISO timestamp, exclusive
+        fields          comma-separated subset of LISTING_FIELDS (default: all)
+        limit           page size (default LISTING_PAGE_SIZE)
+        cursor          next_cursor returned with the previous page
+    """
     try:
-        # Query all videos from the database
-        videos = Video.query.all()
-
-        # Convert the query results into a list of dictionaries
+        fields = [field for field in request.args.get('fields', '').split(',') if field] or list(LISTING_FIELDS)
+        unknown = [field for field in fields if field not in LISTING_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+        limit = int(request.args.get('limit', LISTING_PAGE_SIZE))
+        if not 1 <= limit <= LISTING_MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {LISTING_MAX_PAGE_SIZE}")
+
+        query = apply_listing_filters(Video.query, request.args)
+        if request.args.get('cursor'):
+            created_at, video_id = decode_cursor(request.args['cursor'])
+            query = query.filter(or_(
+                Video.created_at < created_at,
+                and_(Video.created_at == created_at, Video.id < video_id)
+            ))
+
+        # Only load the columns the selected fields need (plus the cursor's)
+        columns = {'id', 'created_at'}.union(*(LISTING_FIELDS[field][0] for field in fields))
+        videos = (
+            query.options(load_only(*(getattr(Video, column) for column in columns)))
+            .order_by(Video.created_at.desc(), Video.id.desc())
+            .limit(limit + 1)  # One extra row tells us whether there is a next page
+            .all()
+        )
+
+        next_cursor = encode_cursor(videos[limit - 1]) if len(videos) > limit else None
         video_list = [
-            {
-                "id": video.id,
-                "filename": video.filename,
-                "stored_filename": video.stored_filename,
-                "status": video.status,
-                "uploader_ip": video.uploader_ip,
-                "size": video.size,
-                "resolution": f'{video.resolution.value[0]}x{video.resolution.value[1]}',  # Convert Enum to string
-                "video_bitrate": video.video_bitrate.value,  # Convert Enum to string
-                "audio_bitrate": video.audio_bitrate.value,  # Convert Enum to string
-                "crf_value": video.crf_value.value,  # Convert Enum to string
-                "preset": video.preset.value,  # Convert Enum to string
-                "video_codec": video.video_codec,  # Convert Enum to string
-                "audio_codec": video.audio_codec,  # Convert Enum to string
-                "created_at": video.created_at.isoformat(),  # Convert to ISO format for consistency
-                "updated_at": video.updated_at.isoformat() if video.updated_at else None
-            }
-            for video in videos
+            {field: LISTING_FIELDS[field][1](video) for field in fields}
+            for video in videos[:limit]
         ]
 
-        # Return the video metadata as a JSON response
-        return jsonify(video_list), 200
+        return jsonify({"videos": video_list, "next_cursor": next_cursor}), 200
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     except Exception as e:
         # In case of any error, return a 500 error with the error message
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/videos/summary', methods=['GET'])
+def get_videos_summary():
+    """Video counts and total bytes per status; accepts the listing's status/date filters."""
+    try:
+        query = db.session.query(Video.status, func.count(Video.id), func.coalesce(func.sum(Video.size), 0))
+        rows = apply_listing_filters(query, request.args).group_by(Video.status).all()
+
+        by_status = {status: {"count": count, "size": size} for status, count, size in rows}
+        return jsonify({
+            "total": sum(row["count"] for row in by_status.values()),
+            "total_size": sum(row["size"] for row in by_status.values()),
+            "by_status": by_status,
+        }), 200
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/nodes', methods=['GET'])
+def get_nodes():
+    """
+    Aggregate worker heartbeats. Nodes whose registry entry has expired are
+    dropped; nodes that missed their last heartbeat are reported as Stale.
+    """
+    try:
+        now = time.time()
+        nodes = []
+        for node_id in redis_conn.smembers(NODES_KEY):
+            node = redis_conn.hgetall(f'node:{node_id.decode()}')
+            if not node:
+                redis_conn.srem(NODES_KEY, node_id)
+                continue
+            node = {key.decode(): value.decode() for key, value in node.items()}
+
+            cores = int(node.get('cores') or 1)
+            load_1m = float(node.get('load_1m') or 0)
+            last_seen = float(node.get('last_seen') or 0)
+            nodes.append({
+                "id": node.get('id'),
+                "type": node.get('type'),
+                "host": node.get('host'),
+                "status": "Online" if now - last_seen <= NODE_STALE_AFTER_S else "Stale",
+                "cores": cores,
+                "load_1m": load_1m,
+                "utilization": min(100, round(100 * load_1m / cores)),
+                "current_job": node.get('current_job') or None,
+                "chunksProcessing": 1 if node.get('current_job') else 0,
+                "encode_fps": float(node['encode_fps']) if node.get('encode_fps') else None,
+                "last_seen": last_seen,
+            })
+
+        nodes.sort(key=lambda n: (n['type'] or '', n['id'] or ''))
+        summary = {
+            "total": len(nodes),
+            "online": sum(1 for n in nodes if n['status'] == 'Online'),
+            "busy": sum(n['chunksProcessing'] for n in nodes),
+            "cores": sum(n['cores'] for n in nodes),
+            "by_type": {
+                node_type: sum(1 for n in nodes if n['type'] == node_type)
+                for node_type in sorted({n['type'] for n in nodes if n['type']})
+            },
+        }
+
+        return jsonify({"nodes": nodes, "summary": summary}), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/storage', methods=['GET'])
+def get_storage_usage():
+    """
+    Bytes each pipeline stage holds on the storage volume, free space and
+    whether chunking is paused for lack of it, as last measured by a worker.
+    """
+    try:
+        usage = redis_conn.hgetall(DISK_USAGE_KEY)
+        if not usage:
+            return jsonify({"error": "No usage measured yet"}), 404
+        usage = {key.decode(): value.decode() for key, value in usage.items()}
+
+        total = int(usage.get('total') or 0)
+        free = int(usage.get('free') or 0)
+        return jsonify({
+            "stages": {stage: int(usage.get(stage) or 0) for stage in DISK_USAGE_STAGES},
+            "free": free,
+            "total": total,
+            "free_pct": round(100 * free / total, 1) if total else None,
+            "pending_reclaims": int(usage.get('pending') or 0),
+            "chunking_paused": usage.get('chunking_paused') == '1',
+            "updated_at": float(usage.get('updated_at') or 0),
+        }), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def sse_message(data):
+    return f"data: {json.dumps(data)}\n\n"
+
+def progress_stream(channel, video_id=None):
+    """
+    Relay progress events from redis pub/sub as Server-Sent Events. Workers
+    publish each event as a snapshot of the video it concerns, so messages
+    are forwarded as they are. A per-video stream starts with the current
+    snapshot and ends at a final stage.
+    """
+    pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(channel)
+    try:
+        if video_id:
+            snapshot = progress_snapshot(redis_conn, video_id)
+            yield sse_message(snapshot)
+            if snapshot['stage'] in FINAL_STAGES:
+                return
+
+        while True:
+            message = pubsub.get_message(timeout=SSE_KEEPALIVE_S)
+            if message is None:
+                yield ": keepalive\n\n"
+                continue
+
+            data = message['data'].decode()
+            yield f"data: {data}\n\n"
+            if video_id and json.loads(data)['stage'] in FINAL_STAGES:
+                return
+    finally:
+        pubsub.close()
+
+def sse_response(stream):
+    return Response(stream_with_context(stream), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # Disable proxy buffering so events arrive as they happen
+    })
+
+@app.route('/api/progress/stream', methods=['GET'])
+def stream_all_progress():
+    """SSE stream of progress snapshots for every video that changes."""
+    return sse_response(progress_stream(PROGRESS_CHANNEL))
+
+@app.route('/api/videos/<video_id>/progress/stream', methods=['GET'])
+def stream_video_progress(video_id):
+    """SSE stream of one video's progress until it is done or errored."""
+    if progress_snapshot(redis_conn, video_id) is None:
+        return jsonify({"error": "Unknown video"}), 404
+    return sse_response(progress_stream(f'{PROGRESS_CHANNEL}:{video_id}', video_id))
+
+@app.route('/api/videos/<video_id>/progress', methods=['GET'])
+def get_video_progress(video_id):
+    try:
+        snapshot = progress_snapshot(redis_conn, video_id)
+        if snapshot is None:
+            return jsonify({"error": "Unknown video"}), 404
+        return jsonify(snapshot), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/videos/<video_id>/timeline', methods=['GET'])
+def get_video_timeline(video_id):
+    """
+    Per-stage events recorded by the workers for one video (queue waits,
+    hashing, split, encode, segment publishing, finalize), oldest first,
+    with per-stage totals.
+    """
+    try:
+        events = [json.loads(event) for event in redis_conn.lrange(f'video:{video_id}:timeline', 0, -1)]
+        if not events:
+            return jsonify({"error": "No timeline recorded for this video"}), 404
+        events.sort(key=lambda event: event['start'])
+
+        totals = {}
+        for event in events:
+            stage = totals.setdefault(event['stage'], {"count": 0, "seconds": 0.0, "bytes_in": 0, "bytes_out": 0})
+            stage['count'] += 1
+            stage['seconds'] += event['seconds']
+            stage['bytes_in'] += event.get('bytes_in', 0)
+            stage['bytes_out'] += event.get('bytes_out', 0)
+
+        started = events[0]['start']
+        finished = max(event['start'] + event['seconds'] for event in events)
+        return jsonify({
+            "video_id": video_id,
+            "wall_seconds": finished - started,
+            "stages": totals,
+            "events": events,
+        }), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -53,6 +53,12 @@ class CRFValue(enum.Enum):
     VERY_LOW = 40  # Extremely low quality, very small file size
 
 class Video(db.Model):
+    # Listing pages are ordered by (created_at, id) and usually filtered by
+    # status; the composite index also serves status-only lookups
+    __table_args__ = (
+        db.Index('ix_video_status_created_at', 'status', 'created_at', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
     stored_filename = db.Column(db.String(255), nullable=False)
@@ -74,7 +80,7 @@ class Video(db.Model):
     video_codec = db.Column(db.String(50), nullable=True)  # Codec (e.g., 'libx264')
     audio_codec = db.Column(db.String(50), nullable=True)  # Audio codec (e.g., 'aac')
 
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def to_dict(self):
@@ -76,7 +76,7 @@ interface ProcessingParams {
 export default function UploadVideo() {
   const [file, setFile] = useState<File | null>(null);
   const [params, setParams] = useState<ProcessingParams>({
-    chunkSize: 4,
+    chunkSize: 0, // 0 = sized by the chunker
     maxNodes: 5,
     resolution: "FHD_1080",
     audioCodec: "MP3",
@@ -133,7 +133,13 @@ export default function UploadVideo() {
 
     const formData = new FormData();
     formData.append("video", file);
-    formData.append("params", JSON.stringify(params));
+    // 0 means "auto" in the form; the backend only accepts positive overrides
+    const { chunkSize, maxNodes, ...rest } = params;
+    formData.append("params", JSON.stringify({
+      ...rest,
+      ...(chunkSize > 0 ? { chunkSize } : {}),
+      ...(maxNodes > 0 ? { maxNodes } : {}),
+    }));
 
     try {
       const response = await axios.post("http://localhost:5000/api/upload", formData);
@@ -236,9 +242,10 @@ export default function UploadVideo() {
                 <input
                   type="number"
                   className="border p-2 focus:outline-none focus:ring-2 focus:ring-purple-400"
-                  value={params.chunkSize}
+                  placeholder="Auto"
+                  value={params.chunkSize || ""}
                   onChange={(e) =>
-                    handleParamChange("chunkSize", parseInt(e.target.value))
+                    handleParamChange("chunkSize", parseInt(e.target.value) || 0)
                   }
                 />
               </div>
@@ -251,9 +258,10 @@ export default function UploadVideo() {
                 <input
                   type="number"
                   className="border p-2 focus:outline-none focus:ring-2 focus:ring-purple-400"
-                  value={params.maxNodes}
+                  placeholder="No limit"
+                  value={params.maxNodes || ""}
                   onChange={(e) =>
-                    handleParamChange("maxNodes", parseInt(e.target.value))
+                    handleParamChange("maxNodes", parseInt(e.target.value) || 0)
                   }
                 />
               </div>
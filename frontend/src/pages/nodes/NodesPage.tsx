@@ -1,40 +1,22 @@
-import React from "react";
+import React, { useEffect, useState } from "react";
+import axios from "axios";
 
-// Simulated dummy data (replace with API later)
-const nodes = [
-  {
-    id: "Node-01",
-    status: "Online",
-    chunksProcessing: 5,
-    type: "Chunker",
-    utilization: 70,
-  },
-  {
-    id: "Node-02",
-    status: "Online",
-    chunksProcessing: 2,
-    type: "Processor",
-    utilization: 60,
-  },
-  {
-    id: "Node-03",
-    status: "Offline",
-    chunksProcessing: 0,
-    type: "Assembler",
-    utilization: 0,
-  },
-  {
-    id: "Node-04",
-    status: "Online",
-    chunksProcessing: 7,
-    type: "Chunker",
-    utilization: 90,
-  },
-];
+// Worker node as reported by GET /api/nodes
+interface Node {
+  id: string;
+  type: string;
+  host: string;
+  status: string;
+  cores: number;
+  load_1m: number;
+  utilization: number;
+  current_job: string | null;
+  chunksProcessing: number;
+  encode_fps: number | null;
+  last_seen: number;
+}
 
-const totalNodes = nodes.length;
-const onlineNodes = nodes.filter((n) => n.status === "Online").length;
-const totalChunks = nodes.reduce((sum, node) => sum + node.chunksProcessing, 0);
+const NODES_REFRESH_MS = 10000;
 
 const getNodeUtilizationColor = (utilization: number) => {
   if (utilization < 50) return "bg-green-200";
@@ -43,6 +25,30 @@ const getNodeUtilizationColor = (utilization: number) => {
 };
 
 export default function NodesPage() {
+  const [nodes, setNodes] = useState<Node[]>([]);
+
+  // Poll the node registry; heartbeats arrive every few seconds
+  useEffect(() => {
+    const fetchNodes = async () => {
+      try {
+        const response = await axios.get<{ nodes: Node[] }>(
+          "http://localhost:5000/api/nodes"
+        );
+        setNodes(response.data.nodes);
+      } catch (err) {
+        setNodes([]);
+      }
+    };
+
+    fetchNodes();
+    const timer = setInterval(fetchNodes, NODES_REFRESH_MS);
+    return () => clearInterval(timer);
+  }, []);
+
+  const totalNodes = nodes.length;
+  const onlineNodes = nodes.filter((n) => n.status === "Online").length;
+  const totalChunks = nodes.reduce((sum, node) => sum + node.chunksProcessing, 0);
+
   return (
     <div className="p-4 space-y-4">
       <div>
@@ -95,6 +101,16 @@ export default function NodesPage() {
                 <strong>Chunks Processing:</strong>{" "}
                 <span className="font-semibold">{node.chunksProcessing}</span>
               </div>
+
+              {/* Capacity */}
+              <div className="text-sm text-gray-500">
+                <strong>Cores:</strong> {node.cores}
+                {node.encode_fps !== null && (
+                  <>
+                    {" "}· <strong>Encode:</strong> {node.encode_fps} fps
+                  </>
+                )}
+              </div>
             </div>
 
             {/* Utilization Chart */}
@@ -4,48 +4,86 @@ import axios from "axios";
 // Define interfaces for the video data structure
 interface Video {
   id: number;
+  video_id: string;
   filename: string;
   stored_filename: string;
   status: string;
   uploader_ip: string | null;
   size: number;
-  resolution: string;
-  video_bitrate: string;
-  audio_bitrate: string;
-  crf_value: string;
-  preset: string;
-  video_codec: string;
-  audio_codec: string;
+  resolution: string | null;
+  video_bitrate: string | null;
+  audio_bitrate: string | null;
+  crf_value: string | null;
+  preset: string | null;
+  video_codec: string | null;
+  audio_codec: string | null;
   created_at: string;
   updated_at: string | null;
   totalChunks: number; // New field for total chunks
   processedChunks: number; // New field for processed chunks
 }
 
+interface VideoPage {
+  videos: Video[];
+  next_cursor: string | null;
+}
+
+// Pushed by the backend over Server-Sent Events
+interface Progress {
+  video_id: string;
+  stage: string;
+  chunks_done: number;
+  chunks_total: number;
+  chunks_in_flight: Record<string, number>;
+  percent: number;
+  eta_s: number | null;
+}
+
+const formatEta = (seconds: number) =>
+  seconds < 60
+    ? `${Math.round(seconds)}s`
+    : `${Math.floor(seconds / 60)}m ${Math.round(seconds % 60)}s`;
+
 export default function Videos() {
   // State to hold the videos data, loading, and error
   const [videos, setVideos] = useState<Video[]>([]);
   const [loading, setLoading] = useState<boolean>(true);
   const [error, setError] = useState<string | null>(null);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [progress, setProgress] = useState<Record<string, Progress>>({});
 
-  // Fetch all videos from the API
-  useEffect(() => {
-    const fetchVideos = async () => {
-      try {
-        const response = await axios.get<Video[]>(
-          "http://localhost:5000/api/videos"
-        );
-        setVideos(response.data);
-        setLoading(false);
-      } catch (err) {
-        setError("Error fetching videos");
-        setLoading(false);
-      }
-    };
+  // Fetch one page of videos; with a cursor the page is appended
+  const fetchVideos = async (cursor: string | null = null) => {
+    try {
+      const response = await axios.get<VideoPage>(
+        "http://localhost:5000/api/videos",
+        { params: cursor ? { cursor } : {} }
+      );
+      setVideos((current) =>
+        cursor ? [...current, ...response.data.videos] : response.data.videos
+      );
+      setNextCursor(response.data.next_cursor);
+      setLoading(false);
+    } catch (err) {
+      setError("Error fetching videos");
+      setLoading(false);
+    }
+  };
 
+  useEffect(() => {
     fetchVideos();
   }, []);
 
+  // Apply progress deltas as the workers report them instead of re-fetching the list
+  useEffect(() => {
+    const source = new EventSource("http://localhost:5000/api/progress/stream");
+    source.onmessage = (event) => {
+      const update: Progress = JSON.parse(event.data);
+      setProgress((current) => ({ ...current, [update.video_id]: update }));
+    };
+    return () => source.close();
+  }, []);
+
   if (loading) return <div>Loading videos...</div>;
   if (error) return <div>{error}</div>;
 
@@ -58,10 +96,20 @@ export default function Videos() {
       {/* List of Cards */}
       <div className="grid grid-cols-1 divide-y space-y-4">
         {videos.map((video) => {
-          const completionPercentage =
-            video.totalChunks === 0
-              ? 0
-              : (video.processedChunks / video.totalChunks) * 100;
+          const live = progress[video.video_id];
+          if (live) {
+            video = {
+              ...video,
+              status: live.stage === "done" ? "processed" : live.stage === "error" ? "error" : "processing",
+              totalChunks: live.chunks_total,
+              processedChunks: live.chunks_done,
+            };
+          }
+          const completionPercentage = live
+            ? live.percent
+            : video.totalChunks === 0
+            ? 0
+            : (video.processedChunks / video.totalChunks) * 100;
 
           return (
             <div
@@ -125,6 +173,8 @@ export default function Videos() {
                   <div className="mt-2">
                     <p className="text-sm text-gray-500">
                       Processing Completion: {completionPercentage.toFixed(2)}%
+                      {live && ` (${live.stage})`}
+                      {live?.eta_s != null && ` · ETA ${formatEta(live.eta_s)}`}
                     </p>
                     <div className="w-full bg-gray-200 rounded-full h-2">
                       <div
@@ -153,6 +203,14 @@ export default function Videos() {
           );
         })}
         {!videos.length && <div>No videos in the database</div>}
+        {nextCursor && (
+          <button
+            className="px-4 py-2 bg-white border rounded-md text-sm"
+            onClick={() => fetchVideos(nextCursor)}
+          >
+            Load more
+          </button>
+        )}
       </div>
     </div>
   );
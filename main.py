@@ -1,11 +1,16 @@
 import os
+import time
+import shutil
+import argparse
+import tempfile
 import subprocess
 import enum
-from ffmpeg import input as ffmpeg_input
+from concurrent.futures import ProcessPoolExecutor
+from ffmpeg import Error as FFmpegError, input as ffmpeg_input, probe as ffmpeg_probe
 
 # Configuration
-CHUNKS_DIR = "video_chunks"
-PROCESSED_DIR = "processed_chunks"
+CHUNKS_DIR = "video_chunks"          # Sub-directory of the run's scratch dir
+PROCESSED_DIR = "processed_chunks"   # Sub-directory of the run's scratch dir
 TARGET_CHUNK_SIZE = 4 * 1024 * 1024  # 4MB in bytes
 
 class ResolutionPreset(enum.Enum):
@@ -38,11 +43,35 @@ def ensure_dir(directory):
     """Create directory if it doesn't exist"""
     os.makedirs(directory, exist_ok=True)
 
-def split_video(input_path, chunk_size):
-    """Split video into fixed-size chunks using FFmpeg"""
-    ensure_dir(CHUNKS_DIR)
+def ffmpeg_failure(message, stderr):
+    """RuntimeError carrying the tail of ffmpeg's stderr"""
+    if isinstance(stderr, bytes):
+        stderr = stderr.decode('utf-8', errors='replace')
+    tail = '\n'.join((stderr or '').strip().splitlines()[-20:])
+    return RuntimeError(f"{message}:\n{tail}" if tail else message)
+
+def segment_seconds(input_path, chunk_size):
+    """
+    Segment length giving roughly `chunk_size` bytes per chunk, assuming a
+    constant bitrate across the file. The segment muxer cuts at the first
+    keyframe after each boundary, so every chunk still starts on a keyframe.
+    """
+    try:
+        duration = float(ffmpeg_probe(input_path)['format']['duration'])
+    except FFmpegError as e:
+        raise ffmpeg_failure(f"ffprobe failed on {input_path}", e.stderr) from e
+    file_size = os.path.getsize(input_path)
+    if file_size <= chunk_size:
+        return duration
+    return max(duration * chunk_size / file_size, 1.0)
+
+def split_video(input_path, chunk_size, chunks_dir):
+    """Split video into ~chunk_size chunks at keyframes using FFmpeg"""
+    ensure_dir(chunks_dir)
     base_name = os.path.splitext(os.path.basename(input_path))[0]
     
+    # `-fs` only caps the size of the first output, so it yields a single
+    # chunk; cut by time instead so --parallel has one job per segment.
     cmd = [
         'ffmpeg',
         '-i', input_path,
@@ -50,25 +79,28 @@ def split_video(input_path, chunk_size):
         '-map', '0',
         '-f', 'segment',
         '-segment_format', 'mp4',
-        '-segment_list', os.path.join(CHUNKS_DIR, 'chunks_list.txt'),
+        '-segment_list', os.path.join(chunks_dir, 'chunks_list.txt'),
         '-segment_list_type', 'flat',
-        '-fs', str(chunk_size),
-        os.path.join(CHUNKS_DIR, f'{base_name}_chunk_%03d.mp4')
+        '-segment_time', f'{segment_seconds(input_path, chunk_size):.3f}',
+        '-reset_timestamps', '1',
+        os.path.join(chunks_dir, f'{base_name}_chunk_%03d.mp4')
     ]
     
-    subprocess.run(cmd, check=True)
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        raise ffmpeg_failure(f"Splitting {input_path} failed", result.stderr)
     
     return sorted([
-        os.path.join(CHUNKS_DIR, f)
-        for f in os.listdir(CHUNKS_DIR)
+        os.path.join(chunks_dir, f)
+        for f in os.listdir(chunks_dir)
         if f.startswith(base_name) and f.endswith('.mp4')
     ])
 
-def process_chunk(input_path, output_path, resolution, video_bitrate, audio_bitrate):
-    """Process chunk with selected presets"""
-    ensure_dir(PROCESSED_DIR)
+def process_chunk(input_path, output_path, resolution, video_bitrate, audio_bitrate, threads=0):
+    """Process chunk with selected presets (threads=0 lets ffmpeg decide)"""
+    ensure_dir(os.path.dirname(output_path))
     
-    (
+    stream = (
         ffmpeg_input(input_path)
         .filter('scale', resolution.value[0], resolution.value[1])
         .output(
@@ -78,16 +110,49 @@ def process_chunk(input_path, output_path, resolution, video_bitrate, audio_bitr
                 'b:v': video_bitrate.value,
                 'preset': 'fast',
                 'acodec': 'aac',
-                'b:a': audio_bitrate.value
+                'b:a': audio_bitrate.value,
+                'threads': threads
             }
         )
         .overwrite_output()
-        .run()
     )
+    try:
+        stream.run(capture_stdout=True, capture_stderr=True)
+    except FFmpegError as e:
+        raise ffmpeg_failure(f"Encoding {input_path} failed", e.stderr) from e
+    return output_path
+
+def process_chunks(chunks, processed_dir, resolution, video_bitrate, audio_bitrate, workers):
+    """
+    Encode chunks with a pool of `workers` processes. The host's cores are
+    split evenly between workers so concurrent encoders don't oversubscribe.
+    Returns processed chunk paths in input order.
+    """
+    output_paths = [
+        os.path.join(processed_dir, f"processed_{i:03d}.mp4")
+        for i in range(len(chunks))
+    ]
+
+    if workers <= 1:
+        for chunk, output_path in zip(chunks, output_paths):
+            process_chunk(chunk, output_path, resolution, video_bitrate, audio_bitrate)
+        return output_paths
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(process_chunk, chunk, output_path, resolution, video_bitrate, audio_bitrate, threads)
+            for chunk, output_path in zip(chunks, output_paths)
+        ]
+        # Surface the first encode failure, if any
+        for future in futures:
+            future.result()
 
-def reassemble_video(chunk_paths, output_path):
+    return output_paths
+
+def reassemble_video(chunk_paths, output_path, processed_dir):
     """Concatenate processed chunks"""
-    concat_list = os.path.join(PROCESSED_DIR, 'concat_list.txt')
+    concat_list = os.path.join(processed_dir, 'concat_list.txt')
     
     with open(concat_list, 'w') as f:
         for path in chunk_paths:
@@ -101,38 +166,55 @@ def reassemble_video(chunk_paths, output_path):
     )
     os.remove(concat_list)
 
-def clean_directories():
-    """Clear chunk directories"""
-    for folder in [CHUNKS_DIR, PROCESSED_DIR]:
-        for file in os.listdir(folder):
-            file_path = os.path.join(folder, file)
-            try:
-                os.unlink(file_path)
-            except Exception as e:
-                print(f"Error deleting {file_path}: {e}")
+def parse_args():
+    parser = argparse.ArgumentParser(description="Split, compress and reassemble a video locally.")
+    parser.add_argument('--input', default="test_video.mp4", help="Input video path")
+    parser.add_argument('--output', default="compressed_output.mp4", help="Output video path")
+    parser.add_argument('--resolution', default='SD_480', choices=[p.name for p in ResolutionPreset])
+    parser.add_argument('--video-bitrate', default='MOBILE', choices=[p.name for p in BitratePreset])
+    parser.add_argument('--audio-bitrate', default='LOW', choices=[p.name for p in AudioBitratePreset])
+    parser.add_argument('--chunk-size-mb', type=int, default=TARGET_CHUNK_SIZE // (1024 * 1024))
+    parser.add_argument('--parallel', action='store_true', help="Encode chunks concurrently with a process pool")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Pool size in --parallel mode (default: available cores)")
+    parser.add_argument('--keep-scratch', action='store_true', help="Keep the run's scratch directory")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    # Input/Output configuration
-    input_video = "test_video.mp4"
-    output_video = "compressed_output.mp4"
-    
-    # Quality presets (change these to use different presets)
-    resolution = ResolutionPreset.SD_480
-    video_bitrate = BitratePreset.MOBILE
-    audio_bitrate = AudioBitratePreset.LOW
-    
-    # Clean previous runs
-    clean_directories()
-    
-    # Split into ~4MB chunks
-    chunks = split_video(input_video, TARGET_CHUNK_SIZE)
-    
-    # Process chunks
-    processed_chunks = []
-    for i, chunk in enumerate(chunks):
-        output_path = os.path.join(PROCESSED_DIR, f"processed_{i:03d}.mp4")
-        process_chunk(chunk, output_path, resolution, video_bitrate, audio_bitrate)
-        processed_chunks.append(output_path)
-    
-    # Reassemble final video
-    reassemble_video(processed_chunks, output_video)
+    args = parse_args()
+
+    # Quality presets
+    resolution = ResolutionPreset[args.resolution]
+    video_bitrate = BitratePreset[args.video_bitrate]
+    audio_bitrate = AudioBitratePreset[args.audio_bitrate]
+    workers = max(1, args.workers) if args.parallel else 1
+
+    # Every run gets its own scratch directory so runs can coexist
+    scratch_dir = tempfile.mkdtemp(prefix='clipcrunch_')
+    chunks_dir = os.path.join(scratch_dir, CHUNKS_DIR)
+    processed_dir = os.path.join(scratch_dir, PROCESSED_DIR)
+    timings = {}
+
+    try:
+        # Split into ~chunk-size chunks
+        start = time.perf_counter()
+        chunks = split_video(args.input, args.chunk_size_mb * 1024 * 1024, chunks_dir)
+        timings['split'] = time.perf_counter() - start
+
+        # Process chunks
+        start = time.perf_counter()
+        processed_chunks = process_chunks(chunks, processed_dir, resolution, video_bitrate, audio_bitrate, workers)
+        timings['encode'] = time.perf_counter() - start
+
+        # Reassemble final video
+        start = time.perf_counter()
+        reassemble_video(processed_chunks, args.output, processed_dir)
+        timings['assemble'] = time.perf_counter() - start
+    finally:
+        if not args.keep_scratch:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    print(f"Encoded {len(chunks)} chunks with {workers} worker(s)")
+    for stage, seconds in timings.items():
+        print(f"  {stage:<9} {seconds:8.2f}s")
+    print(f"  {'total':<9} {sum(timings.values()):8.2f}s")
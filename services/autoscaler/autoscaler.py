@@ -0,0 +1,139 @@
+import os
+import sys
+import json
+import math
+import time
+import redis
+from rq import Queue
+
+# ===================
+# Configuration
+# ===================
+
+REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+
+CHUNKING_QUEUE = 'chunking_jobs'
+PROCESSING_QUEUE = 'processing_jobs'
+ASSEMBLY_QUEUE = 'assembly_jobs'
+
+# Keys written by the other services
+SCHEDULER_PAYLOADS_KEY = 'sched:payloads'         # chunks waiting in the scheduler
+LEASES_KEY = 'chunk_leases'                       # chunks being encoded right now
+ENCODE_TIMES_KEY = 'stats:chunk_encode_seconds'   # recent per-chunk encode times
+
+DECISION_KEY = 'autoscaler:decision'
+
+SAMPLE_INTERVAL_S = int(os.getenv('AUTOSCALER_INTERVAL_S', 15))
+
+# Processors are sized so the current backlog drains within this many seconds
+TARGET_DRAIN_S = int(os.getenv('AUTOSCALER_TARGET_DRAIN_S', 120))
+
+# Encode time assumed per chunk until processors have reported some
+DEFAULT_ENCODE_SECONDS = 10.0
+
+# Assembly jobs (incremental appends are cheap) one replica keeps up with
+ASSEMBLY_JOBS_PER_REPLICA = 20
+
+# Replicas are only removed after demand has stayed lower for this long
+SCALE_DOWN_COOLDOWN_S = int(os.getenv('AUTOSCALER_SCALE_DOWN_COOLDOWN_S', 300))
+
+REPLICA_BOUNDS = {
+    'chunker': (int(os.getenv('CHUNKER_MIN_REPLICAS', 1)), int(os.getenv('CHUNKER_MAX_REPLICAS', 4))),
+    'processor': (int(os.getenv('PROCESSOR_MIN_REPLICAS', 1)), int(os.getenv('PROCESSOR_MAX_REPLICAS', 20))),
+    'assembler': (int(os.getenv('ASSEMBLER_MIN_REPLICAS', 1)), int(os.getenv('ASSEMBLER_MAX_REPLICAS', 4))),
+}
+
+redis_conn = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
+
+# ===================
+# Sampling
+# ===================
+
+def sample_pipeline(conn):
+    """Read the current load of every stage from redis."""
+    encode_times = [float(t) for t in conn.lrange(ENCODE_TIMES_KEY, 0, -1)]
+    return {
+        'chunking_queued': Queue(CHUNKING_QUEUE, connection=conn).count,
+        'processing_queued': Queue(PROCESSING_QUEUE, connection=conn).count + conn.hlen(SCHEDULER_PAYLOADS_KEY),
+        'processing_leased': conn.zcard(LEASES_KEY),
+        'assembly_queued': Queue(ASSEMBLY_QUEUE, connection=conn).count,
+        'avg_encode_seconds': sum(encode_times) / len(encode_times) if encode_times else DEFAULT_ENCODE_SECONDS,
+    }
+
+# ===================
+# Decision
+# ===================
+
+def clamp(value, bounds):
+    low, high = bounds
+    return max(low, min(high, value))
+
+def compute_targets(sample, bounds=REPLICA_BOUNDS):
+    """
+    Desired replica count per service for one sample, before cooldown:
+    - processor: enough encoders to finish queued + in-flight chunks within
+      TARGET_DRAIN_S at the observed per-chunk encode time
+    - chunker: one replica per queued upload (a split is one long job)
+    - assembler: one replica per ASSEMBLY_JOBS_PER_REPLICA queued jobs
+    """
+    chunk_work_s = (sample['processing_queued'] + sample['processing_leased']) * sample['avg_encode_seconds']
+    return {
+        'chunker': clamp(sample['chunking_queued'], bounds['chunker']),
+        'processor': clamp(math.ceil(chunk_work_s / TARGET_DRAIN_S), bounds['processor']),
+        'assembler': clamp(math.ceil(sample['assembly_queued'] / ASSEMBLY_JOBS_PER_REPLICA), bounds['assembler']),
+    }
+
+def apply_cooldown(targets, previous, last_raised, now):
+    """
+    Scale up immediately, but hold the previous count until demand has been
+    lower for SCALE_DOWN_COOLDOWN_S, so short lulls don't cause churn.
+    last_raised maps service -> time demand was last at or above the previous
+    count, and is updated in place.
+    """
+    decided = {}
+    for service, target in targets.items():
+        current = previous.get(service)
+        if current is None or target >= current:
+            last_raised[service] = now
+            decided[service] = target
+        elif now - last_raised.get(service, now) >= SCALE_DOWN_COOLDOWN_S:
+            decided[service] = target
+        else:
+            decided[service] = current
+    return decided
+
+def publish_decision(conn, sample, decided):
+    """Expose the decision in redis for operators and deploy tooling."""
+    conn.hset(DECISION_KEY, mapping={
+        'timestamp': time.time(),
+        'sample': json.dumps(sample),
+        **{f'{service}_replicas': count for service, count in decided.items()}
+    })
+
+# ===================
+# Controller Loop
+# ===================
+
+def run(once=False):
+    previous, last_raised = {}, {}
+    print(f"[Autoscaler] 📈 Started, sampling every {SAMPLE_INTERVAL_S}s")
+    while True:
+        try:
+            now = time.time()
+            sample = sample_pipeline(redis_conn)
+            decided = apply_cooldown(compute_targets(sample), previous, last_raised, now)
+            publish_decision(redis_conn, sample, decided)
+
+            if decided != previous:
+                print(f"[Autoscaler] ⚖️ Target replicas: {decided} (sample: {sample})")
+            previous = decided
+        except Exception as e:
+            print(f"[Autoscaler] ❌ Error sampling pipeline: {str(e)}")
+
+        if once:
+            return previous
+        time.sleep(SAMPLE_INTERVAL_S)
+
+if __name__ == "__main__":
+    run(once='--once' in sys.argv)
@@ -0,0 +1,296 @@
+"""
+Throughput benchmark for the chunk -> encode -> assemble pipeline.
+
+Synthetic inputs are generated with ffmpeg's lavfi sources, then every
+combination of the swept parameters is run through the real chunker,
+processor and assembler tasks against a local redis. Each run goes in a
+fresh process with its own scratch storage root, so peak RSS and caches do
+not leak between runs. One JSON object per run is appended to --output.
+
+    python benchmark.py --resolutions HD_720 FHD_1080 --durations 30 \\
+        --chunk-sizes 2 4 8 --presets FAST MEDIUM --codecs H264 --workers 1 2 4
+
+Use a redis that nothing else is using: the pipeline's queues and scheduler
+keys are global.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import argparse
+import itertools
+import resource
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+
+# ===================
+# Configuration
+# ===================
+
+REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+
+SERVICES_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICE_DIRS = [os.path.join(SERVICES_DIR, name) for name in ('video_chunker', 'video_processor', 'video_assembler')]
+
+QUEUES = ('chunking_jobs', 'processing_jobs', 'assembly_jobs')
+
+# Input sizes, by Resolution name
+RESOLUTIONS = {
+    'UHD_4K': (3840, 2160),
+    'QHD_2K': (2560, 1440),
+    'FHD_1080': (1920, 1080),
+    'HD_720': (1280, 720),
+    'SD_480': (854, 480),
+    'MOBILE_360': (640, 360),
+}
+
+INPUT_FRAME_RATE = 30
+INPUT_GOP_S = 2  # Keyframe interval of the generated inputs
+
+# Fixed encode parameters; the swept ones are added per run
+BASE_JOB = {
+    'video_bitrate': 'HIGH',
+    'audio_bitrate': 'STANDARD',
+    'crf_value': 'HIGH',
+    'audio_codec': 'AAC',
+}
+
+# Every run measures the full pipeline: no remux shortcut, no warm caches,
+# and every chunk queued at once so burst workers never run dry
+RUN_ENV = {
+    'STORAGE_BACKEND': 'local',
+    'REMUX_FAST_PATH': '0',
+    'CHUNK_CACHE_MAX_MB': '0',
+    'VIDEO_CACHE_MAX_MB': '0',
+    'SCHEDULER_QUEUE_DEPTH': '100000',
+}
+
+# ===================
+# Inputs
+# ===================
+
+def generate_input(inputs_dir, resolution, duration):
+    """Synthetic test clip (moving test pattern + tone), generated once and reused."""
+    width, height = RESOLUTIONS[resolution]
+    path = os.path.join(inputs_dir, f"testsrc2_{width}x{height}_{duration}s.mp4")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(inputs_dir, exist_ok=True)
+    cmd = [
+        'ffmpeg',
+        '-v', 'error',
+        '-y',
+        '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate={INPUT_FRAME_RATE}:duration={duration}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '18',
+        '-g', str(INPUT_FRAME_RATE * INPUT_GOP_S),
+        '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-b:a', '128k',
+        '-shortest',
+        path
+    ]
+    subprocess.run(cmd, check=True)
+    return path
+
+# ===================
+# Single Run
+# ===================
+
+def run_burst_worker(queue_name):
+    """Drain one queue with an RQ worker and exit (run in a child process)."""
+    import redis
+    from rq import Worker, Queue
+    conn = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
+    Worker([Queue(queue_name, connection=conn)], connection=conn).work(burst=True)
+
+def run_workers(queue_name, count):
+    """Run count burst workers on a queue in parallel and wait for them."""
+    workers = [multiprocessing.Process(target=run_burst_worker, args=(queue_name,)) for _ in range(count)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+def stage_totals(redis_conn, video_id):
+    """Seconds per stage summed over the video's timeline (see common/metrics.py)."""
+    totals = {}
+    for event in redis_conn.lrange(f"video:{video_id}:timeline", 0, -1):
+        event = json.loads(event)
+        totals[event['stage']] = round(totals.get(event['stage'], 0.0) + event['seconds'], 3)
+    return totals
+
+def run_config(config, input_path, keep_scratch, result_path):
+    """
+    Run one configuration end to end and write its measurements to
+    result_path as JSON. Executed in a spawned process: the services read
+    their configuration from the environment at import time.
+    """
+    scratch = tempfile.mkdtemp(prefix='clipcrunch-bench-')
+    os.environ.update(RUN_ENV)
+    os.environ.update({
+        'STORAGE_ROOT': scratch,
+        'REPLICAS_PER_HOST': str(config['workers']),
+        'CHUNK_MODE': config['chunk_mode'],
+    })
+    sys.path[:0] = [SERVICES_DIR] + SERVICE_DIRS
+
+    import redis
+    import chunker
+    from common.renditions import video_renditions, final_video_filename
+
+    redis_conn = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
+    video_id = f"bench-{uuid.uuid4().hex}"
+    upload_path = os.path.join(scratch, 'temp_uploads', f"{video_id}.mp4")
+    os.makedirs(os.path.dirname(upload_path))
+    os.symlink(input_path, upload_path)
+
+    video_metadata = {
+        **BASE_JOB,
+        'resolution': config['target_resolution'],
+        'preset': config['preset'],
+        'video_codec': config['codec'],
+        'status': 'uploaded',
+    }
+    redis_conn.hset(f"video:{video_id}", mapping=video_metadata)
+
+    stages = {}
+    started = time.perf_counter()
+
+    result = chunker.chunk_video_task(video_id, '.mp4', config['chunk_size_mb'], config['chunk_mode'])
+    stages['split'] = time.perf_counter() - started
+    if result['status'] != 'success':
+        raise RuntimeError(f"Chunking failed: {result.get('error')}")
+
+    stage_started = time.perf_counter()
+    run_workers('processing_jobs', config['workers'])
+    stages['encode'] = time.perf_counter() - stage_started
+
+    stage_started = time.perf_counter()
+    run_workers('assembly_jobs', 1)
+    stages['assemble'] = time.perf_counter() - stage_started
+    stages['total'] = time.perf_counter() - started
+
+    status = (redis_conn.hget(f"video:{video_id}", 'status') or b'').decode()
+    output_bytes = sum(
+        os.path.getsize(path)
+        for path in (
+            os.path.join(scratch, 'processed_videos', final_video_filename(video_id, video_metadata, rendition))
+            for rendition in video_renditions(video_metadata)
+        )
+        if os.path.exists(path)
+    )
+
+    # ru_maxrss is in KiB on Linux; children include the RQ work horses and ffmpeg
+    peak_rss_kb = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    )
+
+    measured = {
+        'status': status,
+        'chunks': int(redis_conn.hget(f"video:{video_id}", 'chunk_total') or 0),
+        'stages_s': {stage: round(seconds, 3) for stage, seconds in stages.items()},
+        'stage_totals_s': stage_totals(redis_conn, video_id),
+        'output_bytes': output_bytes,
+        'peak_rss_mb': round(peak_rss_kb / 1024, 1),
+    }
+    with open(result_path, 'w') as f:
+        json.dump(measured, f)
+
+    if not keep_scratch:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+# ===================
+# Sweep
+# ===================
+
+def environment():
+    """Describe the machine and build so results can be compared across releases."""
+    ffmpeg_version = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout.splitlines()[0]
+    revision = subprocess.run(
+        ['git', 'describe', '--always', '--dirty'], capture_output=True, text=True, cwd=SERVICES_DIR
+    ).stdout.strip()
+    return {
+        'host': platform.node(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'ffmpeg': ffmpeg_version,
+        'revision': revision or None,
+    }
+
+def check_idle(redis_conn):
+    busy = [name for name in QUEUES if redis_conn.llen(f"rq:queue:{name}")]
+    if busy or redis_conn.hlen('sched:payloads'):
+        raise SystemExit(f"Redis is not idle (queued jobs in: {', '.join(busy) or 'scheduler'}); use a dedicated instance")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the chunk/encode/assemble pipeline')
+    parser.add_argument('--resolutions', nargs='+', default=['HD_720'], choices=list(RESOLUTIONS), help='input resolutions')
+    parser.add_argument('--durations', nargs='+', type=int, default=[30], help='input durations in seconds')
+    parser.add_argument('--target-resolution', default='HD_720', choices=list(RESOLUTIONS), help='encode resolution')
+    parser.add_argument('--chunk-mode', default='duration', choices=['size', 'duration', 'cost'])
+    parser.add_argument('--chunk-sizes', nargs='+', type=int, default=[4], help='chunk sizes in MB')
+    parser.add_argument('--presets', nargs='+', default=['FAST'], help='Preset names')
+    parser.add_argument('--codecs', nargs='+', default=['H264'], help='VideoCodec names')
+    parser.add_argument('--workers', nargs='+', type=int, default=[1], help='processor worker counts')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per configuration')
+    parser.add_argument('--inputs-dir', default='benchmark_inputs', help='where generated inputs are kept')
+    parser.add_argument('--output', default='benchmark_results.jsonl', help='JSON lines file results are appended to')
+    parser.add_argument('--keep-scratch', action='store_true', help='keep each run\'s scratch directory')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    sys.path[:0] = [SERVICES_DIR]
+
+    import redis
+    check_idle(redis.Redis(host=REDIS_HOST, port=REDIS_PORT))
+
+    env = environment()
+    context = multiprocessing.get_context('spawn')
+    sweep = itertools.product(args.resolutions, args.durations, args.chunk_sizes, args.presets, args.codecs, args.workers)
+
+    for resolution, duration, chunk_size_mb, preset, codec, workers in sweep:
+        input_path = os.path.abspath(generate_input(args.inputs_dir, resolution, duration))
+        config = {
+            'input_resolution': resolution,
+            'input_duration_s': duration,
+            'target_resolution': args.target_resolution,
+            'chunk_mode': args.chunk_mode,
+            'chunk_size_mb': chunk_size_mb,
+            'preset': preset,
+            'codec': codec,
+            'workers': workers,
+        }
+
+        for attempt in range(args.repeat):
+            result_path = os.path.join(tempfile.gettempdir(), f"clipcrunch-bench-{uuid.uuid4().hex}.json")
+            run = context.Process(target=run_config, args=(config, input_path, args.keep_scratch, result_path))
+            run.start()
+            run.join()
+
+            record = {'config': config, 'repeat': attempt, 'environment': env, 'input_bytes': os.path.getsize(input_path)}
+            if run.exitcode == 0 and os.path.exists(result_path):
+                with open(result_path) as f:
+                    measured = json.load(f)
+                os.remove(result_path)
+                record.update(measured)
+                record['realtime_factor'] = round(duration / measured['stages_s']['total'], 3)
+            else:
+                record['status'] = 'error'
+
+            with open(args.output, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+            print(f"[Benchmark] 📊 {config} -> {record.get('status')}, "
+                  f"realtime factor {record.get('realtime_factor')}, peak RSS {record.get('peak_rss_mb')}MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+from common.renditions import is_ladder, ladder_bitrate
+
+# ===================
+# Configuration
+# ===================
+
+CACHE_DIR_NAME = '.cache'
+
+HASH_BLOCK_SIZE = 1024 * 1024  # Files are hashed in 1MB blocks
+
+# Fields of the video:{uid} hash that change the encoded output
+ENCODE_PARAM_FIELDS = (
+    'resolution',
+    'video_bitrate',
+    'audio_bitrate',
+    'crf_value',
+    'preset',
+    'video_codec',
+    'audio_codec',
+)
+
+# Encode settings the chunker derives from job options (target-size mode)
+# and which win over the enums, so they change the encoded output
+ENCODE_OVERRIDE_FIELDS = (
+    'crf_override',
+    'video_bitrate_override',
+)
+
+# Job options and overrides that change the encoded output; only
+# fingerprinted when set so fingerprints of jobs without them stay unchanged
+OPTIONAL_ENCODE_PARAM_FIELDS = (
+    'target_size_mb',
+    'ladder_bitrate',  # Set by rendition_cache_key, not stored in the hash
+) + ENCODE_OVERRIDE_FIELDS
+
+# ===================
+# Helper Functions
+# ===================
+
+def file_sha256(path):
+    """Content hash of a file, read in fixed-size blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def params_fingerprint(video_metadata):
+    """Stable hash of the encode parameters in a video:{uid} hash."""
+    params = {field: video_metadata.get(field) for field in ENCODE_PARAM_FIELDS}
+    params.update({field: video_metadata[field] for field in OPTIONAL_ENCODE_PARAM_FIELDS if video_metadata.get(field)})
+    encoded = json.dumps(params, sort_keys=True).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+def cache_key(content_hash, fingerprint):
+    """Cache key for some input content encoded with some parameters."""
+    return hashlib.sha256(f'{content_hash}:{fingerprint}'.encode()).hexdigest()
+
+def rendition_cache_key(content_hash, video_metadata, rendition):
+    """
+    Cache key for one rendition of a job. A ladder rung is capped at its own
+    bitrate rather than the job's video_bitrate, so that ceiling is keyed too.
+    """
+    params = {**video_metadata, 'resolution': rendition}
+    if is_ladder(video_metadata):
+        params['ladder_bitrate'] = ladder_bitrate(video_metadata, rendition)
+    fingerprint = params_fingerprint(params)
+    return cache_key(content_hash, fingerprint)
+
+def source_cache_key(source_hash, video_metadata, rendition):
+    """
+    Whole-video cache key for one rendition. Overrides are left out: the
+    chunker looks outputs up before deriving them, and the source plus the
+    job options they come from already determine them.
+    """
+    params = {field: value for field, value in video_metadata.items() if field not in ENCODE_OVERRIDE_FIELDS}
+    return rendition_cache_key(source_hash, params, rendition)
+
+# ===================
+# Content Cache
+# ===================
+
+class ContentCache:
+    """
+    Size-bounded, content-addressed file cache whose entries are storage
+    objects under <prefix>/.cache/<name>, so every replica sees the same
+    entries whichever storage driver is in use. Recency and sizes are
+    tracked in redis so every replica evicts from the same LRU order.
+    """
+
+    def __init__(self, redis_conn, storage, prefix, name, max_bytes):
+        self.redis_conn = redis_conn
+        self.storage = storage
+        self.prefix = f'{prefix}/{CACHE_DIR_NAME}/{name}'
+        self.max_bytes = max_bytes
+        self.lru_key = f'cache:{name}:lru'
+        self.sizes_key = f'cache:{name}:sizes'
+        self.bytes_key = f'cache:{name}:bytes'
+
+    def object_key(self, key):
+        return f'{self.prefix}/{key}.mp4'
+
+    def get(self, key, dest_path):
+        """Copy a cached entry to dest_path. Returns False on a miss."""
+        object_key = self.object_key(key)
+        try:
+            cached_path = self.storage.fetch(object_key)
+            tmp_path = f'{dest_path}.tmp'
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            shutil.copyfile(cached_path, tmp_path)
+            os.replace(tmp_path, dest_path)
+        except FileNotFoundError:
+            return False
+        finally:
+            self.storage.release(object_key)
+
+        self.redis_conn.zadd(self.lru_key, {key: time.time()})
+        return True
+
+    def put(self, key, src_path):
+        """Add src_path to the cache under key, then evict down to max_bytes."""
+        if self.max_bytes <= 0:
+            return
+
+        object_key = self.object_key(key)
+        cached_path = self.storage.path(object_key)
+        os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+
+        # Write under a temporary name so readers never see a partial entry
+        tmp_path = f'{cached_path}.{os.getpid()}.tmp'
+        shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, cached_path)
+
+        size = os.path.getsize(cached_path)
+        self.storage.store(object_key)
+        self.storage.release(object_key)
+        previous = self.redis_conn.hget(self.sizes_key, key)
+        pipe = self.redis_conn.pipeline()
+        pipe.hset(self.sizes_key, key, size)
+        pipe.incrby(self.bytes_key, size - int(previous or 0))
+        pipe.zadd(self.lru_key, {key: time.time()})
+        pipe.execute()
+
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits max_bytes."""
+        while int(self.redis_conn.get(self.bytes_key) or 0) > self.max_bytes:
+            popped = self.redis_conn.zpopmin(self.lru_key)
+            if not popped:
+                break
+            key = popped[0][0].decode()
+            size = int(self.redis_conn.hget(self.sizes_key, key) or 0)
+
+            pipe = self.redis_conn.pipeline()
+            pipe.hdel(self.sizes_key, key)
+            pipe.decrby(self.bytes_key, size)
+            pipe.execute()
+
+            self.storage.delete(self.object_key(key))
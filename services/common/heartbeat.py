@@ -0,0 +1,79 @@
+import os
+import time
+import socket
+import threading
+
+# ===================
+# Configuration
+# ===================
+
+HEARTBEAT_INTERVAL_S = int(os.getenv('HEARTBEAT_INTERVAL_S', 10))
+
+# A node that misses this many heartbeats drops out of the registry
+HEARTBEAT_MISSES_ALLOWED = 3
+
+NODES_KEY = 'nodes'
+
+# Identifies this worker process. Computed at import, before RQ forks its
+# work horses, so jobs report against the worker that runs them.
+NODE_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# ===================
+# Node Registry
+# ===================
+
+def node_key(node_id=NODE_ID):
+    return f"node:{node_id}"
+
+def update_node(redis_conn, **fields):
+    """
+    Update this node's registry entry, e.g. current_job or encode_fps. Safe
+    to call from inside an RQ job.
+    """
+    pipe = redis_conn.pipeline()
+    pipe.hset(node_key(), mapping={key: '' if value is None else value for key, value in fields.items()})
+    pipe.expire(node_key(), HEARTBEAT_INTERVAL_S * HEARTBEAT_MISSES_ALLOWED)
+    pipe.execute()
+
+def live_node_count(redis_conn, node_type):
+    """
+    Number of registered nodes of node_type that are still heartbeating.
+    Each node is one worker process and runs one job at a time.
+    """
+    node_ids = list(redis_conn.smembers(NODES_KEY))
+    if not node_ids:
+        return 0
+
+    pipe = redis_conn.pipeline()
+    for node_id in node_ids:
+        pipe.hget(node_key(node_id.decode()), 'type')
+    return sum(1 for value in pipe.execute() if value is not None and value.decode() == node_type)
+
+def send_heartbeat(redis_conn, node_type):
+    """Publish host capacity and load for this node."""
+    load_1m = os.getloadavg()[0] if hasattr(os, 'getloadavg') else 0.0
+    pipe = redis_conn.pipeline()
+    pipe.hset(node_key(), mapping={
+        'id': NODE_ID,
+        'type': node_type,
+        'host': socket.gethostname(),
+        'cores': os.cpu_count() or 1,
+        'load_1m': load_1m,
+        'last_seen': time.time(),
+    })
+    pipe.hsetnx(node_key(), 'started_at', time.time())
+    pipe.expire(node_key(), HEARTBEAT_INTERVAL_S * HEARTBEAT_MISSES_ALLOWED)
+    pipe.sadd(NODES_KEY, NODE_ID)
+    pipe.execute()
+
+def start_heartbeat(redis_conn, node_type):
+    """Send heartbeats from a daemon thread for the life of the worker."""
+    def beat():
+        while True:
+            try:
+                send_heartbeat(redis_conn, node_type)
+            except Exception as e:
+                print(f"[Heartbeat] ❌ Could not send heartbeat: {str(e)}")
+            time.sleep(HEARTBEAT_INTERVAL_S)
+
+    threading.Thread(target=beat, daemon=True).start()
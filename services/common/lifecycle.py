@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import shutil
+import socket
+import threading
+from common.cache import CACHE_DIR_NAME
+from common.metrics import inc, set_gauge, STAGE_DISK_BYTES, DISK_FREE_BYTES, RECLAIMED_BYTES
+from common.progress import publish_progress
+
+# ===================
+# Configuration
+# ===================
+
+# How long consumed intermediates are kept before they are deleted; 0 deletes
+# them as soon as the downstream stage has stored its output. Raise it to
+# keep chunks around for debugging.
+GC_RETENTION_S = int(os.getenv('GC_RETENTION_S', 0))
+
+# Intermediates of a failed video are kept this long for inspection
+GC_FAILED_RETENTION_S = int(os.getenv('GC_FAILED_RETENTION_S', 24 * 60 * 60))
+
+# How often each worker deletes artifacts whose retention ran out, and how
+# often (by one worker at a time) the per-stage usage is measured
+GC_INTERVAL_S = int(os.getenv('GC_INTERVAL_S', 30))
+
+# Chunking pauses while free space on the fullest stage volume is below
+# DISK_PAUSE_FREE_PCT of that volume (or DISK_PAUSE_FREE_MB, whichever is
+# more), and resumes once it is back above DISK_RESUME_FREE_PCT. In-flight
+# encodes and assemblies keep running and release space as they finish.
+DISK_PAUSE_FREE_PCT = float(os.getenv('DISK_PAUSE_FREE_PCT', 10))
+DISK_PAUSE_FREE_MB = int(os.getenv('DISK_PAUSE_FREE_MB', 2048))
+DISK_RESUME_FREE_PCT = float(os.getenv('DISK_RESUME_FREE_PCT', 15))
+DISK_PAUSE_POLL_S = 5
+
+# Storage prefix of each stage's artifacts
+STAGE_PREFIXES = {
+    'uploads': 'temp_uploads',
+    'unprocessed_chunks': 'unprocessed_chunks',
+    'processed_chunks': 'processed_chunks',
+    'processed_videos': 'processed_videos',
+}
+
+# Artifacts waiting out their retention, scored by when they may be deleted
+PENDING_KEY = 'gc:pending'
+# Latest per-stage usage of the storage volume, read by the backend
+USAGE_KEY = 'disk:usage'
+SCAN_LOCK_KEY = 'gc:scan_lock'
+
+# ===================
+# Reclamation
+# ===================
+
+def delete_artifact(redis_conn, storage, stage, key):
+    """Delete an object or directory-like prefix now. Returns the bytes freed."""
+    freed = storage.delete_prefix(key)
+    if freed:
+        inc(redis_conn, RECLAIMED_BYTES, freed, stage=stage)
+    return freed
+
+def reclaim(redis_conn, storage, video_id, stage, key, retention_s=None):
+    """
+    Release an artifact a downstream stage has durably consumed: delete it
+    now, or once retention_s (default GC_RETENTION_S) has passed.
+    """
+    retention_s = GC_RETENTION_S if retention_s is None else retention_s
+    if retention_s <= 0:
+        return delete_artifact(redis_conn, storage, stage, key)
+
+    member = json.dumps({'video_id': video_id, 'stage': stage, 'key': key}, sort_keys=True)
+    redis_conn.zadd(PENDING_KEY, {member: time.time() + retention_s})
+    return 0
+
+def reclaim_video(redis_conn, storage, video_id, retention_s=None):
+    """Release every intermediate of a video: its upload and both chunk stages."""
+    upload_key = redis_conn.hget(f"video:{video_id}", 'upload_key')
+    if upload_key:
+        reclaim(redis_conn, storage, video_id, 'uploads', upload_key.decode(), retention_s)
+    for stage in ('unprocessed_chunks', 'processed_chunks'):
+        reclaim(redis_conn, storage, video_id, stage, f"{STAGE_PREFIXES[stage]}/{video_id}", retention_s)
+
+def reclaim_due(redis_conn, storage, force=False):
+    """
+    Delete pending artifacts whose retention has run out, or every pending
+    artifact when force is set. Returns the bytes freed.
+    """
+    freed = 0
+    for member in redis_conn.zrangebyscore(PENDING_KEY, '-inf', '+inf' if force else time.time()):
+        # Removing the entry claims it, so each artifact is deleted by one replica
+        if not redis_conn.zrem(PENDING_KEY, member):
+            continue
+        entry = json.loads(member)
+        try:
+            freed += delete_artifact(redis_conn, storage, entry['stage'], entry['key'])
+        except Exception as e:
+            print(f"[GC] ❌ Could not reclaim {entry['key']}: {str(e)}")
+    return freed
+
+# ===================
+# Disk Usage
+# ===================
+
+def directory_bytes(path, skip=()):
+    """Bytes of every file under path, leaving out subdirectories named in skip."""
+    total = 0
+    for directory, subdirectories, filenames in os.walk(path):
+        subdirectories[:] = [name for name in subdirectories if name not in skip]
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(directory, filename))
+            except OSError:
+                pass  # Removed while we walked
+    return total
+
+def existing_ancestor(path):
+    """path, or its closest parent that exists yet."""
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return path
+
+def disk_free(storage):
+    """
+    (free, total) bytes of the fullest volume holding a stage directory.
+    Stages may be mounted from different volumes, so each is measured.
+    """
+    volumes = []
+    for prefix in STAGE_PREFIXES.values():
+        usage = shutil.disk_usage(existing_ancestor(storage.path(prefix)))
+        volumes.append((usage.free, usage.total))
+    return min(volumes)
+
+def disk_pressure(storage, resume=False):
+    """
+    Whether free space is under the pause watermark, or with resume set,
+    still under the higher watermark chunking resumes at.
+    """
+    free, total = disk_free(storage)
+    free_pct = DISK_RESUME_FREE_PCT if resume else DISK_PAUSE_FREE_PCT
+    return free < max(total * free_pct / 100, DISK_PAUSE_FREE_MB * 1024 * 1024)
+
+def scan_usage(redis_conn, storage):
+    """
+    Measure the bytes each stage holds on the storage volume (content caches
+    are counted on their own) and publish them to USAGE_KEY and the metrics.
+    """
+    usage = {
+        stage: directory_bytes(storage.path(prefix), skip=(CACHE_DIR_NAME,))
+        for stage, prefix in STAGE_PREFIXES.items()
+    }
+    usage['cache'] = sum(
+        directory_bytes(storage.path(f"{STAGE_PREFIXES[stage]}/{CACHE_DIR_NAME}"))
+        for stage in ('processed_chunks', 'processed_videos')
+    )
+    free, total = disk_free(storage)
+
+    redis_conn.hset(USAGE_KEY, mapping={
+        **usage,
+        'free': free,
+        'total': total,
+        'pending': redis_conn.zcard(PENDING_KEY),
+        'host': socket.gethostname(),
+        'updated_at': time.time(),
+    })
+    for stage, stage_bytes in usage.items():
+        set_gauge(redis_conn, STAGE_DISK_BYTES, stage_bytes, stage=stage)
+    set_gauge(redis_conn, DISK_FREE_BYTES, free)
+    return usage
+
+def wait_for_disk(redis_conn, storage, video_id, max_wait_s):
+    """
+    Hold a chunking job while the storage volume is under the pause
+    watermark, deleting pending artifacts early to make room. Returns True
+    once there is room, False if max_wait_s passed first.
+    """
+    if not disk_pressure(storage):
+        return True
+
+    redis_conn.hset(USAGE_KEY, 'chunking_paused', 1)
+    publish_progress(redis_conn, video_id, disk_paused=True)
+    print(f"[GC] ⏸️ Free space below watermark, chunking paused for video_id: {video_id}")
+
+    deadline = time.time() + max_wait_s
+    while True:
+        # Under pressure retention is best effort
+        reclaim_due(redis_conn, storage, force=True)
+        if not disk_pressure(storage, resume=True):
+            redis_conn.hset(USAGE_KEY, 'chunking_paused', 0)
+            publish_progress(redis_conn, video_id, disk_paused=False)
+            print(f"[GC] ▶️ Free space recovered, chunking resumed for video_id: {video_id}")
+            return True
+        if time.time() >= deadline:
+            return False
+        time.sleep(DISK_PAUSE_POLL_S)
+
+def start_reclaimer(redis_conn, storage):
+    """
+    Delete artifacts whose retention ran out and refresh the usage figures
+    from a daemon thread for the life of the worker. Only run it on workers
+    that mount every stage directory.
+    """
+    def run():
+        while True:
+            try:
+                reclaim_due(redis_conn, storage)
+                # One scan per interval across every replica sharing the volume
+                if redis_conn.set(SCAN_LOCK_KEY, socket.gethostname(), nx=True, ex=GC_INTERVAL_S):
+                    scan_usage(redis_conn, storage)
+            except Exception as e:
+                print(f"[GC] ❌ Reclamation pass failed: {str(e)}")
+            time.sleep(GC_INTERVAL_S)
+
+    threading.Thread(target=run, daemon=True).start()
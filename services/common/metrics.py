@@ -0,0 +1,168 @@
+import os
+import json
+import time
+from datetime import datetime, timezone
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+from rq import get_current_job
+from common.heartbeat import NODE_ID
+
+# ===================
+# Configuration
+# ===================
+
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9100))
+
+# Metric values live in redis rather than process memory: RQ runs every job
+# in a forked work horse, so only redis sees what the jobs recorded
+METRICS_TTL_S = 24 * 60 * 60
+TIMELINE_TTL_S = 7 * 24 * 60 * 60
+
+STAGE_SECONDS = 'clipcrunch_stage_seconds'
+QUEUE_WAIT_SECONDS = 'clipcrunch_queue_wait_seconds'
+BYTES_IN = 'clipcrunch_bytes_in_total'
+BYTES_OUT = 'clipcrunch_bytes_out_total'
+REALTIME_FACTOR = 'clipcrunch_encode_realtime_factor'
+STAGE_DISK_BYTES = 'clipcrunch_stage_disk_bytes'
+DISK_FREE_BYTES = 'clipcrunch_disk_free_bytes'
+RECLAIMED_BYTES = 'clipcrunch_reclaimed_bytes_total'
+
+# ===================
+# Recording
+# ===================
+
+def metrics_key(node_id=NODE_ID):
+    return f"metrics:{node_id}"
+
+def timeline_key(video_id):
+    return f"video:{video_id}:timeline"
+
+def format_labels(labels):
+    return ','.join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+
+def _write(redis_conn, commands):
+    pipe = redis_conn.pipeline()
+    for command, args in commands:
+        getattr(pipe, command)(metrics_key(), *args)
+    pipe.expire(metrics_key(), METRICS_TTL_S)
+    pipe.execute()
+
+def observe(redis_conn, name, value, **labels):
+    """Add one observation to a summary (sum and count)."""
+    field = f"{name}|{format_labels(labels)}"
+    _write(redis_conn, [
+        ('hincrbyfloat', (f"summary_sum|{field}", value)),
+        ('hincrby', (f"summary_count|{field}", 1)),
+    ])
+
+def inc(redis_conn, name, amount=1, **labels):
+    """Increase a counter."""
+    _write(redis_conn, [('hincrbyfloat', (f"counter|{name}|{format_labels(labels)}", amount))])
+
+def set_gauge(redis_conn, name, value, **labels):
+    """Set a gauge to its latest value."""
+    _write(redis_conn, [('hset', (f"gauge|{name}|{format_labels(labels)}", value))])
+
+def record_event(redis_conn, video_id, event):
+    """Append a stage event to a video's timeline."""
+    pipe = redis_conn.pipeline()
+    pipe.rpush(timeline_key(video_id), json.dumps(event))
+    pipe.expire(timeline_key(video_id), TIMELINE_TTL_S)
+    pipe.execute()
+
+def record_queue_wait(redis_conn, service, video_id=None, chunk_id=None):
+    """
+    Record how long the current RQ job sat in its queue. Call at the start of
+    a task. Returns the wait in seconds, or None outside of RQ.
+    """
+    job = get_current_job()
+    if job is None or job.enqueued_at is None:
+        return None
+
+    enqueued_at = job.enqueued_at
+    if enqueued_at.tzinfo is None:
+        enqueued_at = enqueued_at.replace(tzinfo=timezone.utc)
+    wait = max(0.0, (datetime.now(timezone.utc) - enqueued_at).total_seconds())
+
+    observe(redis_conn, QUEUE_WAIT_SECONDS, wait, service=service, queue=job.origin)
+    if video_id:
+        record_event(redis_conn, video_id, {
+            'service': service, 'stage': 'queue_wait', 'chunk': chunk_id,
+            'start': time.time() - wait, 'seconds': wait, 'node': NODE_ID
+        })
+    return wait
+
+@contextmanager
+def timed(redis_conn, service, stage, video_id=None, chunk_id=None):
+    """
+    Time a pipeline stage. The duration is added to the stage summary and,
+    when a video_id is given, to the video's timeline. The yielded dict can
+    carry extra fields (bytes_in, bytes_out, realtime_factor...) into the
+    timeline event; bytes are also added to the byte counters.
+    """
+    extra = {}
+    started = time.time()
+    t0 = time.perf_counter()
+    failed = False
+    try:
+        yield extra
+    except Exception:
+        failed = True
+        raise
+    finally:
+        seconds = time.perf_counter() - t0
+        observe(redis_conn, STAGE_SECONDS, seconds, service=service, stage=stage)
+        if extra.get('bytes_in'):
+            inc(redis_conn, BYTES_IN, extra['bytes_in'], service=service, stage=stage)
+        if extra.get('bytes_out'):
+            inc(redis_conn, BYTES_OUT, extra['bytes_out'], service=service, stage=stage)
+        if video_id:
+            record_event(redis_conn, video_id, {
+                'service': service, 'stage': stage, 'chunk': chunk_id,
+                'start': started, 'seconds': seconds, 'node': NODE_ID,
+                'failed': failed, **extra
+            })
+
+# ===================
+# Prometheus Endpoint
+# ===================
+
+METRIC_TYPES = {'summary_sum': 'summary', 'summary_count': 'summary', 'counter': 'counter', 'gauge': 'gauge'}
+
+def render_metrics(redis_conn, node_id=NODE_ID):
+    """Render this node's metrics in the Prometheus text format."""
+    samples = {}
+    for field, value in redis_conn.hgetall(metrics_key(node_id)).items():
+        kind, name, labels = field.decode().split('|', 2)
+        labels = f'node="{node_id}"' + (f',{labels}' if labels else '')
+        series = f"{name}_sum" if kind == 'summary_sum' else f"{name}_count" if kind == 'summary_count' else name
+        samples.setdefault(name, (METRIC_TYPES[kind], []))[1].append(f"{series}{{{labels}}} {float(value)}")
+
+    lines = []
+    for name in sorted(samples):
+        metric_type, series_lines = samples[name]
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.extend(sorted(series_lines))
+    return '\n'.join(lines) + '\n'
+
+def start_metrics_server(redis_conn, port=METRICS_PORT):
+    """Serve GET /metrics from a daemon thread."""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = render_metrics(redis_conn).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Keep scrape requests out of the worker logs
+
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"[Metrics] 📊 Serving /metrics on port {port}")
@@ -0,0 +1,119 @@
+import json
+import time
+
+# ===================
+# Configuration
+# ===================
+
+# Every progress event goes to the global channel and to the video's own
+# channel as a full snapshot of the video, computed once by the worker that
+# reported it; the backend relays them as Server-Sent Events unchanged
+PROGRESS_CHANNEL = 'progress'
+
+# Minimum interval between per-chunk percent updates from one encode
+CHUNK_PROGRESS_INTERVAL_S = 1.0
+
+STAGES = ('chunking', 'processing', 'assembling', 'done', 'error')
+FINAL_STAGES = ('done', 'error')
+
+# ===================
+# Progress Reporting
+# ===================
+
+def progress_channel(video_id):
+    return f"{PROGRESS_CHANNEL}:{video_id}"
+
+def progress_key(video_id):
+    return f"video:{video_id}:progress"
+
+def chunk_progress_key(video_id):
+    return f"video:{video_id}:chunk_progress"
+
+def progress_snapshot(redis_conn, video_id):
+    """
+    Current progress of one video built from its redis chunk state: stage,
+    chunks done/total, in-flight chunk percents and an ETA extrapolated from
+    the time spent so far. Returns None for unknown videos.
+    """
+    pipe = redis_conn.pipeline()
+    pipe.hgetall(progress_key(video_id))
+    pipe.hmget(f'video:{video_id}', 'status', 'chunk_total')
+    pipe.hvals(f'video:{video_id}:chunks')
+    pipe.hgetall(chunk_progress_key(video_id))
+    progress, (status, chunk_total), chunk_states, in_flight = pipe.execute()
+    if not progress and status is None:
+        return None
+
+    progress = {key.decode(): value.decode() for key, value in progress.items()}
+    in_flight = {key.decode(): float(value) for key, value in in_flight.items()}
+    stage = progress.get('stage') or ('queued' if status is None else status.decode())
+
+    chunks_done = sum(1 for state in chunk_states if state == b'processed')
+    chunks_total = int(chunk_total) if chunk_total else len(chunk_states)
+    completed = chunks_done + sum(in_flight.values()) / 100
+    percent = 100.0 if stage == 'done' else (100 * completed / chunks_total if chunks_total else 0.0)
+
+    # Only extrapolate once the chunk total is final
+    eta_s = None
+    if chunk_total and stage not in FINAL_STAGES and completed > 0 and progress.get('started_at'):
+        elapsed = time.time() - float(progress['started_at'])
+        eta_s = round(elapsed * (chunks_total - completed) / completed, 1)
+
+    return {
+        "video_id": video_id,
+        "stage": stage,
+        "chunks_done": chunks_done,
+        "chunks_total": chunks_total,
+        "chunks_in_flight": in_flight,
+        "percent": round(percent, 1),
+        "eta_s": eta_s,
+    }
+
+def publish_progress(redis_conn, video_id, **event):
+    """
+    Notify progress listeners that a video's state changed. The message is
+    the video's snapshot, with what changed under 'event'.
+    """
+    snapshot = progress_snapshot(redis_conn, video_id)
+    if snapshot is None:
+        return
+    message = json.dumps({**snapshot, 'event': event})
+    pipe = redis_conn.pipeline()
+    pipe.publish(PROGRESS_CHANNEL, message)
+    pipe.publish(progress_channel(video_id), message)
+    pipe.execute()
+
+def set_stage(redis_conn, video_id, stage):
+    """Record the pipeline stage a video has reached and announce it."""
+    now = time.time()
+    pipe = redis_conn.pipeline()
+    pipe.hsetnx(progress_key(video_id), 'started_at', now)
+    pipe.hset(progress_key(video_id), mapping={'stage': stage, 'updated_at': now})
+    pipe.execute()
+    publish_progress(redis_conn, video_id, stage=stage)
+
+def set_chunk_progress(redis_conn, video_id, chunk_id, percent):
+    """Record how far the encode of one chunk has got (0-100)."""
+    redis_conn.hset(chunk_progress_key(video_id), chunk_id, round(percent, 1))
+    publish_progress(redis_conn, video_id, chunk_id=chunk_id, chunk_percent=round(percent, 1))
+
+def clear_chunk_progress(redis_conn, video_id, chunk_id, status):
+    """Drop a chunk's in-flight percent once it is processed or given back."""
+    redis_conn.hdel(chunk_progress_key(video_id), chunk_id)
+    publish_progress(redis_conn, video_id, chunk_id=chunk_id, chunk_status=status)
+
+def chunk_progress_reporter(redis_conn, video_id, chunk_id):
+    """
+    Return a callback taking an encode percent that reports it at most once
+    per CHUNK_PROGRESS_INTERVAL_S.
+    """
+    last_reported = 0.0
+
+    def report(percent):
+        nonlocal last_reported
+        now = time.time()
+        if now - last_reported >= CHUNK_PROGRESS_INTERVAL_S:
+            last_reported = now
+            set_chunk_progress(redis_conn, video_id, chunk_id, percent)
+
+    return report
@@ -0,0 +1,79 @@
+# ===================
+# Configuration
+# ===================
+
+# Video bitrate of each rung of an ABR ladder, in bits/s. Used both as the
+# rung's encode ceiling and as its BANDWIDTH in the master playlist;
+# single-output jobs use their own video_bitrate instead
+LADDER_BITRATES = {
+    'UHD_4K': 12000000,
+    'QHD_2K': 8000000,
+    'FHD_1080': 5000000,
+    'HD_720': 2500000,
+    'SD_480': 1200000,
+    'MOBILE_360': 700000,
+}
+
+# ===================
+# Rendition Helpers
+# ===================
+
+def video_renditions(video_metadata):
+    """
+    Resolution names a video is encoded to: its ABR ladder when one was
+    requested, otherwise its single resolution.
+    """
+    renditions = video_metadata.get('renditions')
+    if renditions:
+        return renditions.split(',')
+    return [video_metadata['resolution']]
+
+def is_ladder(video_metadata):
+    """Whether the video was submitted with a list of renditions."""
+    return bool(video_metadata.get('renditions'))
+
+def rendition_subdir(video_metadata, rendition):
+    """
+    Sub-directory for one rendition's files. Ladder jobs keep each rendition
+    apart; single-output jobs keep the flat layout.
+    """
+    return rendition if is_ladder(video_metadata) else ''
+
+def ladder_bitrate(video_metadata, rendition):
+    """
+    Video bitrate of one rung of a ladder, from LADDER_BITRATES. With a
+    target-size override the override is the top rung's bitrate and the
+    lower rungs keep their ratio to it.
+    """
+    bitrate = LADDER_BITRATES[rendition]
+    override = video_metadata.get('video_bitrate_override')
+    if override:
+        top = max(LADDER_BITRATES[name] for name in video_renditions(video_metadata))
+        bitrate = bitrate * int(override) / top
+    return int(bitrate)
+
+def scale_filter_args(width, height):
+    """
+    ffmpeg scale filter options that fit the source inside width x height:
+    aspect ratio kept, never upscaled, and both sides even since 4:2:0
+    encoders reject odd sizes.
+    """
+    return {
+        'w': f'min({width},iw)',
+        'h': f'min({height},ih)',
+        'force_original_aspect_ratio': 'decrease',
+        'force_divisible_by': 2,
+    }
+
+def fitted_size(source_width, source_height, width, height):
+    """Output (width, height) that scale_filter_args() gives a source of this size."""
+    box_width, box_height = min(width, source_width), min(height, source_height)
+    fit_width = min(box_width, round(box_height * source_width / source_height))
+    fit_height = min(box_height, round(box_width * source_height / source_width))
+    return fit_width // 2 * 2, fit_height // 2 * 2
+
+def final_video_filename(video_id, video_metadata, rendition):
+    """File name of a finished output in processed_videos."""
+    if is_ladder(video_metadata):
+        return f"{video_id}_{rendition}.mp4"
+    return f"{video_id}.mp4"
@@ -0,0 +1,143 @@
+import os
+import json
+
+# ===================
+# Configuration
+# ===================
+
+# Priority tiers, highest first. A tier is only served once every tier above
+# it has nothing waiting.
+PRIORITY_TIERS = ('high', 'normal', 'low')
+DEFAULT_PRIORITY = 'normal'
+
+# Relative encode effort of each preset (medium = 1.0)
+PRESET_COST = {
+    'ULTRAFAST': 0.25,
+    'FAST': 0.6,
+    'MEDIUM': 1.0,
+    'SLOW': 2.0,
+    'VERYSLOW': 5.0,
+}
+
+RESOLUTION_PIXELS = {
+    'UHD_4K': 3840 * 2160,
+    'QHD_2K': 2560 * 1440,
+    'FHD_1080': 1920 * 1080,
+    'HD_720': 1280 * 720,
+    'SD_480': 854 * 480,
+    'MOBILE_360': 640 * 360,
+}
+
+# RQ kills jobs after 180s unless told otherwise. A chunk encode can run far
+# longer, so processing jobs get no RQ timeout (-1) by default: the chunk
+# lease, renewed while the encode is alive and reaped once it lapses, is the
+# liveness check instead.
+PROCESSING_JOB_TIMEOUT = int(os.getenv('PROCESSING_JOB_TIMEOUT', -1))
+
+# Chunking reads and rewrites the whole upload, so its timeout is a fixed
+# allowance for probing and planning plus time proportional to the input size
+CHUNKING_TIMEOUT_BASE_S = int(os.getenv('CHUNKING_TIMEOUT_BASE_S', 300))
+CHUNKING_TIMEOUT_S_PER_GB = int(os.getenv('CHUNKING_TIMEOUT_S_PER_GB', 600))
+
+PAYLOADS_KEY = 'sched:payloads'
+LOCK_KEY = 'sched:lock'
+
+# ===================
+# Cost Model
+# ===================
+
+def estimate_chunk_cost(duration, renditions, preset):
+    """
+    Estimated encode cost of a chunk: seconds x output megapixels (summed over
+    renditions) x preset effort.
+    """
+    megapixels = sum(RESOLUTION_PIXELS.get(r, RESOLUTION_PIXELS['FHD_1080']) for r in renditions) / 1e6
+    return max(duration, 0.001) * megapixels * PRESET_COST.get(preset, 1.0)
+
+def chunking_job_timeout(size_bytes):
+    """RQ job_timeout, in seconds, for chunking an upload of size_bytes."""
+    size_gb = max(int(size_bytes or 0), 0) / (1024 ** 3)
+    return CHUNKING_TIMEOUT_BASE_S + int(CHUNKING_TIMEOUT_S_PER_GB * size_gb)
+
+def video_priority(video_metadata):
+    priority = video_metadata.get('priority', DEFAULT_PRIORITY)
+    return priority if priority in PRIORITY_TIERS else DEFAULT_PRIORITY
+
+# ===================
+# Scheduler
+# ===================
+#
+# Chunks are not pushed straight onto the FIFO processing queue. They wait in
+# redis until dispatch() moves a few at a time onto it, keeping the RQ queue
+# shallow so that ordering decisions are made late:
+#   sched:tier:<tier>     zset of videos with waiting chunks, scored by the
+#                         cost already dispatched for them (fair share)
+#   sched:video:<id>      zset of a video's waiting chunks, scored by -cost
+#                         (costliest first, which shortens the video's makespan)
+#   sched:payloads        hash of "<video_id>:<chunk_id>" -> RQ job arguments
+
+def submit_chunk(redis_conn, video_id, chunk_metadata, cost, priority=DEFAULT_PRIORITY):
+    """Queue a chunk with the scheduler instead of the processing queue."""
+    tier_key = f'sched:tier:{priority}'
+    chunk_id = chunk_metadata['chunk_id']
+
+    # Held so dispatch() cannot drop the video from its tier mid-submit
+    with redis_conn.lock(LOCK_KEY, timeout=30):
+        # A video joining a tier starts level with the least-served video in
+        # it, so it neither starves the others nor is starved by them
+        least_served = redis_conn.zrange(tier_key, 0, 0, withscores=True)
+        start_score = least_served[0][1] if least_served else 0
+
+        pipe = redis_conn.pipeline()
+        pipe.hset(PAYLOADS_KEY, f'{video_id}:{chunk_id}', json.dumps(chunk_metadata))
+        pipe.zadd(f'sched:video:{video_id}', {chunk_id: -cost})
+        pipe.zadd(tier_key, {video_id: start_score}, nx=True)
+        pipe.execute()
+
+def dispatch(redis_conn, queue, method, max_queued):
+    """
+    Move waiting chunks onto the RQ queue until it holds max_queued jobs.
+    Each pick takes the highest non-empty tier, the least-served video in it
+    and that video's costliest waiting chunk. Safe to call from any replica.
+    """
+    # Another replica dispatching right now will fill the queue for us
+    lock = redis_conn.lock(LOCK_KEY, timeout=30)
+    if not lock.acquire(blocking_timeout=5):
+        return 0
+
+    dispatched = 0
+    try:
+        while queue.count < max_queued:
+            picked = None
+            for priority in PRIORITY_TIERS:
+                tier_key = f'sched:tier:{priority}'
+                videos = redis_conn.zrange(tier_key, 0, 0)
+                if videos:
+                    picked = (tier_key, videos[0].decode())
+                    break
+            if picked is None:
+                break
+
+            tier_key, video_id = picked
+            chunks = redis_conn.zpopmin(f'sched:video:{video_id}')
+            if not chunks:
+                redis_conn.zrem(tier_key, video_id)
+                continue
+
+            chunk_id, negative_cost = chunks[0][0].decode(), chunks[0][1]
+            payload_field = f'{video_id}:{chunk_id}'
+            chunk_metadata = json.loads(redis_conn.hget(PAYLOADS_KEY, payload_field))
+
+            # Charge the video for the work it just received
+            if redis_conn.zcard(f'sched:video:{video_id}'):
+                redis_conn.zincrby(tier_key, -negative_cost, video_id)
+            else:
+                redis_conn.zrem(tier_key, video_id)
+            redis_conn.hdel(PAYLOADS_KEY, payload_field)
+
+            queue.enqueue(method, chunk_metadata, video_id, job_timeout=PROCESSING_JOB_TIMEOUT)
+            dispatched += 1
+    finally:
+        lock.release()
+
+    return dispatched
@@ -0,0 +1,254 @@
+import os
+import shutil
+import uuid
+
+# ===================
+# Configuration
+# ===================
+
+# Storage driver:
+#   local - objects are files under STORAGE_ROOT on a volume shared by every node
+#   s3    - objects live in an S3-compatible bucket; STORAGE_ROOT is a
+#           node-local staging area that ffmpeg reads and writes
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local')
+STORAGE_ROOT = os.getenv('STORAGE_ROOT', '/app')
+
+S3_BUCKET = os.getenv('STORAGE_S3_BUCKET', 'clipcrunch')
+S3_ENDPOINT_URL = os.getenv('STORAGE_S3_ENDPOINT') or None  # e.g. http://minio:9000 for a local stand-in
+
+# Uploads and downloads above the threshold are split into parallel parts
+S3_MULTIPART_THRESHOLD_MB = int(os.getenv('STORAGE_S3_MULTIPART_THRESHOLD_MB', 16))
+S3_MULTIPART_PART_MB = int(os.getenv('STORAGE_S3_MULTIPART_PART_MB', 16))
+
+STREAM_BLOCK_SIZE = 1024 * 1024  # Streams are read in 1MB blocks
+
+# Lifetime of the presigned URLs ffmpeg reads S3 objects through; long
+# enough to outlast a retried encode
+S3_PRESIGN_EXPIRY_S = int(os.getenv('STORAGE_S3_PRESIGN_EXPIRY_S', 6 * 60 * 60))
+
+# ===================
+# Drivers
+# ===================
+
+class LocalStorage:
+    """
+    Objects are files under root, addressed by '/'-separated keys such as
+    'unprocessed_chunks/<video_id>/chunk_000.mp4'. Nothing is copied:
+    fetch and store only check or return the file's path.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        """Local path where the object for key is read and written."""
+        return os.path.join(self.root, key)
+
+    def key(self, path):
+        """Key of the object stored at a local path under root."""
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def fetch(self, key):
+        """Make the object available at path(key) and return that path."""
+        path = self.path(key)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Object not found in storage: {key}")
+        return path
+
+    def store(self, key):
+        """Publish the file written at path(key) as the object for key."""
+        return self.path(key)
+
+    def store_stream(self, key, stream):
+        """Write an object from a file-like stream without buffering it whole."""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial_path = f"{path}.{uuid.uuid4().hex}.part"
+        with open(partial_path, 'wb') as f:
+            shutil.copyfileobj(stream, f, STREAM_BLOCK_SIZE)
+        os.replace(partial_path, path)
+        return path
+
+    def read_range(self, key, start=0, end=None):
+        """Yield the bytes [start, end) of an object in blocks; end=None reads to the end."""
+        with open(self.fetch(key), 'rb') as f:
+            f.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                block = f.read(STREAM_BLOCK_SIZE if remaining is None else min(STREAM_BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                if remaining is not None:
+                    remaining -= len(block)
+                yield block
+
+    def input_url(self, key):
+        """
+        Location ffmpeg can read the object from without staging a copy: its
+        path here, a presigned URL in S3 mode. ffmpeg seeks over HTTP with
+        ranged reads, so only the bytes it decodes are transferred.
+        """
+        return self.fetch(key)
+
+    def release(self, key):
+        """
+        Drop this node's working copy of an object once it is no longer read
+        here. Local files are the objects themselves, so nothing is removed.
+        """
+
+    def fetch_file(self, path):
+        """fetch() addressed by local path rather than key."""
+        return self.fetch(self.key(path))
+
+    def store_file(self, path):
+        """store() addressed by local path rather than key."""
+        return self.store(self.key(path))
+
+    def release_file(self, path):
+        """release() addressed by local path rather than key."""
+        self.release(self.key(path))
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def delete(self, key):
+        if os.path.exists(self.path(key)):
+            os.remove(self.path(key))
+
+    def delete_prefix(self, prefix):
+        """
+        Delete the object at prefix and every object under prefix + '/'.
+        Returns the number of bytes freed.
+        """
+        path = self.path(prefix)
+        if os.path.isfile(path):
+            freed = os.path.getsize(path)
+            os.remove(path)
+            return freed
+
+        freed = 0
+        for directory, _, filenames in os.walk(path):
+            for filename in filenames:
+                try:
+                    freed += os.path.getsize(os.path.join(directory, filename))
+                except OSError:
+                    pass  # Removed while we walked
+        shutil.rmtree(path, ignore_errors=True)
+        return freed
+
+class S3Storage(LocalStorage):
+    """
+    Objects live in an S3-compatible bucket (AWS S3, MinIO...). root holds
+    node-local copies: fetch downloads into it, store uploads from it and
+    release drops them once the node is done with them.
+    Credentials come from the usual AWS_* environment variables.
+    """
+
+    def __init__(self, root, bucket, endpoint_url=None):
+        super().__init__(root)
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 to be installed")
+
+        self.bucket = bucket
+        self.client = boto3.client('s3', endpoint_url=endpoint_url)
+        self.client_error = ClientError
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD_MB * 1024 * 1024,
+            multipart_chunksize=S3_MULTIPART_PART_MB * 1024 * 1024
+        )
+
+        # A fresh stand-in (e.g. MinIO) starts without the bucket
+        try:
+            self.client.head_bucket(Bucket=bucket)
+        except ClientError:
+            self.client.create_bucket(Bucket=bucket)
+
+    def fetch(self, key):
+        path = self.path(key)
+        if os.path.exists(path):
+            return path  # Already staged on this node
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial_path = f"{path}.{uuid.uuid4().hex}.part"
+        try:
+            self.client.download_file(self.bucket, key, partial_path, Config=self.transfer_config)
+        except self.client_error as e:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise FileNotFoundError(f"Object not found in storage: {key}") from e
+        os.replace(partial_path, path)
+        return path
+
+    def store(self, key):
+        path = self.path(key)
+        self.client.upload_file(path, self.bucket, key, Config=self.transfer_config)
+        return path
+
+    def store_stream(self, key, stream):
+        # Multipart upload straight from the stream; nothing is staged locally
+        self.client.upload_fileobj(stream, self.bucket, key, Config=self.transfer_config)
+        return self.path(key)
+
+    def read_range(self, key, start=0, end=None):
+        # A ranged GET: only the requested bytes leave the bucket
+        byte_range = f"bytes={start}-{'' if end is None else end - 1}"
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=key, Range=byte_range)['Body']
+        except self.client_error as e:
+            raise FileNotFoundError(f"Object not found in storage: {key}") from e
+        try:
+            yield from body.iter_chunks(STREAM_BLOCK_SIZE)
+        finally:
+            body.close()
+
+    def input_url(self, key):
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': key}, ExpiresIn=S3_PRESIGN_EXPIRY_S
+        )
+
+    def release(self, key):
+        # The bucket holds the object; the staged copy is only a working file
+        path = self.path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except self.client_error:
+            return False
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+        super().delete(key)  # Drop the staged copy too
+
+    def delete_prefix(self, prefix):
+        freed = 0
+        objects = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get('Contents', []):
+                # The listing also matches siblings such as '<prefix>_other'
+                if item['Key'] == prefix or item['Key'].startswith(f"{prefix}/"):
+                    objects.append({'Key': item['Key']})
+                    freed += item['Size']
+
+        # delete_objects takes at most 1000 keys per call
+        for start in range(0, len(objects), 1000):
+            self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': objects[start:start + 1000], 'Quiet': True})
+
+        super().delete_prefix(prefix)  # Drop the staged copies too
+        return freed
+
+def get_storage(backend=STORAGE_BACKEND, root=STORAGE_ROOT):
+    """Storage driver selected by STORAGE_BACKEND."""
+    if backend == 'local':
+        return LocalStorage(root)
+    if backend == 's3':
+        return S3Storage(root, S3_BUCKET, S3_ENDPOINT_URL)
+    raise ValueError(f"Unknown storage backend: {backend}")
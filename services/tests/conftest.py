@@ -0,0 +1,39 @@
+import os
+import sys
+import tempfile
+
+import fakeredis
+import pytest
+import redis
+
+SERVICES_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The services read their configuration and connect to redis at import time,
+# so both are swapped out before any test imports them: storage goes to a
+# scratch root and every connection shares one in-memory redis
+os.environ['STORAGE_BACKEND'] = 'local'
+os.environ['STORAGE_ROOT'] = tempfile.mkdtemp(prefix='clipcrunch-tests-')
+
+FAKE_SERVER = fakeredis.FakeServer()
+
+class SharedFakeRedis(fakeredis.FakeRedis):
+    def __init__(self, *args, **kwargs):
+        kwargs['server'] = FAKE_SERVER
+        super().__init__(*args, **kwargs)
+
+redis.Redis = SharedFakeRedis
+
+sys.path[:0] = [SERVICES_DIR] + [
+    os.path.join(SERVICES_DIR, name) for name in ('video_chunker', 'video_processor', 'video_assembler', 'autoscaler')
+]
+
+@pytest.fixture(autouse=True)
+def redis_conn():
+    """The shared in-memory redis, emptied for every test."""
+    conn = redis.Redis()
+    conn.flushall()
+    return conn
+
+@pytest.fixture
+def storage_root():
+    return os.environ['STORAGE_ROOT']
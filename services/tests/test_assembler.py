@@ -0,0 +1,69 @@
+import os
+
+import assembler
+from common.renditions import fitted_size
+
+def write_vod_playlist(video_id, durations):
+    playlist_dir = assembler.hls_dir(video_id, {}, '')
+    assembler.write_media_playlist(playlist_dir, durations, ended=True)
+    return os.path.join(playlist_dir, assembler.HLS_PLAYLIST_NAME)
+
+def test_append_after_finalize_keeps_vod_playlist(redis_conn):
+    video_id = 'finalized-video'
+    redis_conn.hset(f"video:{video_id}", mapping={'resolution': 'HD_720', 'has_audio': 0, 'finalized': 1})
+    redis_conn.hset(f"video:{video_id}:chunks", mapping={'chunk_000.mp4': 'processed', 'chunk_001.mp4': 'processed'})
+    redis_conn.set(f"video:{video_id}:assembled", 2)
+    playlist_path = write_vod_playlist(video_id, [4.0, 4.0])
+    with open(playlist_path) as f:
+        finished = f.read()
+
+    result = assembler.append_chunks_task(video_id)
+
+    assert result['status'] == 'skipped'
+    with open(playlist_path) as f:
+        playlist = f.read()
+    assert playlist == finished
+    assert '#EXT-X-ENDLIST' in playlist
+    assert '#EXT-X-PLAYLIST-TYPE:VOD' in playlist
+
+def test_ordered_chunks_sorts_by_index_past_999(redis_conn):
+    video_id = 'long-video'
+    chunk_ids = [f"chunk_{index:03d}.mp4" for index in range(1002)]
+    redis_conn.hset(f"video:{video_id}:chunks", mapping={chunk_id: 'pending' for chunk_id in chunk_ids})
+
+    assert [chunk_id for chunk_id, _ in assembler.ordered_chunks(video_id)] == chunk_ids
+
+def test_master_playlist_advertises_the_encoded_ladder_bitrates():
+    video_id = 'ladder-video'
+    video_metadata = {'renditions': 'FHD_1080,HD_720'}
+
+    assembler.write_master_playlist(video_id, video_metadata, ['FHD_1080', 'HD_720'])
+
+    with open(os.path.join(assembler.FINAL_VIDEOS_DIR, video_id, assembler.HLS_MASTER_PLAYLIST_NAME)) as f:
+        playlist = f.read()
+    assert f"BANDWIDTH={assembler.ladder_bitrate(video_metadata, 'FHD_1080')},RESOLUTION=1920x1080" in playlist
+    assert f"BANDWIDTH={assembler.ladder_bitrate(video_metadata, 'HD_720')},RESOLUTION=1280x720" in playlist
+
+def test_master_playlist_advertises_renditions_fitted_to_the_source():
+    video_id = 'ladder-video-portrait'
+    # A 1080x1920 portrait source, as probed by the chunker
+    video_metadata = {'renditions': 'FHD_1080,HD_720', 'source_width': '1080', 'source_height': '1920'}
+
+    assembler.write_master_playlist(video_id, video_metadata, ['FHD_1080', 'HD_720'])
+
+    with open(os.path.join(assembler.FINAL_VIDEOS_DIR, video_id, assembler.HLS_MASTER_PLAYLIST_NAME)) as f:
+        playlist = f.read()
+    assert 'RESOLUTION=608x1080' in playlist
+    assert 'RESOLUTION=404x720' in playlist
+
+def test_fitted_size_never_upscales_and_keeps_sides_even():
+    assert fitted_size(640, 360, 1920, 1080) == (640, 360)
+    assert fitted_size(641, 361, 1920, 1080) == (640, 360)
+    assert fitted_size(1920, 800, 1280, 720) == (1280, 532)
+
+def test_assembly_of_a_finalized_video_is_skipped(redis_conn):
+    video_id = 'finalized-twice'
+    redis_conn.hset(f"video:{video_id}", mapping={'resolution': 'HD_720', 'has_audio': 0, 'finalized': 1, 'status': 'done'})
+
+    assert assembler.assemble_video_task(video_id) == {"status": "skipped"}
+    assert redis_conn.hget(f"video:{video_id}", 'status') == b'done'
@@ -0,0 +1,77 @@
+from rq import Queue
+
+import autoscaler
+
+class SimulatedProcessors:
+    """
+    Stand-in for processor replicas: chunks are enqueued on the real (fake
+    redis) processing queue and each replica completes one every
+    encode_seconds, reporting its encode time the way processors do.
+    """
+    def __init__(self, conn, encode_seconds):
+        self.conn = conn
+        self.encode_seconds = encode_seconds
+        self.queue = Queue(autoscaler.PROCESSING_QUEUE, connection=conn)
+        # Replicas that already ran have reported their encode time
+        conn.lpush(autoscaler.ENCODE_TIMES_KEY, encode_seconds)
+
+    def submit(self, chunk_count):
+        for _ in range(chunk_count):
+            self.queue.enqueue('processor.process_chunk_task', {}, 'video')
+
+    def work(self, replicas, seconds):
+        for _ in range(min(int(replicas * seconds / self.encode_seconds), self.queue.count)):
+            self.queue.pop_job_id()
+            self.conn.lpush(autoscaler.ENCODE_TIMES_KEY, self.encode_seconds)
+
+def step(conn, state, now):
+    """One controller tick, as run() does it."""
+    previous, last_raised = state
+    decided = autoscaler.apply_cooldown(autoscaler.compute_targets(autoscaler.sample_pipeline(conn)), previous, last_raised, now)
+    previous.clear()
+    previous.update(decided)
+    return decided
+
+def test_processors_scale_up_with_the_backlog(redis_conn):
+    workers = SimulatedProcessors(redis_conn, encode_seconds=20.0)
+    state = ({}, {})
+    assert step(redis_conn, state, now=0)['processor'] == 1
+
+    # 60 chunks x 20s must drain within TARGET_DRAIN_S
+    workers.submit(60)
+    decided = step(redis_conn, state, now=autoscaler.SAMPLE_INTERVAL_S)
+
+    assert decided['processor'] == 60 * 20 // autoscaler.TARGET_DRAIN_S
+
+def test_processors_scale_down_only_after_the_cooldown(redis_conn):
+    workers = SimulatedProcessors(redis_conn, encode_seconds=20.0)
+    state = ({}, {})
+    workers.submit(60)
+    peak = step(redis_conn, state, now=0)['processor']
+
+    # The backlog drains, but the replicas are held through the cooldown
+    now = 0
+    while workers.queue.count:
+        workers.work(state[0]['processor'], autoscaler.SAMPLE_INTERVAL_S)
+        now += autoscaler.SAMPLE_INTERVAL_S
+        step(redis_conn, state, now)
+    assert now < autoscaler.SCALE_DOWN_COOLDOWN_S
+    assert state[0]['processor'] == peak
+
+    decided = step(redis_conn, state, now=autoscaler.SCALE_DOWN_COOLDOWN_S)
+    assert decided['processor'] == 1
+
+def test_targets_are_clamped_to_the_replica_bounds(redis_conn):
+    workers = SimulatedProcessors(redis_conn, encode_seconds=60.0)
+    bounds = {'chunker': (1, 2), 'processor': (2, 5), 'assembler': (1, 3)}
+
+    idle = autoscaler.compute_targets(autoscaler.sample_pipeline(redis_conn), bounds)
+    assert idle == {'chunker': 1, 'processor': 2, 'assembler': 1}
+
+    workers.submit(100)
+    for _ in range(10):
+        Queue(autoscaler.CHUNKING_QUEUE, connection=redis_conn).enqueue('chunker.chunk_video_task', 'video', '.mp4')
+    for _ in range(200):
+        Queue(autoscaler.ASSEMBLY_QUEUE, connection=redis_conn).enqueue('assembler.append_chunks_task', 'video')
+    busy = autoscaler.compute_targets(autoscaler.sample_pipeline(redis_conn), bounds)
+    assert busy == {'chunker': 2, 'processor': 5, 'assembler': 3}
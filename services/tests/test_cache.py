@@ -0,0 +1,52 @@
+import os
+
+from common.cache import ContentCache, rendition_cache_key, source_cache_key
+from common.storage import get_storage
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+def test_cache_entries_are_storage_objects_evicted_in_lru_order(redis_conn, storage_root):
+    storage = get_storage('local', storage_root)
+    cache = ContentCache(redis_conn, storage, 'processed_chunks', 'chunks', max_bytes=10)
+    source = os.path.join(storage_root, 'source.mp4')
+
+    write(source, b'123456')
+    cache.put('first', source)
+    write(source, b'abcdef')
+    cache.put('second', source)
+
+    assert not storage.exists(cache.object_key('first'))
+    assert storage.exists(cache.object_key('second'))
+    dest = os.path.join(storage_root, 'out', 'chunk.mp4')
+    assert not cache.get('first', dest)
+    assert cache.get('second', dest)
+    with open(dest, 'rb') as f:
+        assert f.read() == b'abcdef'
+
+def test_target_size_overrides_change_the_chunk_cache_key():
+    video_metadata = {
+        'resolution': 'HD_720',
+        'video_bitrate': 'HIGH',
+        'crf_value': 'HIGH',
+        'preset': 'MEDIUM',
+        'video_codec': 'H264',
+        'target_size_mb': '50',
+    }
+    overridden = {**video_metadata, 'crf_override': '31.5', 'video_bitrate_override': '1200000'}
+    other_fit = {**overridden, 'crf_override': '27.0'}
+
+    key = rendition_cache_key('chunk-hash', video_metadata, 'HD_720')
+    assert rendition_cache_key('chunk-hash', overridden, 'HD_720') != key
+    assert rendition_cache_key('chunk-hash', other_fit, 'HD_720') != rendition_cache_key('chunk-hash', overridden, 'HD_720')
+    # Whole-video entries are found before the overrides are derived
+    assert source_cache_key('source-hash', overridden, 'HD_720') == source_cache_key('source-hash', video_metadata, 'HD_720')
+
+def test_ladder_rung_and_single_output_do_not_share_entries():
+    single = {'resolution': 'HD_720', 'video_bitrate': 'HIGH', 'crf_value': 'HIGH', 'preset': 'MEDIUM', 'video_codec': 'H264'}
+    ladder = {**single, 'renditions': 'FHD_1080,HD_720'}
+
+    assert rendition_cache_key('chunk-hash', ladder, 'HD_720') != rendition_cache_key('chunk-hash', single, 'HD_720')
+    assert source_cache_key('source-hash', ladder, 'HD_720') != source_cache_key('source-hash', single, 'HD_720')
@@ -0,0 +1,91 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import chunker
+
+HAS_FFMPEG = bool(shutil.which('ffmpeg') and shutil.which('ffprobe'))
+
+def test_size_mode_plans_one_cut_per_chunk_boundary():
+    # Two-second GOPs of growing size: cuts follow bytes, not time
+    keyframes = [(i * 2.0, 1000 * (i + 1)) for i in range(20)]
+
+    cuts = chunker.plan_keyframe_cuts(keyframes, 40.0, 4, 'size')
+
+    assert len(cuts) + 1 == 4
+    assert cuts == sorted(cuts)
+    assert set(cuts) <= {pts_time for pts_time, _ in keyframes}
+    # Later GOPs are bigger, so byte-balanced chunks get shorter
+    assert cuts[0] > 40.0 / 4
+
+@pytest.mark.skipif(not HAS_FFMPEG, reason="ffmpeg is not installed")
+def test_size_mode_splits_into_planned_chunk_count(redis_conn, storage_root, monkeypatch):
+    video_id = 'size-mode-video'
+    source = os.path.join(storage_root, 'source.mp4')
+    subprocess.run([
+        'ffmpeg', '-y', '-v', 'error',
+        '-f', 'lavfi', '-i', 'testsrc=duration=12:size=320x240:rate=25',
+        '-c:v', 'libx264', '-g', '25', '-pix_fmt', 'yuv420p',
+        source
+    ], check=True)
+    monkeypatch.setattr(chunker, 'dispatch', lambda *args, **kwargs: None)
+
+    chunk_total, _ = chunker.split_chunks(
+        video_id, {'resolution': 'HD_720'}, source, False, 4, 'size', chunker.probe_keyframes(source)
+    )
+
+    assert chunk_total == 4
+    assert redis_conn.hlen(f"video:{video_id}:chunks") == 4
+
+def test_rate_scales_average_to_the_budget_after_clamping():
+    # One very busy second among quiet ones: its raw score is far above the clamp
+    keyframes = [(float(i), 100_000 if i == 3 else 1_000) for i in range(10)]
+    starts = [0.0, 2.0, 3.0, 4.0, 7.0]
+    ends = starts[1:] + [10.0]
+
+    plans = chunker.plan_rate_scales((keyframes, 10.0), starts, ends)
+
+    scales = [scale for _, scale in plans]
+    durations = [end - start for start, end in zip(starts, ends)]
+    weighted_mean = sum(scale * d for scale, d in zip(scales, durations)) / sum(durations)
+    assert abs(weighted_mean - 1.0) < 1e-3
+    assert all(chunker.RATE_SCALE_MIN <= scale <= chunker.RATE_SCALE_MAX for scale in scales)
+    assert scales[2] == chunker.RATE_SCALE_MAX
+    assert plans[2][0] > chunker.RATE_SCALE_MAX
+
+def test_keyframe_index_duration_ends_after_the_last_frame(monkeypatch):
+    # 25fps, keyframes every 2 frames; ffprobe's csv order is pts_time,duration_time,size,flags
+    packets = '\n'.join(
+        f"{i * 0.04:.6f},0.040000,{100 + i},{'K_' if i % 2 == 0 else '__'}" for i in range(5)
+    )
+    monkeypatch.setattr(chunker.subprocess, 'run', lambda *args, **kwargs: subprocess.CompletedProcess(args, 0, packets, ''))
+
+    keyframes, duration = chunker.probe_keyframes('source.mp4')
+
+    assert keyframes == [(0.0, 201), (0.08, 205), (0.16, 104)]
+    assert duration == pytest.approx(0.2)
+
+def test_remux_keeps_only_the_main_video_and_audio_streams(storage_root, monkeypatch):
+    commands = []
+    monkeypatch.setattr(chunker.subprocess, 'run', lambda cmd, **kwargs: commands.append(cmd))
+
+    chunker.remux_video('source.mkv', os.path.join(storage_root, 'final', 'out.mp4'))
+
+    maps = [commands[0][i + 1] for i, arg in enumerate(commands[0]) if arg == '-map']
+    assert maps == ['0:v:0', '0:a?']
+
+def test_cost_mode_weighs_gop_duration_and_caps_complexity():
+    # Eleven 2s GOPs; the first one is very busy
+    keyframes = [(i * 2.0, 100_000 if i == 0 else 1000) for i in range(11)]
+    video_metadata = {'resolution': 'HD_720', 'preset': 'MEDIUM'}
+
+    size_cuts = chunker.plan_keyframe_cuts(keyframes, 22.0, 2, 'size', video_metadata)
+    cost_cuts = chunker.plan_keyframe_cuts(keyframes, 22.0, 2, 'cost', video_metadata)
+    duration_cuts = chunker.plan_keyframe_cuts(keyframes, 22.0, 2, 'duration', video_metadata)
+
+    # Bytes pile up on the busy GOP; its cost is boosted only up to RATE_SCALE_MAX
+    assert size_cuts == [2.0]
+    assert cost_cuts == [8.0]
+    assert duration_cuts != cost_cuts
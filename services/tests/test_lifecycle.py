@@ -0,0 +1,44 @@
+import os
+from collections import namedtuple
+
+from common import lifecycle
+from common.storage import get_storage
+
+DiskUsage = namedtuple('DiskUsage', 'total used free')
+
+def test_disk_free_reports_the_fullest_stage_volume(storage_root, monkeypatch):
+    storage = get_storage('local', storage_root)
+    free_by_stage = {
+        'temp_uploads': 900,
+        'unprocessed_chunks': 700,
+        'processed_chunks': 50,
+        'processed_videos': 400,
+    }
+    measured = []
+
+    def disk_usage(path):
+        measured.append(path)
+        for prefix, free in free_by_stage.items():
+            if path == storage.path(prefix):
+                return DiskUsage(1000, 1000 - free, free)
+        return DiskUsage(1000, 0, 1000)
+
+    for prefix in free_by_stage:
+        os.makedirs(storage.path(prefix), exist_ok=True)
+    monkeypatch.setattr(lifecycle.shutil, 'disk_usage', disk_usage)
+
+    assert lifecycle.disk_free(storage) == (50, 1000)
+    assert sorted(measured) == sorted(storage.path(prefix) for prefix in free_by_stage)
+
+def test_disk_free_measures_missing_stage_directories_from_their_parent(storage_root, monkeypatch):
+    storage = get_storage('local', os.path.join(storage_root, 'not-created-yet'))
+    measured = []
+
+    def disk_usage(path):
+        measured.append(path)
+        return DiskUsage(1000, 600, 400)
+
+    monkeypatch.setattr(lifecycle.shutil, 'disk_usage', disk_usage)
+
+    assert lifecycle.disk_free(storage) == (400, 1000)
+    assert set(measured) == {storage_root}
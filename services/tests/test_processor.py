@@ -0,0 +1,80 @@
+import os
+
+import processor
+
+def fail_encode(*args, **kwargs):
+    raise RuntimeError("encoder crashed")
+
+def test_failed_audio_track_is_retried_then_errors_the_video(redis_conn, storage_root, monkeypatch):
+    video_id = 'audio-failure'
+    audio_path = os.path.join(storage_root, 'unprocessed_chunks', video_id, 'audio.mka')
+    os.makedirs(os.path.dirname(audio_path), exist_ok=True)
+    with open(audio_path, 'wb') as f:
+        f.write(b'audio')
+    redis_conn.hset(f"video:{video_id}", mapping={'status': 'processing', 'audio_codec': 'AAC', 'audio_bitrate': 'STANDARD'})
+    redis_conn.hset(f"video:{video_id}:tracks", 'audio', 'pending')
+    redis_conn.hset(f"video:{video_id}:chunk:audio", 'chunk_path', audio_path)
+    redis_conn.set(f"video:{video_id}:remaining", 1)
+    monkeypatch.setattr(processor, 'process_audio', fail_encode)
+    requeued = []
+    monkeypatch.setattr(processor.processing_queue, 'enqueue', lambda *args, **kwargs: requeued.append(args))
+
+    for attempt in range(processor.MAX_CHUNK_ATTEMPTS):
+        assert processor.process_audio_task(audio_path, video_id)['status'] == 'error'
+
+    assert requeued == [(processor.PROCESSOR_AUDIO_METHOD, audio_path, video_id)] * (processor.MAX_CHUNK_ATTEMPTS - 1)
+    assert redis_conn.hget(f"video:{video_id}:tracks", 'audio') == b'failed'
+    assert redis_conn.hget(f"video:{video_id}", 'status') == b'error'
+    assert redis_conn.zcard(processor.LEASES_KEY) == 0
+    assert processor.process_audio_task(audio_path, video_id)['status'] == 'skipped'
+
+def test_ladder_rungs_get_their_own_bitrate():
+    video_metadata = {
+        'renditions': 'FHD_1080,HD_720,MOBILE_360',
+        'video_bitrate': 'HIGH',
+        'preset': 'MEDIUM',
+        'video_codec': 'H264',
+        'crf_value': 'HIGH',
+    }
+
+    maxrates = {
+        rendition: processor.build_encode_args(video_metadata, 1, rendition=rendition)['maxrate']
+        for rendition in ('FHD_1080', 'HD_720', 'MOBILE_360')
+    }
+
+    assert maxrates == {
+        rendition: str(processor.ladder_bitrate(video_metadata, rendition))
+        for rendition in maxrates
+    }
+    assert len(set(maxrates.values())) == 3
+
+def test_skipped_chunk_refills_the_queue(redis_conn, monkeypatch):
+    video_id = 'already-done'
+    redis_conn.hset(f"video:{video_id}:chunks", 'chunk_000.mp4', 'processed')
+    dispatched = []
+    monkeypatch.setattr(processor, 'dispatch', lambda *args: dispatched.append(args))
+
+    result = processor.process_chunk_task({'chunk_id': 'chunk_000.mp4', 'chunk_path': 'unused'}, video_id)
+
+    assert result['status'] == 'skipped'
+    assert len(dispatched) == 1
+
+def test_only_the_current_lease_holder_completes_a_chunk(redis_conn):
+    video_id = 'reassigned-chunk'
+    chunk_id = 'chunk_000.mp4'
+    redis_conn.hset(f"video:{video_id}:chunks", chunk_id, 'pending')
+    redis_conn.set(f"video:{video_id}:remaining", 1)
+    assert processor.acquire_lease(video_id, chunk_id, 'first')
+
+    # The first holder's lease expires and another processor takes the chunk
+    redis_conn.zadd(processor.LEASES_KEY, {processor.lease_member(video_id, chunk_id): 0})
+    assert processor.acquire_lease(video_id, chunk_id, 'second')
+
+    assert processor.complete_lease(video_id, chunk_id, 'first') == -1
+    assert redis_conn.hget(f"video:{video_id}:chunks", chunk_id) == b'leased'
+    assert redis_conn.get(f"video:{video_id}:remaining") == b'1'
+
+    assert processor.complete_lease(video_id, chunk_id, 'second') == 1
+    assert redis_conn.hget(f"video:{video_id}:chunks", chunk_id) == b'processed'
+    assert redis_conn.zcard(processor.LEASES_KEY) == 0
+    assert processor.complete_lease(video_id, chunk_id, 'second') == 0
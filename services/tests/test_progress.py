@@ -0,0 +1,36 @@
+import json
+
+from common import progress
+
+def next_message(pubsub):
+    # The subscribe confirmation is read (and dropped) by the first call
+    for _ in range(3):
+        message = pubsub.get_message(timeout=0.1)
+        if message is not None:
+            return message
+    return None
+
+def test_events_are_published_as_the_video_snapshot(redis_conn):
+    video_id = 'streaming-video'
+    redis_conn.hset(f"video:{video_id}", mapping={'status': 'processing', 'chunk_total': 4})
+    redis_conn.hset(f"video:{video_id}:chunks", mapping={'chunk_000.mp4': 'processed', 'chunk_001.mp4': 'leased'})
+    pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(progress.progress_channel(video_id))
+
+    progress.set_chunk_progress(redis_conn, video_id, 'chunk_001.mp4', 50)
+
+    message = json.loads(next_message(pubsub)['data'])
+    assert message == {
+        **progress.progress_snapshot(redis_conn, video_id),
+        'event': {'chunk_id': 'chunk_001.mp4', 'chunk_percent': 50.0},
+    }
+    assert message['chunks_done'] == 1
+    assert message['percent'] == 37.5
+
+def test_unknown_videos_publish_nothing(redis_conn):
+    pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(progress.PROGRESS_CHANNEL)
+
+    progress.publish_progress(redis_conn, 'no-such-video', stage='chunking')
+
+    assert next_message(pubsub) is None
@@ -0,0 +1,17 @@
+from rq import Queue
+
+from common.scheduler import (
+    CHUNKING_TIMEOUT_BASE_S, PROCESSING_JOB_TIMEOUT, chunking_job_timeout, dispatch, submit_chunk,
+)
+
+def test_chunking_timeout_grows_with_the_upload_size():
+    assert chunking_job_timeout(None) == CHUNKING_TIMEOUT_BASE_S
+    assert chunking_job_timeout(b'1024') >= CHUNKING_TIMEOUT_BASE_S
+    assert chunking_job_timeout(8 * 1024 ** 3) > chunking_job_timeout(1024 ** 3) > 180
+
+def test_dispatched_jobs_carry_the_processing_timeout(redis_conn):
+    queue = Queue('processing_jobs', connection=redis_conn)
+    submit_chunk(redis_conn, 'video1', {'chunk_id': 'chunk_000'}, 1.0)
+
+    assert dispatch(redis_conn, queue, 'processor.process_chunk_task', 10) == 1
+    assert queue.jobs[0].timeout == PROCESSING_JOB_TIMEOUT
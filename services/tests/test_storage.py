@@ -0,0 +1,75 @@
+import io
+import os
+
+import pytest
+
+from common.storage import S3Storage
+
+moto = pytest.importorskip('moto')
+
+@pytest.fixture
+def s3_storage(tmp_path, monkeypatch):
+    """S3Storage against moto's in-process S3, staging under tmp_path."""
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    with moto.mock_aws():
+        yield S3Storage(str(tmp_path), 'clipcrunch-test')
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+def test_store_release_and_fetch_round_trip(s3_storage):
+    key = 'unprocessed_chunks/video/chunk_000.mp4'
+    write(s3_storage.path(key), b'chunk bytes')
+
+    s3_storage.store(key)
+    s3_storage.release(key)
+
+    assert not os.path.exists(s3_storage.path(key))
+    assert s3_storage.exists(key)
+    with open(s3_storage.fetch(key), 'rb') as f:
+        assert f.read() == b'chunk bytes'
+
+def test_store_stream_uploads_without_staging(s3_storage):
+    key = 'temp_uploads/video.mp4'
+
+    s3_storage.store_stream(key, io.BytesIO(b'0123456789'))
+
+    assert not os.path.exists(s3_storage.path(key))
+    assert b''.join(s3_storage.read_range(key)) == b'0123456789'
+
+def test_read_range_returns_only_the_requested_bytes(s3_storage):
+    key = 'processed_videos/video.mp4'
+    s3_storage.store_stream(key, io.BytesIO(b'0123456789'))
+
+    assert b''.join(s3_storage.read_range(key, 2, 5)) == b'234'
+    assert b''.join(s3_storage.read_range(key, 7)) == b'789'
+    assert not os.path.exists(s3_storage.path(key))
+
+def test_missing_objects_raise_file_not_found(s3_storage):
+    with pytest.raises(FileNotFoundError):
+        s3_storage.fetch('processed_chunks/missing.mp4')
+    with pytest.raises(FileNotFoundError):
+        list(s3_storage.read_range('processed_chunks/missing.mp4'))
+
+def test_delete_prefix_removes_objects_under_the_prefix_only(s3_storage):
+    for key in ('processed_chunks/video/a.mp4', 'processed_chunks/video/b.mp4', 'processed_chunks/video_other/c.mp4'):
+        s3_storage.store_stream(key, io.BytesIO(b'12345'))
+
+    freed = s3_storage.delete_prefix('processed_chunks/video')
+
+    assert freed == 10
+    assert not s3_storage.exists('processed_chunks/video/a.mp4')
+    assert s3_storage.exists('processed_chunks/video_other/c.mp4')
+
+def test_input_url_reads_the_object_without_staging_it(s3_storage):
+    key = 'temp_uploads/video.mp4'
+    s3_storage.store_stream(key, io.BytesIO(b'0123456789'))
+
+    url = s3_storage.input_url(key)
+
+    assert url.startswith('https://') and 'clipcrunch-test' in url and 'Signature' in url
+    assert not os.path.exists(s3_storage.path(key))
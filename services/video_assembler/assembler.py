@@ -1,7 +1,15 @@
 import os
+import math
 import redis
 from rq import Worker, Queue
-from ffmpeg import input as ffmpeg_input
+from ffmpeg import input as ffmpeg_input, output as ffmpeg_output
+from common.cache import ContentCache, source_cache_key
+from common.renditions import video_renditions, rendition_subdir, final_video_filename, ladder_bitrate, fitted_size
+from common.heartbeat import start_heartbeat, update_node
+from common.metrics import timed, record_queue_wait, start_metrics_server
+from common.progress import set_stage, publish_progress
+from common.storage import get_storage
+from common.lifecycle import reclaim_video, start_reclaimer, GC_FAILED_RETENTION_S
 
 # ===================
 # Configuration
@@ -12,12 +20,46 @@ REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
 
 ASSEMBLY_QUEUE = os.getenv('QUEUE_NAME', 'assembly_jobs')
 
-PROCESSED_CHUNKS_DIR = '/app/processed_chunks'
-FINAL_VIDEOS_DIR = '/app/processed_videos'
+# Shared object storage (see common/storage.py)
+storage = get_storage()
+
+PROCESSED_CHUNKS_DIR = storage.path('processed_chunks')
+FINAL_VIDEOS_DIR = storage.path('processed_videos')
+
+# Streaming assembly: each contiguous processed prefix is published as HLS
+# segments under processed_videos/<id>/ while the rest is still encoding.
+# The segment tree is kept after the final MP4 is written: it is what players
+# stream (and switch ladder rungs on), while the MP4 is the download and the
+# entry the video cache hands to identical uploads.
+HLS_PLAYLIST_NAME = 'index.m3u8'
+HLS_MASTER_PLAYLIST_NAME = 'master.m3u8'
+
+# Each chunk becomes one fragmented-MP4 segment; the hls muxer is given a
+# segment length no chunk reaches so it never splits one
+HLS_SINGLE_SEGMENT_TIME_S = 24 * 60 * 60
+ASSEMBLY_LOCK_TIMEOUT_S = 600
+
+# The final MP4 is fragmented: written in one streaming pass with an empty
+# moov up front, so it plays progressively without a +faststart rewrite
+FINAL_MP4_MOVFLAGS = '+frag_keyframe+empty_moov+default_base_moof'
+
+# Whole-video cache of finished outputs, consulted by the chunker
+VIDEO_CACHE_MAX_MB = int(os.getenv('VIDEO_CACHE_MAX_MB', 10240))
 
 redis_conn = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
 assembly_queue = Queue(ASSEMBLY_QUEUE, connection=redis_conn)
 
+video_cache = ContentCache(redis_conn, storage, 'processed_videos', 'videos', VIDEO_CACHE_MAX_MB * 1024 * 1024)
+
+RENDITION_SIZES = {
+    'UHD_4K': (3840, 2160),
+    'QHD_2K': (2560, 1440),
+    'FHD_1080': (1920, 1080),
+    'HD_720': (1280, 720),
+    'SD_480': (854, 480),
+    'MOBILE_360': (640, 360),
+}
+
 # ===================
 # Helper Functions
 # ===================
@@ -26,65 +68,331 @@ def ensure_dir(directory):
     """Create directory if it doesn't exist."""
     os.makedirs(directory, exist_ok=True)
 
+def get_video_metadata(video_id):
+    video_metadata = redis_conn.hgetall(f"video:{video_id}")
+    return {key.decode(): value.decode() for key, value in video_metadata.items()}
+
+def chunk_index(chunk_id):
+    """Position of a chunk in the video, from its 'chunk_<n>.mp4' name."""
+    return int(os.path.splitext(chunk_id)[0].rsplit('_', 1)[1])
+
+def ordered_chunks(video_id):
+    """
+    Known chunks of a video as (chunk_id, status), in playback order. Sorted
+    by index, not name: past chunk_999 the zero padding no longer lines up.
+    """
+    chunks = redis_conn.hgetall(f"video:{video_id}:chunks")
+    return sorted(((key.decode(), value.decode()) for key, value in chunks.items()), key=lambda chunk: chunk_index(chunk[0]))
+
+def chunk_timing(video_id, chunk_id):
+    """(start_pts, duration) recorded for a chunk by the chunker."""
+    timing = redis_conn.hmget(f"video:{video_id}:chunk:{chunk_id}", 'start_pts', 'duration')
+    return float(timing[0] or 0), float(timing[1] or 0)
+
+def hls_dir(video_id, video_metadata, rendition):
+    return os.path.join(FINAL_VIDEOS_DIR, video_id, rendition_subdir(video_metadata, rendition))
+
+def segment_name(index):
+    return f"segment_{index:05d}.m4s"
+
+def init_segment_name(index):
+    return f"init_{index:05d}.mp4"
+
+def processed_chunk_path(video_id, video_metadata, rendition, chunk_id):
+    """Where the processor stored one rendition of a chunk."""
+    return os.path.join(PROCESSED_CHUNKS_DIR, video_id, rendition_subdir(video_metadata, rendition), f"processed_{chunk_id}")
+
+def write_file_atomic(path, content):
+    """Replace a small text file so readers never see it half written, then store it."""
+    ensure_dir(os.path.dirname(path))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    storage.store_file(path)
+    storage.release_file(path)
+
+def write_media_playlist(playlist_dir, durations, ended):
+    """
+    Write the HLS playlist for the segments published so far. Every chunk is
+    an independent encode with its own init segment, so each segment gets
+    its own EXT-X-MAP and is marked as a discontinuity.
+    """
+    target_duration = max([math.ceil(d) for d in durations] or [1])
+    lines = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:7',
+        f'#EXT-X-TARGETDURATION:{target_duration}',
+        '#EXT-X-MEDIA-SEQUENCE:0',
+        f'#EXT-X-PLAYLIST-TYPE:{"VOD" if ended else "EVENT"}',
+    ]
+    for index, duration in enumerate(durations):
+        if index:
+            lines.append('#EXT-X-DISCONTINUITY')
+        lines.append(f'#EXT-X-MAP:URI="{init_segment_name(index)}"')
+        lines.append(f'#EXTINF:{duration:.6f},')
+        lines.append(segment_name(index))
+    if ended:
+        lines.append('#EXT-X-ENDLIST')
+    write_file_atomic(os.path.join(playlist_dir, HLS_PLAYLIST_NAME), '\n'.join(lines) + '\n')
+
+def write_master_playlist(video_id, video_metadata, renditions):
+    """
+    Point players at every rendition of a ladder, advertising the bitrate
+    each rung was encoded at and its size once fitted to the source.
+    """
+    lines = ['#EXTM3U']
+    for rendition in renditions:
+        bandwidth = ladder_bitrate(video_metadata, rendition)
+        width, height = RENDITION_SIZES[rendition]
+        if video_metadata.get('source_width') and video_metadata.get('source_height'):
+            width, height = fitted_size(int(video_metadata['source_width']), int(video_metadata['source_height']), width, height)
+        lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={width}x{height}')
+        lines.append(f'{rendition}/{HLS_PLAYLIST_NAME}')
+    write_file_atomic(os.path.join(FINAL_VIDEOS_DIR, video_id, HLS_MASTER_PLAYLIST_NAME), '\n'.join(lines) + '\n')
+
+def audio_track_path(video_id):
+    """The single encoded audio track of a video, shared by every rendition."""
+    return os.path.join(PROCESSED_CHUNKS_DIR, video_id, 'audio.mka')
+
+def audio_track_ready(video_id, video_metadata):
+    """
+    Whether segments can be published: True for silent videos, otherwise
+    once the audio track has been encoded.
+    """
+    if video_metadata.get('has_audio') != '1':
+        return True
+    return redis_conn.hget(f"video:{video_id}:tracks", "audio") == b'processed'
+
+def publish_segment(chunk_path, audio_path, playlist_dir, index, start_pts, duration):
+    """
+    Remux one processed (video-only) chunk into the fragmented-MP4 HLS
+    segment and init segment for position index, placed at its original
+    position on the timeline. The matching range of the encoded audio track
+    is muxed in. Unlike MPEG-TS, fMP4 carries VP9/AV1 and FLAC/Opus as well
+    as H.264/HEVC and AAC/MP3. Returns the bytes written.
+    """
+    video = ffmpeg_input(storage.fetch_file(chunk_path)).video
+    streams = [video]
+    if audio_path:
+        streams.append(ffmpeg_input(storage.fetch_file(audio_path), ss=start_pts, t=duration).audio)
+
+    # The hls muxer writes the init segment next to its playlist; that
+    # playlist only ever lists this one segment and is thrown away
+    segment_path = os.path.join(playlist_dir, segment_name(index))
+    init_path = os.path.join(playlist_dir, init_segment_name(index))
+    scratch_playlist_path = os.path.join(playlist_dir, f".segment_{index:05d}.m3u8")
+    (
+        ffmpeg_output(
+            *streams, scratch_playlist_path,
+            c='copy',
+            f='hls',
+            hls_segment_type='fmp4',
+            hls_fmp4_init_filename=init_segment_name(index),
+            hls_segment_filename=segment_path,
+            hls_time=HLS_SINGLE_SEGMENT_TIME_S,
+            hls_list_size=0,
+            output_ts_offset=start_pts
+        )
+        .overwrite_output()
+        .run(quiet=True)
+    )
+    os.remove(scratch_playlist_path)
+
+    written = 0
+    for path in (init_path, segment_path):
+        written += os.path.getsize(path)
+        storage.store_file(path)
+        storage.release_file(path)
+    return written
+
+def append_ready_chunks(video_id, video_metadata):
+    """
+    Publish every processed chunk that extends the contiguous assembled
+    prefix and refresh the playlists. Returns the segment durations published
+    so far. Must be called with the video's assembly lock held.
+    """
+    renditions = video_renditions(video_metadata)
+    assembled_key = f"video:{video_id}:assembled"
+    assembled = int(redis_conn.get(assembled_key) or 0)
+    chunks = ordered_chunks(video_id)
+
+    # Segments carry audio, so nothing is published until the track is encoded
+    ready = audio_track_ready(video_id, video_metadata)
+    audio_path = audio_track_path(video_id) if video_metadata.get('has_audio') == '1' else None
+
+    while ready and assembled < len(chunks) and chunks[assembled][1] == 'processed':
+        chunk_id = chunks[assembled][0]
+        start_pts, duration = chunk_timing(video_id, chunk_id)
+        with timed(redis_conn, 'assembler', 'publish_segment', video_id, chunk_id) as stage:
+            stage['bytes_in'] = stage['bytes_out'] = 0
+            for rendition in renditions:
+                chunk_path = processed_chunk_path(video_id, video_metadata, rendition, chunk_id)
+                playlist_dir = hls_dir(video_id, video_metadata, rendition)
+                ensure_dir(playlist_dir)
+                stage['bytes_out'] += publish_segment(chunk_path, audio_path, playlist_dir, assembled, start_pts, duration)
+                stage['bytes_in'] += os.path.getsize(chunk_path)
+        assembled += 1
+        redis_conn.set(assembled_key, assembled)
+
+    durations = [chunk_timing(video_id, chunk_id)[1] for chunk_id, _ in chunks[:assembled]]
+    return durations
+
 # ===================
-# Main Worker Task
+# Main Worker Tasks
 # ===================
 
+def append_chunks_task(video_id):
+    """
+    Incremental assembly: publish the newly contiguous processed prefix as
+    HLS segments. Enqueued by processors after every chunk.
+    """
+    record_queue_wait(redis_conn, 'assembler', video_id)
+    try:
+        with redis_conn.lock(f"video:{video_id}:assembly_lock", timeout=ASSEMBLY_LOCK_TIMEOUT_S):
+            video_metadata = get_video_metadata(video_id)
+
+            # A late append (a racing replica, the audio task's append or a
+            # stale duplicate chunk) must not reopen the finished VOD playlist
+            if video_metadata.get('finalized') == '1':
+                print(f"[Assembler] ⏭️ Already finalized, skipping append for video_id: {video_id}")
+                return {"status": "skipped"}
+            set_stage(redis_conn, video_id, 'assembling')
+
+            durations = append_ready_chunks(video_id, video_metadata)
+
+            renditions = video_renditions(video_metadata)
+            if durations:
+                for rendition in renditions:
+                    write_media_playlist(hls_dir(video_id, video_metadata, rendition), durations, ended=False)
+            if len(renditions) > 1 and durations:
+                write_master_playlist(video_id, video_metadata, renditions)
+
+        publish_progress(redis_conn, video_id, segments=len(durations))
+        print(f"[Assembler] 📼 {len(durations)} segment(s) published for video_id: {video_id}")
+        return {"status": "success", "segments": len(durations)}
+
+    except Exception as e:
+        print(f"[Assembler] ❌ Error during incremental assembly: {str(e)}")
+        return {"status": "error", "error": str(e)}
+
+def finalize_rendition(chunk_paths, audio_path, final_video_path):
+    """
+    Produce the downloadable MP4 from one rendition's processed chunks, in
+    playback order. Chunks are cut on keyframes and each starts at zero, so
+    the concat demuxer lays them end to end; the audio comes from the one
+    continuous encoded track, so there are no seams in it. This is a single
+    stream copy into a fragmented MP4; nothing is re-encoded or rewritten.
+    """
+    # Chunks may have been encoded on other nodes
+    concat_list_path = f"{final_video_path}.concat.txt"
+    with open(concat_list_path, 'w') as f:
+        for chunk_path in chunk_paths:
+            f.write(f"file '{storage.fetch_file(chunk_path)}'\n")
+
+    streams = [ffmpeg_input(concat_list_path, format='concat', safe=0).video]
+    if audio_path:
+        streams.append(ffmpeg_input(storage.fetch_file(audio_path)).audio)
+    (
+        ffmpeg_output(*streams, final_video_path, c='copy', movflags=FINAL_MP4_MOVFLAGS)
+        .overwrite_output()
+        .run()
+    )
+    storage.store_file(final_video_path)
+
+    # Cleanup
+    os.remove(concat_list_path)
+
 def assemble_video_task(video_id):
     """
-    Assemble all processed chunks of a video into a final output video.
+    Finalize a video once every chunk is processed: publish any remaining
+    segments, close the playlists and write the final MP4, one output per
+    requested rendition.
     """
+    update_node(redis_conn, current_job=f"assemble:{video_id}")
+    record_queue_wait(redis_conn, 'assembler', video_id)
     try:
         print(f"[Assembler] 🚀 Starting assembly for video_id: {video_id}")
 
-        chunks_folder = os.path.join(PROCESSED_CHUNKS_DIR, video_id)
-        if not os.path.exists(chunks_folder):
-            raise FileNotFoundError(f"Processed chunks folder not found for video_id: {video_id}")
-
         final_output_folder = FINAL_VIDEOS_DIR
         ensure_dir(final_output_folder)
 
-        # Collect all processed chunks
-        chunk_files = sorted([
-            f for f in os.listdir(chunks_folder)
-            if f.startswith('processed_') and f.endswith('.mp4')
-        ])
-
-        if not chunk_files:
-            raise ValueError(f"No processed chunks found for video_id: {video_id}")
-
-        concat_list_path = os.path.join(chunks_folder, 'concat_list.txt')
-        with open(concat_list_path, 'w') as f:
-            for chunk_file in chunk_files:
-                f.write(f"file '{os.path.join(chunks_folder, chunk_file)}'\n")
-
-        # Define final output path
-        final_video_path = os.path.join(final_output_folder, f"{video_id}.mp4")
-
-        # Run ffmpeg to concatenate
-        (
-            ffmpeg_input(concat_list_path, format='concat', safe=0)
-            .output(final_video_path, c='copy')
-            .overwrite_output()
-            .run()
-        )
+        # Under the lock only the playlists are closed; the MP4s are written
+        # after it is released, so a long video cannot outlive the lock
+        with redis_conn.lock(f"video:{video_id}:assembly_lock", timeout=ASSEMBLY_LOCK_TIMEOUT_S):
+            video_metadata = get_video_metadata(video_id)
+            if video_metadata.get('finalized') == '1':
+                print(f"[Assembler] ⏭️ Already finalized, skipping assembly for video_id: {video_id}")
+                return {"status": "skipped"}
+            set_stage(redis_conn, video_id, 'assembling')
+
+            durations = append_ready_chunks(video_id, video_metadata)
+            if not durations or len(durations) != len(ordered_chunks(video_id)):
+                raise ValueError(f"Not every chunk is processed for video_id: {video_id}")
+
+            renditions = video_renditions(video_metadata)
+            for rendition in renditions:
+                write_media_playlist(hls_dir(video_id, video_metadata, rendition), durations, ended=True)
+            if len(renditions) > 1:
+                write_master_playlist(video_id, video_metadata, renditions)
 
-        # Cleanup
-        os.remove(concat_list_path)
+            # Set under the lock, so every append or assembly that runs after
+            # this sees it and leaves the video alone
+            redis_conn.hset(f"video:{video_id}", "finalized", 1)
 
-        print(f"[Assembler] ✅ Final video created at: {final_video_path}")
-        return {"status": "success", "output_path": final_video_path}
+        # Every chunk is in and nothing else touches the video now
+        audio_path = audio_track_path(video_id) if video_metadata.get('has_audio') == '1' else None
+        chunk_ids = [chunk_id for chunk_id, _ in ordered_chunks(video_id)]
+        final_video_paths = []
+        for rendition in renditions:
+            final_video_path = os.path.join(final_output_folder, final_video_filename(video_id, video_metadata, rendition))
+            with timed(redis_conn, 'assembler', 'finalize', video_id) as stage:
+                stage['rendition'] = rendition
+                chunk_paths = [processed_chunk_path(video_id, video_metadata, rendition, chunk_id) for chunk_id in chunk_ids]
+                finalize_rendition(chunk_paths, audio_path, final_video_path)
+                stage['bytes_out'] = os.path.getsize(final_video_path)
+
+            # Make the output available to future uploads of the same source + parameters
+            if video_metadata.get('source_hash'):
+                video_cache.put(source_cache_key(video_metadata['source_hash'], video_metadata, rendition), final_video_path)
+            storage.release_file(final_video_path)
+            for chunk_path in chunk_paths:
+                storage.release_file(chunk_path)
+
+            final_video_paths.append(final_video_path)
+            print(f"[Assembler] ✅ Final video created at: {final_video_path}")
+
+        if audio_path:
+            storage.release_file(audio_path)
+
+        redis_conn.hset(f"video:{video_id}", "status", "done")
+        set_stage(redis_conn, video_id, 'done')
+
+        # Outputs are stored: the audio track, anything left of the chunk
+        # stages and (for virtual chunks) the upload can go
+        reclaim_video(redis_conn, storage, video_id)
+
+        return {"status": "success", "output_paths": final_video_paths}
 
     except Exception as e:
         print(f"[Assembler] ❌ Error during assembly: {str(e)}")
+        set_stage(redis_conn, video_id, 'error')
+        reclaim_video(redis_conn, storage, video_id, GC_FAILED_RETENTION_S)
         return {"status": "error", "error": str(e)}
 
+    finally:
+        update_node(redis_conn, current_job=None)
+
 # ===================
 # Worker Bootstrap
 # ===================
 
 def start_worker():
     """Start RQ worker to listen for assembly jobs."""
+    start_heartbeat(redis_conn, 'assembler')
+    start_metrics_server(redis_conn)
+    start_reclaimer(redis_conn, storage)
+
     q = Queue(ASSEMBLY_QUEUE, connection=redis_conn)
     worker = Worker(queues=[q], connection=redis_conn)
     print(f"[Assembler] 🎧 Worker started, listening on queue: {ASSEMBLY_QUEUE}")
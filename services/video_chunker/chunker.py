@@ -1,8 +1,22 @@
 import os
+import csv
+import json
+import enum
+import bisect
+import math
 import uuid
 import subprocess
+import time
 import redis
 from rq import Worker, Queue
+from common.cache import ContentCache, file_sha256, params_fingerprint, source_cache_key
+from common.renditions import video_renditions, final_video_filename
+from common.scheduler import submit_chunk, dispatch, estimate_chunk_cost, video_priority, RESOLUTION_PIXELS, PROCESSING_JOB_TIMEOUT, chunking_job_timeout
+from common.heartbeat import start_heartbeat, update_node, live_node_count
+from common.metrics import timed, record_queue_wait, start_metrics_server
+from common.progress import set_stage
+from common.storage import get_storage
+from common.lifecycle import reclaim, reclaim_video, wait_for_disk, start_reclaimer, GC_FAILED_RETENTION_S
 
 # ===================
 # Configuration
@@ -14,17 +28,153 @@ REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
 CHUNKING_QUEUE = os.getenv('QUEUE_NAME', 'chunking_jobs')
 PROCESSING_QUEUE = 'processing_jobs'
 
-TEMP_UPLOADS_DIR = '/app/temp_uploads'
-UNPROCESSED_CHUNKS_DIR = '/app/unprocessed_chunks'
+# Shared object storage (see common/storage.py); directories are local paths
+# under its root that are fetched from / stored to the backend
+storage = get_storage()
 
-TARGET_CHUNK_SIZE_MB = 4  # Default chunk size (in MB)
+TEMP_UPLOADS_DIR = storage.path('temp_uploads')
+UNPROCESSED_CHUNKS_DIR = storage.path('unprocessed_chunks')
+FINAL_VIDEOS_DIR = storage.path('processed_videos')
 
+# Whole-video cache of finished outputs, shared with the assembler
+VIDEO_CACHE_MAX_MB = int(os.getenv('VIDEO_CACHE_MAX_MB', 10240))
+
+TARGET_CHUNK_SIZE_MB = 4  # Chunk size (in MB) when the source duration is unknown
+
+# Adaptive chunk sizing, used when a job does not set chunk_size. The chunk
+# count aims for a few chunks per live processor (capped by the job's
+# max_nodes) so the last chunks to finish are short, within bounds that keep
+# per-chunk overhead (process spawn, redis round trips, volume I/O) small
+# next to the encode itself and keep any one chunk from being huge.
+CHUNKS_PER_WORKER = int(os.getenv('CHUNKS_PER_WORKER', 3))
+ASSUMED_WORKERS = 4  # Planned for when no processor is registered yet
+MIN_CHUNK_S = 2.0
+MAX_CHUNK_S = float(os.getenv('MAX_CHUNK_S', 120))
+MIN_CHUNK_MB = 1
+MAX_CHUNK_MB = int(os.getenv('MAX_CHUNK_MB', 512))
+
+# Least encode work worth a chunk, in estimate_chunk_cost units (seconds x
+# output megapixels x preset effort): ~4s of 1080p at 'medium'
+MIN_CHUNK_COST = 8.0
+
+# Decode cost of one source megapixel relative to encoding it at 'medium'
+SOURCE_DECODE_COST = 0.1
+
+# Chunking mode:
+#   size     - cut on keyframes into chunks of roughly equal byte size
+#   duration - cut on keyframes into chunks of roughly equal duration
+#   cost     - cut on keyframes into chunks of roughly equal estimated encode cost
+CHUNK_MODE = os.getenv('CHUNK_MODE', 'size')
+CHUNK_MODES = ('size', 'duration', 'cost')
+
+# Cut times are nudged back by this much so float rounding in ffprobe output
+# never pushes a cut past the keyframe it was meant to land on.
+KEYFRAME_CUT_EPSILON = 0.001
+
+# Virtual chunks: plan keyframe-aligned time ranges instead of writing chunk
+# files, and let each processor decode its range from the upload. Saves a
+# full read + write of every upload and the split latency.
+VIRTUAL_CHUNKS = os.getenv('VIRTUAL_CHUNKS', '0') == '1'
+
+# Complexity-aware rate allocation: every chunk is scored from the source's
+# coded bits per second over its range (relative to the whole video) and
+# given a rate_scale, its share of the video's bitrate budget. Scales are
+# clamped so no chunk starves or runs away with the budget, then normalized
+# so their duration-weighted mean is 1.0 and the video keeps its bitrate
+COMPLEXITY_ALLOCATION = os.getenv('COMPLEXITY_ALLOCATION', '1') == '1'
+RATE_SCALE_MIN = 0.5
+RATE_SCALE_MAX = 2.0
+
+# Target-size mode (job option target_size_mb): a few short samples are
+# trial-encoded at several CRFs and the CRF expected to hit the requested
+# size is interpolated from them before any chunk is enqueued
+TARGET_SIZE_SAMPLES = 3
+TARGET_SIZE_SAMPLE_S = 2.0
+TARGET_SIZE_TRIAL_CRFS = (20, 28, 36)
+TARGET_SIZE_CRF_RANGE = (10.0, 51.0)
+TARGET_SIZE_HEADROOM = 0.97  # Leave room for container overhead
+TARGET_SIZE_PEAK_FACTOR = 2.0  # Rate cap relative to the target average bitrate
+
+# Remux-only fast path: sources that already meet the requested profile are
+# remuxed with faststart instead of going through chunk -> encode -> assemble
+REMUX_FAST_PATH = os.getenv('REMUX_FAST_PATH', '1') == '1'
+
+# Chunks wait in the scheduler and are moved onto processing_jobs a few at a
+# time, so this many jobs at most sit in the FIFO queue
+SCHEDULER_QUEUE_DEPTH = int(os.getenv('SCHEDULER_QUEUE_DEPTH', 10))
+
+# How often the segment list is polled for newly closed chunks while splitting
+SEGMENT_POLL_INTERVAL_S = 0.25
+
+# Longest a job holds the worker waiting for disk space (see
+# common/lifecycle.py) before it goes to the back of the queue
+DISK_PAUSE_MAX_WAIT_S = 60
+
+CHUNKER_SERVICE_METHOD = 'chunker.chunk_video_task'
 PROCESSOR_SERVICE_METHOD = 'processor.process_chunk_task'
+PROCESSOR_AUDIO_METHOD = 'processor.process_audio_task'
+ASSEMBLER_SERVICE_METHOD = 'assembler.assemble_video_task'
+
+# RQ timeout of assembly jobs; finalizing a long video outlasts RQ's 180s default
+ASSEMBLY_JOB_TIMEOUT = int(os.getenv('ASSEMBLY_JOB_TIMEOUT', 3600))
 
 redis_conn = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
 
 chunking_queue = Queue(CHUNKING_QUEUE, connection=redis_conn)
 processing_queue = Queue(PROCESSING_QUEUE, connection=redis_conn)
+assembly_queue = Queue('assembly_jobs', connection=redis_conn)
+
+video_cache = ContentCache(redis_conn, storage, 'processed_videos', 'videos', VIDEO_CACHE_MAX_MB * 1024 * 1024)
+
+# ===================
+# Target profiles (mirrors the processor's presets)
+# ===================
+
+class Resolution(enum.Enum):
+    UHD_4K = (3840, 2160)
+    QHD_2K = (2560, 1440)
+    FHD_1080 = (1920, 1080)
+    HD_720 = (1280, 720)
+    SD_480 = (854, 480)
+    MOBILE_360 = (640, 360)
+
+class VideoBitrate(enum.Enum):
+    ULTRA = "8M"
+    HIGH = "4M"
+    STANDARD = "2M"
+    LOW = "1M"
+    MOBILE = "500k"
+
+class AudioBitrate(enum.Enum):
+    HIGH = "192k"
+    STANDARD = "128k"
+    LOW = "64k"
+
+# ffprobe codec_name of streams each VideoCodec / AudioCodec produces
+PROBED_VIDEO_CODECS = {
+    'H264': 'h264',
+    'H265': 'hevc',
+    'VP8': 'vp8',
+    'VP9': 'vp9',
+    'AV1': 'av1',
+    'MPEG4': 'mpeg4',
+}
+
+PROBED_AUDIO_CODECS = {
+    'AAC': 'aac',
+    'MP3': 'mp3',
+    'OPUS': 'opus',
+    'VORBIS': 'vorbis',
+    'FLAC': 'flac',
+    'PCM_S16LE': 'pcm_s16le',
+}
+
+# Codecs whose CRF -> size curve is fitted from trial encodes in target-size
+# mode; other codecs are capped at the target average bitrate instead
+TRIAL_ENCODERS = {
+    'H264': 'libx264',
+    'H265': 'libx265',
+}
 
 # ===================
 # Helper Functions
@@ -34,75 +184,765 @@ def ensure_dir(directory):
     """Create directory if it doesn't exist."""
     os.makedirs(directory, exist_ok=True)
 
+def probe_keyframes(video_path):
+    """
+    Read the packet index of the first video stream once with ffprobe.
+
+    Returns (keyframes, duration) where keyframes is a list of
+    (pts_time, gop_bytes) tuples - one per keyframe, with the number of
+    bytes in the GOP it starts - and duration is the stream length in
+    seconds: where the last frame ends, not where it starts.
+    """
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,duration_time,size,flags',
+        '-of', 'csv=p=0',
+        video_path
+    ]
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+
+    keyframes = []
+    end_pts = 0.0
+    for line in result.stdout.splitlines():
+        # ffprobe writes the fields in its own order: pts_time,duration_time,size,flags
+        fields = line.strip().split(',')
+        if len(fields) < 4 or fields[0] in ('', 'N/A'):
+            continue
+        pts_time, size, flags = float(fields[0]), int(fields[2]), fields[3]
+        packet_duration = float(fields[1]) if fields[1] not in ('', 'N/A') else 0.0
+        end_pts = max(end_pts, pts_time + packet_duration)
+        if 'K' in flags:
+            keyframes.append([pts_time, 0])
+        if keyframes:
+            keyframes[-1][1] += size
+
+    keyframes.sort(key=lambda k: k[0])
+    return [tuple(k) for k in keyframes], end_pts
+
+def plan_keyframe_cuts(keyframes, duration, chunk_count, mode='duration', video_metadata=None):
+    """
+    Pick keyframe timestamps that split the video into chunk_count chunks of
+    roughly equal duration ('duration'), byte size ('size') or estimated
+    encode cost ('cost').
+
+    Encode cost of a GOP is the scheduler's estimate for its duration at the
+    job's renditions and preset, scaled by the GOP's bitrate relative to the
+    source average (clamped to [RATE_SCALE_MIN, RATE_SCALE_MAX]): busier
+    content takes more work to re-encode.
+    """
+    if chunk_count <= 1 or len(keyframes) <= 1:
+        return []
+
+    if mode == 'cost':
+        renditions = video_renditions(video_metadata)
+        preset = video_metadata.get('preset')
+        mean_bytes_per_s = sum(gop_bytes for _, gop_bytes in keyframes) / duration if duration > 0 else 0
+
+    # Weight of each GOP in the chosen balancing metric
+    weights = []
+    for i, (pts_time, gop_bytes) in enumerate(keyframes):
+        next_pts = keyframes[i + 1][0] if i + 1 < len(keyframes) else duration
+        gop_duration = max(next_pts - pts_time, 0.0)
+        if mode == 'size':
+            weights.append(gop_bytes)
+        elif mode == 'cost':
+            complexity = 1.0
+            if gop_duration > 0 and mean_bytes_per_s > 0:
+                complexity = min(max(gop_bytes / gop_duration / mean_bytes_per_s, RATE_SCALE_MIN), RATE_SCALE_MAX)
+            weights.append(estimate_chunk_cost(gop_duration, renditions, preset) * complexity if gop_duration > 0 else 0.0)
+        else:
+            weights.append(gop_duration)
+
+    total = sum(weights)
+    if total <= 0:
+        return []
+
+    # Position of each keyframe along the balancing metric
+    positions = []
+    cumulative = 0.0
+    for weight in weights:
+        positions.append(cumulative)
+        cumulative += weight
+
+    # Cut at the keyframe closest to each ideal boundary
+    cuts = []
+    last_index = 0
+    for k in range(1, chunk_count):
+        target = total * k / chunk_count
+        i = bisect.bisect_left(positions, target)
+        if i > last_index + 1 and (i == len(positions) or target - positions[i - 1] <= positions[i] - target):
+            i -= 1
+        i = max(i, last_index + 1)
+        if i >= len(keyframes):
+            break
+        cuts.append(keyframes[i][0])
+        last_index = i
+
+    return cuts
+
+def plan_chunk_count(video_metadata, probe, file_size, duration, workers):
+    """
+    Number of chunks to cut a source of duration seconds and file_size bytes
+    into, for workers processors running in parallel.
+
+    Heavier encodes (more output pixels, slower presets, larger sources to
+    decode) can afford shorter chunks before the fixed per-chunk overhead
+    matters; high-bitrate sources are held to MAX_CHUNK_MB per chunk.
+    """
+    if duration <= 0:
+        return max(1, math.ceil(file_size / (TARGET_CHUNK_SIZE_MB * 1024 * 1024)))
+
+    source_pixels = 0
+    for stream in (probe or {}).get('streams', []):
+        if stream.get('codec_type') == 'video':
+            source_pixels = int(stream.get('width') or 0) * int(stream.get('height') or 0)
+            break
+    if not source_pixels:
+        source_pixels = RESOLUTION_PIXELS['FHD_1080']
+
+    cost_per_s = (
+        estimate_chunk_cost(1.0, video_renditions(video_metadata), video_metadata.get('preset'))
+        + SOURCE_DECODE_COST * source_pixels / 1e6
+    )
+    bytes_per_s = max(file_size / duration, 1)
+
+    # Shortest and longest chunk worth cutting
+    min_chunk_s = max(MIN_CHUNK_COST / cost_per_s, MIN_CHUNK_MB * 1024 * 1024 / bytes_per_s, MIN_CHUNK_S)
+    max_chunk_s = min(MAX_CHUNK_S, MAX_CHUNK_MB * 1024 * 1024 / bytes_per_s)
+
+    chunk_count = min(workers * CHUNKS_PER_WORKER, math.floor(duration / min_chunk_s))
+    # The upper bound on chunk size wins: it protects memory and the volume
+    chunk_count = max(chunk_count, math.ceil(duration / max_chunk_s), 1)
+    return chunk_count
+
+def chunk_complexity(keyframe_index, start_pts, chunk_duration):
+    """
+    Relative complexity of the range [start_pts, start_pts + chunk_duration):
+    the source's coded bytes per second over the range divided by the whole
+    video's, from the keyframe index (no decoding). 1.0 is an average chunk.
+
+    GOP bytes are taken as spread evenly over the GOP, so GOPs that straddle
+    the range count pro rata.
+    """
+    keyframes, duration = keyframe_index
+    total_bytes = sum(gop_bytes for _, gop_bytes in keyframes)
+    if total_bytes <= 0 or duration <= 0 or chunk_duration <= 0:
+        return 1.0
+
+    end_pts = start_pts + chunk_duration
+    first = max(bisect.bisect_right([pts_time for pts_time, _ in keyframes], start_pts) - 1, 0)
+    range_bytes = 0.0
+    for i in range(first, len(keyframes)):
+        pts_time, gop_bytes = keyframes[i]
+        if pts_time >= end_pts:
+            break
+        next_pts = keyframes[i + 1][0] if i + 1 < len(keyframes) else duration
+        overlap = min(end_pts, next_pts) - max(start_pts, pts_time)
+        if overlap > 0 and next_pts > pts_time:
+            range_bytes += gop_bytes * overlap / (next_pts - pts_time)
+
+    return (range_bytes / chunk_duration) / (total_bytes / duration)
+
+def plan_rate_scales(keyframe_index, starts, ends):
+    """
+    Score every planned chunk range and allocate it a rate scale. Returns a
+    list of (complexity, rate_scale), one per range.
+
+    Each scale is k * complexity clamped to [RATE_SCALE_MIN, RATE_SCALE_MAX],
+    with k found by bisection so the duration-weighted mean scale is 1.0:
+    clamping alone would let the chunks overshoot or undershoot the budget.
+    """
+    durations = [max(end_pts - start_pts, 0.0) for start_pts, end_pts in zip(starts, ends)]
+    complexities = [
+        chunk_complexity(keyframe_index, start_pts, chunk_duration)
+        for start_pts, chunk_duration in zip(starts, durations)
+    ]
+    total_duration = sum(durations)
+    if total_duration <= 0:
+        return [(complexity, 1.0) for complexity in complexities]
+
+    def scales(k):
+        return [min(max(k * complexity, RATE_SCALE_MIN), RATE_SCALE_MAX) for complexity in complexities]
+
+    def weighted_mean(k):
+        return sum(scale * d for scale, d in zip(scales(k), durations)) / total_duration
+
+    # The mean grows with k from RATE_SCALE_MIN to RATE_SCALE_MAX (or stays
+    # flat when every chunk is empty), so bracket 1.0 and bisect
+    low, high = 0.0, 1.0
+    while weighted_mean(high) < 1.0 and high < 1e6:
+        high *= 2
+    for _ in range(60):
+        mid = (low + high) / 2
+        if weighted_mean(mid) < 1.0:
+            low = mid
+        else:
+            high = mid
+
+    return [(complexity, round(scale, 4)) for complexity, scale in zip(complexities, scales(high))]
+
+def parse_bitrate(value):
+    """Convert an ffmpeg bitrate string such as '500k' or '2M' to bits/s."""
+    multipliers = {'k': 1000, 'M': 1000 * 1000}
+    if value[-1] in multipliers:
+        return int(float(value[:-1]) * multipliers[value[-1]])
+    return int(value)
+
+def probe_media(video_path):
+    """Stream and container properties of a file, as parsed ffprobe JSON."""
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-show_streams',
+        '-show_format',
+        '-of', 'json',
+        video_path
+    ]
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    return json.loads(result.stdout)
+
+def remux_blockers(probe, video_metadata):
+    """
+    Reasons the source needs re-encoding to meet the requested profile.
+    An empty list means a plain remux already satisfies the job.
+    """
+    if len(video_renditions(video_metadata)) > 1:
+        return ['multiple renditions requested']
+
+    streams = probe.get('streams', [])
+    video_streams = [st for st in streams if st.get('codec_type') == 'video']
+    audio_streams = [st for st in streams if st.get('codec_type') == 'audio']
+    if len(video_streams) != 1:
+        return ['source does not have exactly one video stream']
+
+    blockers = []
+    video = video_streams[0]
+    width, height = Resolution[video_metadata['resolution']].value
+    if video.get('width', 0) > width or video.get('height', 0) > height:
+        blockers.append('resolution above target')
+
+    if video.get('codec_name') != PROBED_VIDEO_CODECS.get(video_metadata.get('video_codec')):
+        blockers.append('video codec differs')
+
+    if video_metadata.get('target_size_mb'):
+        source_size = probe.get('format', {}).get('size')
+        if source_size is None or int(source_size) > float(video_metadata['target_size_mb']) * 1024 * 1024:
+            blockers.append('source larger than target size or size unknown')
+    else:
+        # Stream bitrate is missing for some containers; fall back to the overall one
+        source_bitrate = video.get('bit_rate') or probe.get('format', {}).get('bit_rate')
+        target_bitrate = parse_bitrate(VideoBitrate[video_metadata['video_bitrate']].value)
+        if source_bitrate is None or int(source_bitrate) > target_bitrate:
+            blockers.append('video bitrate above target or unknown')
+
+    for audio in audio_streams:
+        if audio.get('codec_name') != PROBED_AUDIO_CODECS.get(video_metadata.get('audio_codec')):
+            blockers.append('audio codec differs')
+        target_audio_bitrate = parse_bitrate(AudioBitrate[video_metadata['audio_bitrate']].value)
+        if audio.get('bit_rate') is None or int(audio['bit_rate']) > target_audio_bitrate:
+            blockers.append('audio bitrate above target or unknown')
+
+    return blockers
+
+def sample_starts(duration, count=TARGET_SIZE_SAMPLES, sample_s=TARGET_SIZE_SAMPLE_S):
+    """Start times of count samples spread evenly over the video."""
+    if duration <= sample_s:
+        return [0.0]
+    return [(duration - sample_s) * (i + 0.5) / count for i in range(count)]
+
+def trial_encode_bitrate(video_path, starts, sample_s, video_metadata, rendition, crf):
+    """
+    Bits per second of the samples encoded at crf with the job's codec,
+    preset and resolution. Samples are encoded to a pipe and only counted.
+    """
+    width, height = Resolution[rendition].value
+    total_bytes = 0
+    for start in starts:
+        cmd = [
+            'ffmpeg',
+            '-v', 'error',
+            '-ss', f'{start:.3f}',
+            '-t', f'{sample_s:.3f}',
+            '-i', video_path,
+            '-map', '0:v:0',
+            # Fitted like the processor's renditions (see common/renditions.py)
+            '-vf', f'scale=w=min({width}\\,iw):h=min({height}\\,ih):force_original_aspect_ratio=decrease:force_divisible_by=2',
+            '-c:v', TRIAL_ENCODERS[video_metadata['video_codec']],
+            '-preset', (video_metadata.get('preset') or 'MEDIUM').lower(),
+            '-crf', str(crf),
+            '-f', 'matroska',
+            '-'
+        ]
+        result = subprocess.run(cmd, check=True, capture_output=True)
+        total_bytes += len(result.stdout)
+    return total_bytes * 8 / (len(starts) * sample_s)
+
+def fit_crf(trials, target_bitrate):
+    """
+    CRF expected to produce target_bitrate, from (crf, bitrate) trial points.
+    Bitrate falls roughly exponentially as CRF rises, so log(bitrate) is
+    fitted as a straight line in CRF. Returns None if the trials are flat.
+    """
+    xs = [crf for crf, _ in trials]
+    ys = [math.log(max(bitrate, 1.0)) for _, bitrate in trials]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
+    if slope >= 0:
+        return None
+    intercept = mean_y - slope * mean_x
+
+    crf = (math.log(target_bitrate) - intercept) / slope
+    low, high = TARGET_SIZE_CRF_RANGE
+    return round(min(max(crf, low), high), 1)
+
+def plan_target_size(video_path, video_metadata, duration, has_audio):
+    """
+    Choose encode parameters that land the first rendition near
+    target_size_mb. Returns the fields to set in the video:{uid} hash:
+    crf_override (fitted from trial encodes) and video_bitrate_override
+    (bits/s: a peak cap, or the average bitrate for codecs without trials).
+    """
+    target_bits = float(video_metadata['target_size_mb']) * 1024 * 1024 * 8 * TARGET_SIZE_HEADROOM
+    audio_bitrate = 0
+    if has_audio and video_metadata.get('audio_bitrate'):
+        audio_bitrate = parse_bitrate(AudioBitrate[video_metadata['audio_bitrate']].value)
+    target_bitrate = target_bits / duration - audio_bitrate
+    if target_bitrate <= 0:
+        raise ValueError("Target size is too small to fit the audio track")
+
+    if video_metadata.get('video_codec') not in TRIAL_ENCODERS:
+        return {'video_bitrate_override': int(target_bitrate)}
+
+    rendition = video_renditions(video_metadata)[0]
+    sample_s = min(TARGET_SIZE_SAMPLE_S, duration)
+    starts = sample_starts(duration)
+    trials = [
+        (crf, trial_encode_bitrate(video_path, starts, sample_s, video_metadata, rendition, crf))
+        for crf in TARGET_SIZE_TRIAL_CRFS
+    ]
+    print(f"[Chunker] 🧪 Trial encodes (crf, bits/s): {', '.join(f'({crf}, {bitrate:.0f})' for crf, bitrate in trials)}")
+
+    crf = fit_crf(trials, target_bitrate)
+    if crf is None:
+        return {'video_bitrate_override': int(target_bitrate)}
+    return {'crf_override': crf, 'video_bitrate_override': int(target_bitrate * TARGET_SIZE_PEAK_FACTOR)}
+
+def remux_video(source_path, output_path):
+    """
+    Copy the first video stream and any audio into an MP4 with the moov atom
+    up front. Data and subtitle streams are left out, since MP4 cannot carry
+    most of them. Raises CalledProcessError, with ffmpeg's stderr, on failure.
+    """
+    ensure_dir(os.path.dirname(output_path))
+    cmd = [
+        'ffmpeg',
+        '-y',
+        '-i', source_path,
+        '-map', '0:v:0',
+        '-map', '0:a?',
+        '-c', 'copy',
+        '-movflags', '+faststart',
+        output_path
+    ]
+    subprocess.run(cmd, check=True, capture_output=True, text=True)
+
+def parse_segment_row(line):
+    """Parse one ffmpeg csv segment list line into (filename, start, duration)."""
+    row = next(csv.reader([line]), [])
+    if len(row) < 3:
+        return None
+    start, end = float(row[1]), float(row[2])
+    return row[0], start, end - start
+
+def stream_segment_list(process, segment_list_path):
+    """
+    Yield (filename, start, duration) for each segment as soon as ffmpeg
+    closes it. The segment muxer appends a line to the csv list when a
+    segment is finished, so the list is tailed while ffmpeg runs.
+    Raises CalledProcessError if ffmpeg fails.
+    """
+    position = 0
+    while True:
+        finished = process.poll() is not None
+
+        if os.path.exists(segment_list_path):
+            with open(segment_list_path, newline='') as f:
+                f.seek(position)
+                while True:
+                    line = f.readline()
+                    # Only consume complete lines; a partial one is still being written
+                    if not line.endswith('\n'):
+                        break
+                    position = f.tell()
+                    segment = parse_segment_row(line)
+                    if segment:
+                        yield segment
+
+        if finished:
+            break
+        time.sleep(SEGMENT_POLL_INTERVAL_S)
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, process.args)
+
+def enqueue_chunk(video_id, video_metadata, chunk_output_dir, chunk_file, start_pts, chunk_duration, source_path=None, rate_plan=None):
+    """
+    Register a chunk in redis and hand it to the scheduler for processing.
+    With source_path the chunk is virtual: no file was written, and the
+    processor decodes [start_pts, start_pts + chunk_duration) of the source.
+    rate_plan is the chunk's (complexity, rate_scale) from plan_rate_scales.
+    """
+    if source_path:
+        chunk_path = source_path
+    else:
+        chunk_path = storage.store_file(os.path.join(chunk_output_dir, chunk_file))
+        storage.release_file(chunk_path)
+    chunk_metadata = {
+        'video_id': video_id,
+        'chunk_id': chunk_file,
+        'chunk_path': chunk_path,
+        'start_pts': start_pts,
+        'duration': chunk_duration,
+        'virtual': int(bool(source_path)),
+        'status': 'pending'
+    }
+
+    chunk_record = {
+        'chunk_path': chunk_path,
+        'start_pts': start_pts,
+        'duration': chunk_duration,
+        'virtual': chunk_metadata['virtual']
+    }
+    if rate_plan:
+        complexity, scale = rate_plan
+        chunk_metadata['complexity'] = chunk_record['complexity'] = round(complexity, 3)
+        chunk_metadata['rate_scale'] = chunk_record['rate_scale'] = scale
+
+    # Count the chunk as outstanding before a processor can possibly finish it
+    redis_conn.incr(f"video:{video_id}:remaining")
+    redis_conn.hset(f"video:{video_id}:chunks", chunk_file, 'pending')
+    redis_conn.hset(f"video:{video_id}:chunk:{chunk_file}", mapping=chunk_record)
+
+    cost = estimate_chunk_cost(chunk_duration, video_renditions(video_metadata), video_metadata.get('preset'))
+    submit_chunk(redis_conn, video_id, chunk_metadata, cost, video_priority(video_metadata))
+    dispatch(redis_conn, processing_queue, PROCESSOR_SERVICE_METHOD, SCHEDULER_QUEUE_DEPTH)
+    print(f"[Chunker] 📤 Submitted chunk for processing: {chunk_file} ({start_pts:.2f}s +{chunk_duration:.2f}s, cost {cost:.2f})")
+
+def split_chunks(video_id, video_metadata, uploaded_video_path, has_audio, chunk_count, mode, keyframe_index):
+    """
+    Split the upload into about chunk_count chunk files under
+    unprocessed_chunks/<video_id>, enqueuing each chunk the moment ffmpeg
+    closes it. The audio track is demuxed by the same read. Cuts land on
+    keyframes picked from keyframe_index (from probe_keyframes).
+    Returns (chunk_total, audio_path).
+    """
+    # Create output folder for chunks
+    chunk_output_dir = os.path.join(UNPROCESSED_CHUNKS_DIR, video_id)
+    ensure_dir(chunk_output_dir)
+
+    segment_list_path = os.path.join(chunk_output_dir, 'chunks_list.csv')
+    if os.path.exists(segment_list_path):
+        os.remove(segment_list_path)  # Never tail a list left by an earlier run
+
+    # Build and execute ffmpeg chunking command
+    cmd = [
+        'ffmpeg',
+        '-y',
+        '-i', uploaded_video_path,
+        '-c', 'copy',
+        '-map', '0:v:0',
+        '-f', 'segment',
+        '-segment_format', 'mp4',
+        '-segment_list', segment_list_path,
+        '-segment_list_type', 'csv',
+        '-reset_timestamps', '1',
+    ]
+
+    # The segment muxer ignores -fs, so every mode cuts on planned keyframes
+    keyframes, duration = keyframe_index
+    cuts = plan_keyframe_cuts(keyframes, duration, chunk_count, mode, video_metadata)
+    print(f"[Chunker] 🔑 {len(keyframes)} keyframes, {len(cuts) + 1} chunks planned over {duration:.2f}s")
+    if cuts:
+        cmd += ['-segment_times', ','.join(f'{max(t - KEYFRAME_CUT_EPSILON, 0):.6f}' for t in cuts)]
+
+    # Chunks come out in plan order, so each takes the scale of its range
+    rate_plans = []
+    if COMPLEXITY_ALLOCATION:
+        starts = [0.0] + [max(t - KEYFRAME_CUT_EPSILON, 0) for t in cuts]
+        rate_plans = plan_rate_scales(keyframe_index, starts, starts[1:] + [duration])
+
+    cmd.append(os.path.join(chunk_output_dir, 'chunk_%03d.mp4'))
+
+    # Second output of the same read: the source audio, stream-copied. Only
+    # the first audio stream is kept; renditions carry a single audio track
+    audio_path = os.path.join(chunk_output_dir, 'audio.mka')
+    if has_audio:
+        cmd += ['-map', '0:a:0', '-c', 'copy', audio_path]
+
+    # Enqueue each chunk the moment ffmpeg closes it
+    with timed(redis_conn, 'chunker', 'split', video_id) as stage:
+        stage['bytes_in'] = os.path.getsize(uploaded_video_path)
+        stage['bytes_out'] = 0
+
+        process = subprocess.Popen(cmd)
+        chunk_total = 0
+        try:
+            for chunk_file, start_pts, chunk_duration in stream_segment_list(process, segment_list_path):
+                rate_plan = rate_plans[chunk_total] if chunk_total < len(rate_plans) else None
+                stage['bytes_out'] += os.path.getsize(os.path.join(chunk_output_dir, chunk_file))
+                enqueue_chunk(video_id, video_metadata, chunk_output_dir, chunk_file, start_pts, chunk_duration, rate_plan=rate_plan)
+                chunk_total += 1
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+        stage['chunks'] = chunk_total
+        if has_audio and os.path.exists(audio_path):
+            stage['bytes_out'] += os.path.getsize(audio_path)
+            storage.store_file(audio_path)
+            storage.release_file(audio_path)
+
+    return chunk_total, audio_path
+
 # ===================
 # Main Worker Task
 # ===================
 
-def chunk_video_task(video_id, ext, chunk_size_mb=TARGET_CHUNK_SIZE_MB):
+def chunk_video_task(video_id, ext, chunk_size_mb=None, mode=CHUNK_MODE):
     """
-    Splits the uploaded video into chunks of specified size (MB),
-    and enqueues each chunk into the processing_jobs queue.
+    Splits the uploaded video into chunks and enqueues each chunk into the
+    processing_jobs queue as soon as ffmpeg closes it, so encoding overlaps
+    with splitting.
+
+    The chunk count comes from chunk_size_mb, else the job's chunk_size, else
+    plan_chunk_count(). The keyframe index is probed once and cuts land on
+    keyframes so chunks are balanced by byte size, duration or cost.
+    With VIRTUAL_CHUNKS the same plan is made but only the time ranges are
+    enqueued; no chunk files are written.
     """
+    update_node(redis_conn, current_job=f"chunk:{video_id}")
+    record_queue_wait(redis_conn, 'chunker', video_id)
     try:
-        print(f"[Chunker] 🚀 Starting chunking for video_id: {video_id} with chunk size {chunk_size_mb}MB")
+        if mode not in CHUNK_MODES:
+            raise ValueError(f"Unknown chunking mode: {mode}")
+
+        set_stage(redis_conn, video_id, 'chunking')
+        print(f"[Chunker] 🚀 Starting chunking for video_id: {video_id} ({mode} mode)")
+
+        # Splitting writes another copy of the upload; wait for room first
+        if not wait_for_disk(redis_conn, storage, video_id, DISK_PAUSE_MAX_WAIT_S):
+            chunking_queue.enqueue(
+                CHUNKER_SERVICE_METHOD, video_id, ext, chunk_size_mb, mode,
+                job_timeout=chunking_job_timeout(redis_conn.hget(f"video:{video_id}", "size"))
+            )
+            print(f"[Chunker] ⏸️ Still short of disk space, requeued video_id: {video_id}")
+            return {"status": "deferred"}
 
         # Locate uploaded video file
-        uploaded_video_path = os.path.join(TEMP_UPLOADS_DIR, f'{video_id}{ext}')
-        if not os.path.exists(uploaded_video_path):
-            raise FileNotFoundError(f"Video file {uploaded_video_path} not found!")
+        video_key = f"video:{video_id}"
+        upload_key = storage.key(os.path.join(TEMP_UPLOADS_DIR, f'{video_id}{ext}'))
+        redis_conn.hset(video_key, "upload_key", upload_key)
+        uploaded_video_path = storage.fetch(upload_key)
 
-        # Create output folder for chunks
-        chunk_output_dir = os.path.join(UNPROCESSED_CHUNKS_DIR, video_id)
-        ensure_dir(chunk_output_dir)
+        # Look the source + encode parameters up in the whole-video cache
+        video_metadata = redis_conn.hgetall(video_key)
+        video_metadata = {key.decode(): value.decode() for key, value in video_metadata.items()}
 
-        # Convert chunk size from MB to bytes
-        target_chunk_size_bytes = chunk_size_mb * 1024 * 1024
+        with timed(redis_conn, 'chunker', 'hash', video_id) as stage:
+            stage['bytes_in'] = os.path.getsize(uploaded_video_path)
+            source_hash = file_sha256(uploaded_video_path)
+        redis_conn.hset(video_key, mapping={
+            "source_hash": source_hash,
+            "params_fingerprint": params_fingerprint(video_metadata)
+        })
 
-        # Build and execute ffmpeg chunking command
-        cmd = [
-            'ffmpeg',
-            '-i', uploaded_video_path,
-            '-c', 'copy',
-            '-map', '0',
-            '-f', 'segment',
-            '-segment_format', 'mp4',
-            '-segment_list', os.path.join(chunk_output_dir, 'chunks_list.txt'),
-            '-segment_list_type', 'flat',
-            '-fs', str(target_chunk_size_bytes),
-            os.path.join(chunk_output_dir, 'chunk_%03d.mp4')
-        ]
+        # Every rendition has to be cached to skip the pipeline
+        cached_outputs = []
+        for rendition in video_renditions(video_metadata):
+            final_video_path = os.path.join(FINAL_VIDEOS_DIR, final_video_filename(video_id, video_metadata, rendition))
+            if not video_cache.get(source_cache_key(source_hash, video_metadata, rendition), final_video_path):
+                break
+            cached_outputs.append(final_video_path)
+        else:
+            for final_video_path in cached_outputs:
+                storage.store_file(final_video_path)
+                storage.release_file(final_video_path)
+            redis_conn.hset(video_key, "status", "done")
+            set_stage(redis_conn, video_id, 'done')
+            reclaim(redis_conn, storage, video_id, 'uploads', upload_key)
+            storage.release(upload_key)
+            print(f"[Chunker] ♻️ Cache hit, skipped pipeline for video_id: {video_id}")
+            return {"status": "success", "cached": True, "output_paths": cached_outputs}
+
+        # Probe once: used for admission and to plan the audio track
+        try:
+            with timed(redis_conn, 'chunker', 'probe', video_id):
+                probe = probe_media(uploaded_video_path)
+        except subprocess.CalledProcessError as e:
+            probe = None
+            print(f"[Chunker] ⚠️ Could not probe source: {e}")
+
+        # Renditions are fitted to the source's shape; the assembler advertises their real size
+        source_video = next((st for st in (probe or {}).get('streams', []) if st.get('codec_type') == 'video'), None)
+        if source_video and source_video.get('width') and source_video.get('height'):
+            redis_conn.hset(video_key, mapping={"source_width": source_video['width'], "source_height": source_video['height']})
+
+        # Admission: skip the pipeline when nothing needs re-encoding
+        if REMUX_FAST_PATH:
+            try:
+                blockers = remux_blockers(probe, video_metadata) if probe else ['source could not be probed']
+            except (KeyError, ValueError) as e:
+                blockers = [f'could not compare source with target: {e}']
+
+            if not blockers:
+                rendition = video_renditions(video_metadata)[0]
+                final_video_path = os.path.join(FINAL_VIDEOS_DIR, final_video_filename(video_id, video_metadata, rendition))
+                try:
+                    remux_video(uploaded_video_path, final_video_path)
+                except subprocess.CalledProcessError as e:
+                    # Fall back to the normal pipeline, which re-encodes the source
+                    if os.path.exists(final_video_path):
+                        os.remove(final_video_path)
+                    stderr_tail = (e.stderr or '').strip().splitlines()[-1:]
+                    blockers = [f"remux failed: {stderr_tail[0] if stderr_tail else e}"]
+                else:
+                    storage.store_file(final_video_path)
+                    video_cache.put(source_cache_key(source_hash, video_metadata, rendition), final_video_path)
+                    storage.release_file(final_video_path)
+                    redis_conn.hset(video_key, "status", "done")
+                    set_stage(redis_conn, video_id, 'done')
+                    reclaim(redis_conn, storage, video_id, 'uploads', upload_key)
+                    storage.release(upload_key)
+                    print(f"[Chunker] ⚡ Source already meets target, remuxed video_id: {video_id}")
+                    return {"status": "success", "remuxed": True, "output_paths": [final_video_path]}
+
+            print(f"[Chunker] 🔧 Re-encoding needed: {', '.join(blockers)}")
+
+        # Audio is demuxed once into its own track and encoded by a single job;
+        # chunks carry video only
+        audio_stream_count = sum(
+            stream.get('codec_type') == 'audio' for stream in (probe or {}).get('streams', [])
+        )
+        has_audio = audio_stream_count > 0
+        if audio_stream_count > 1:
+            print(f"[Chunker] ⚠️ {audio_stream_count} audio streams, only the first is kept for video_id: {video_id}")
+        redis_conn.hset(video_key, "has_audio", int(has_audio))
+
+        # Target-size jobs settle their CRF before the first chunk is encoded
+        if video_metadata.get('target_size_mb'):
+            with timed(redis_conn, 'chunker', 'target_size_fit', video_id) as stage:
+                duration = float((probe or {}).get('format', {}).get('duration') or 0)
+                if duration <= 0:
+                    raise ValueError("Target size mode needs the source duration")
+                overrides = plan_target_size(uploaded_video_path, video_metadata, duration, has_audio)
+                redis_conn.hset(video_key, mapping=overrides)
+                video_metadata.update({key: str(value) for key, value in overrides.items()})
+                stage.update(overrides)
+            print(f"[Chunker] 🎯 Target size {video_metadata['target_size_mb']}MB: {overrides}")
+
+        # Chunk count: an explicit chunk size wins, otherwise size the plan
+        # to the source and the processors that are up right now
+        file_size = os.path.getsize(uploaded_video_path)
+        chunk_size_mb = chunk_size_mb or int(video_metadata.get('chunk_size') or 0)
+        if chunk_size_mb:
+            chunk_count = max(1, math.ceil(file_size / (chunk_size_mb * 1024 * 1024)))
+            print(f"[Chunker] 📐 {chunk_count} chunk(s) of {chunk_size_mb}MB requested")
+        else:
+            workers = live_node_count(redis_conn, 'processor') or ASSUMED_WORKERS
+            max_nodes = int(video_metadata.get('max_nodes') or 0)
+            if max_nodes:
+                workers = min(workers, max_nodes)
+            duration = float((probe or {}).get('format', {}).get('duration') or 0)
+            chunk_count = plan_chunk_count(video_metadata, probe, file_size, duration, workers)
+            print(f"[Chunker] 📐 {chunk_count} chunk(s) planned for {duration:.2f}s / {file_size} bytes on {workers} worker(s)")
+        redis_conn.hset(video_key, "chunk_count_planned", chunk_count)
 
-        subprocess.run(cmd, check=True)
+        # The remaining-chunks counter starts at 1: a token held by the chunker
+        # while it is still splitting, so processors that keep up with the
+        # split cannot take the counter to zero before the last chunk exists
+        remaining_key = f"video:{video_id}:remaining"
+        redis_conn.set(remaining_key, 1)
 
-        video_key = f"video:{video_id}:chunks"
+        # The keyframe index drives keyframe-aligned cuts and chunk complexity
+        with timed(redis_conn, 'chunker', 'keyframe_index', video_id):
+            keyframe_index = probe_keyframes(uploaded_video_path)
 
-        # Enqueue each generated chunk into processing queue
-        for chunk_file in os.listdir(chunk_output_dir):
-            if chunk_file.startswith('chunk_') and chunk_file.endswith('.mp4'):
-                chunk_path = os.path.join(chunk_output_dir, chunk_file)
-                chunk_metadata = {
-                    'video_id': video_id,
-                    'chunk_id': chunk_file,
-                    'chunk_path': chunk_path,
-                    'status': 'pending'
-                }
-                redis_conn.hset(video_key, chunk_file, 'pending')
-                processing_queue.enqueue(PROCESSOR_SERVICE_METHOD, chunk_metadata, video_id)
-                print(f"[Chunker] 📤 Enqueued chunk for processing: {chunk_file}")
+        if VIRTUAL_CHUNKS:
+            # Nothing is written: chunks are keyframe-aligned time ranges of
+            # the upload, and processors decode their range from it directly
+            chunk_output_dir = None
+            with timed(redis_conn, 'chunker', 'plan', video_id) as stage:
+                keyframes, duration = keyframe_index
+                cuts = plan_keyframe_cuts(keyframes, duration, chunk_count, mode, video_metadata)
+                print(f"[Chunker] 🔑 {len(keyframes)} keyframes, {len(cuts) + 1} virtual chunks planned over {duration:.2f}s")
 
-        print(f"[Chunker] ✅ Finished chunking and enqueuing chunks from: {chunk_output_dir}")
-        return {"status": "success", "chunk_dir": chunk_output_dir}
+                starts = [0.0] + [max(t - KEYFRAME_CUT_EPSILON, 0) for t in cuts]
+                ends = starts[1:] + [duration]
+                rate_plans = plan_rate_scales(keyframe_index, starts, ends) if COMPLEXITY_ALLOCATION else [None] * len(starts)
+                for index, (start_pts, end_pts, rate_plan) in enumerate(zip(starts, ends, rate_plans)):
+                    enqueue_chunk(
+                        video_id, video_metadata, None, f'chunk_{index:03d}.mp4', start_pts, end_pts - start_pts,
+                        source_path=uploaded_video_path, rate_plan=rate_plan
+                    )
+                chunk_total = stage['chunks'] = len(starts)
+
+            # The audio job reads its track straight from the upload too
+            audio_path = uploaded_video_path
+        else:
+            chunk_total, audio_path = split_chunks(video_id, video_metadata, uploaded_video_path, has_audio, chunk_count, mode, keyframe_index)
+            chunk_output_dir = os.path.dirname(audio_path)
+
+            # Chunks and audio are stored; the upload is no longer read.
+            # Virtual chunks read it until assembly (see the assembler)
+            reclaim(redis_conn, storage, video_id, 'uploads', upload_key)
+
+        # Processors read the stored upload (or chunks), not this node's copy
+        storage.release(upload_key)
+
+        # The audio track is complete once the chunks are; count it as one more
+        # outstanding item before the chunker's token is released
+        if has_audio:
+            redis_conn.hset(f"video:{video_id}:tracks", "audio", "pending")
+            # Leased like a chunk, so a failed encode is retried from here
+            redis_conn.hset(f"video:{video_id}:chunk:audio", "chunk_path", audio_path)
+            redis_conn.incr(remaining_key)
+            processing_queue.enqueue(PROCESSOR_AUDIO_METHOD, audio_path, video_id, job_timeout=PROCESSING_JOB_TIMEOUT)
+            print(f"[Chunker] 🎵 Enqueued audio track for processing: {audio_path}")
+
+        # Total is known now; release the chunker's token. If every chunk was
+        # already processed this takes the counter to zero and we start assembly
+        redis_conn.hset(f"video:{video_id}", "chunk_total", chunk_total)
+        set_stage(redis_conn, video_id, 'processing')
+        if redis_conn.decr(remaining_key) == 0:
+            assembly_queue.enqueue(ASSEMBLER_SERVICE_METHOD, video_id, job_timeout=ASSEMBLY_JOB_TIMEOUT)
+
+        print(f"[Chunker] ✅ Finished chunking and enqueued {chunk_total} chunk(s) for video_id: {video_id}")
+        return {"status": "success", "chunk_dir": chunk_output_dir, "chunks": chunk_total}
 
     except Exception as e:
         print(f"[Chunker] ❌ Error during chunking: {str(e)}")
+        set_stage(redis_conn, video_id, 'error')
+        reclaim_video(redis_conn, storage, video_id, GC_FAILED_RETENTION_S)
         return {"status": "error", "error": str(e)}
 
+    finally:
+        update_node(redis_conn, current_job=None)
+
 # ===================
 # Worker Bootstrap
 # ===================
 
 def start_worker():
     """Start RQ worker to listen for chunking jobs."""
+    start_heartbeat(redis_conn, 'chunker')
+    start_metrics_server(redis_conn)
+    start_reclaimer(redis_conn, storage)
+
     q = Queue(CHUNKING_QUEUE, connection=redis_conn)
     worker = Worker(queues=[q], connection=redis_conn)
     print(f"[Chunker] 🎧 Worker started, listening on queue: {CHUNKING_QUEUE}")
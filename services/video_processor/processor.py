@@ -1,8 +1,20 @@
 import os
+import time
+import uuid
+import hashlib
+import threading
 import redis
 from rq import Worker, Queue
-from ffmpeg import input as ffmpeg_input
+from ffmpeg import input as ffmpeg_input, output as ffmpeg_output, merge_outputs as ffmpeg_merge_outputs, probe as ffmpeg_probe, Error as FFmpegError
 import enum
+from common.cache import ContentCache, file_sha256, rendition_cache_key
+from common.renditions import video_renditions, rendition_subdir, is_ladder, ladder_bitrate, scale_filter_args
+from common.scheduler import submit_chunk, dispatch, estimate_chunk_cost, video_priority, PROCESSING_JOB_TIMEOUT
+from common.heartbeat import start_heartbeat, update_node
+from common.metrics import timed, record_queue_wait, set_gauge, start_metrics_server, REALTIME_FACTOR
+from common.progress import set_stage, chunk_progress_reporter, clear_chunk_progress
+from common.storage import get_storage
+from common.lifecycle import reclaim, reclaim_video, GC_FAILED_RETENTION_S
 
 # ===================
 # Configuration
@@ -13,15 +25,150 @@ REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
 
 QUEUE_NAME = os.getenv('QUEUE_NAME', 'processing_jobs')
 
-UNPROCESSED_CHUNKS_DIR = '/app/unprocessed_chunks'
-PROCESSED_CHUNKS_DIR = '/app/processed_chunks'
+# Shared object storage (see common/storage.py)
+storage = get_storage()
+
+UNPROCESSED_CHUNKS_DIR = storage.path('unprocessed_chunks')
+PROCESSED_CHUNKS_DIR = storage.path('processed_chunks')
 
 PROCESSING_QUEUE = 'processing_jobs'
+PROCESSOR_SERVICE_METHOD = 'processor.process_chunk_task'
+
+# Jobs kept on processing_jobs by the scheduler (see common/scheduler.py)
+SCHEDULER_QUEUE_DEPTH = int(os.getenv('SCHEDULER_QUEUE_DEPTH', 10))
 
 ASSEMBLER_SERVICE_METHOD = "assembler.assemble_video_task"
+ASSEMBLER_APPEND_METHOD = "assembler.append_chunks_task"
+
+# RQ timeout of assembly jobs; finalizing a long video outlasts RQ's 180s default
+ASSEMBLY_JOB_TIMEOUT = int(os.getenv('ASSEMBLY_JOB_TIMEOUT', 3600))
+
+# Encoder thread budget per chunk job. 0 means split the host's cores evenly
+# between the processor replicas expected to share it.
+ENCODER_THREADS = int(os.getenv('ENCODER_THREADS', 0))
+REPLICAS_PER_HOST = int(os.getenv('REPLICAS_PER_HOST', 1))
+
+# Chunk leasing: a processor holds a lease on a chunk while encoding it and
+# renews it periodically. Expired leases (dead or preempted workers) are
+# re-enqueued by a reaper running in every processor replica.
+LEASE_TIMEOUT_S = int(os.getenv('LEASE_TIMEOUT_S', 120))
+LEASE_RENEW_INTERVAL_S = LEASE_TIMEOUT_S / 3
+REAPER_INTERVAL_S = int(os.getenv('REAPER_INTERVAL_S', 30))
+MAX_CHUNK_ATTEMPTS = int(os.getenv('MAX_CHUNK_ATTEMPTS', 3))
+LEASES_KEY = 'chunk_leases'
+PROCESSOR_AUDIO_METHOD = 'processor.process_audio_task'
+
+# The audio track is leased like a chunk under this id, with its state kept
+# in video:{id}:tracks rather than video:{id}:chunks
+AUDIO_TRACK_ID = 'audio'
+
+# Recent per-chunk encode times, read by the autoscaler
+ENCODE_TIMES_KEY = 'stats:chunk_encode_seconds'
+ENCODE_TIMES_KEPT = 100
+
+# Encoded chunks must be within this many seconds (or 10%) of the source chunk
+DURATION_TOLERANCE_S = 1.0
+
+# Per-chunk cache of encoded outputs, keyed by chunk content + encode parameters
+CHUNK_CACHE_MAX_MB = int(os.getenv('CHUNK_CACHE_MAX_MB', 10240))
 
 redis_conn = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
 assembly_queue = Queue('assembly_jobs', connection=redis_conn)
+processing_queue = Queue(PROCESSING_QUEUE, connection=redis_conn)
+
+# Chunk states in video:{id}:chunks: pending -> leased -> processed, or
+# leased -> pending (retry) / failed (attempts exhausted).
+
+# Marks a chunk (or the audio track) processed and decrements the video's
+# remaining-chunks counter in one atomic step, dropping the lease, but only
+# for the holder of the current lease token. Returns 1 only to the caller that
+# takes the counter to zero, so exactly one processor enqueues assembly, and
+# -1 when the lease has passed to another processor (or the chunk failed).
+# Re-marking an already processed chunk is a no-op.
+#   KEYS as ACQUIRE_LEASE_LUA, KEYS[4] = video:{id}:remaining
+#   ARGV[1] = chunk_id, ARGV[2] = lease member, ARGV[3] = token
+MARK_CHUNK_PROCESSED_LUA = """
+local status = redis.call('HGET', KEYS[1], ARGV[1])
+if status == 'processed' then
+    return 0
+end
+if status == 'failed' or redis.call('HGET', KEYS[2], 'lease_token') ~= ARGV[3] then
+    return -1
+end
+redis.call('HSET', KEYS[1], ARGV[1], 'processed')
+redis.call('ZREM', KEYS[3], ARGV[2])
+if redis.call('DECR', KEYS[4]) == 0 then
+    return 1
+end
+return 0
+"""
+
+# Takes the lease on a pending chunk (or one whose lease has expired).
+#   KEYS[1] = video:{id}:chunks, KEYS[2] = video:{id}:chunk:{chunk_id}, KEYS[3] = chunk_leases
+#   ARGV[1] = chunk_id, ARGV[2] = lease member, ARGV[3] = token, ARGV[4] = expiry, ARGV[5] = now
+ACQUIRE_LEASE_LUA = """
+local status = redis.call('HGET', KEYS[1], ARGV[1])
+if status == 'processed' or status == 'failed' then
+    return 0
+end
+if status == 'leased' then
+    local expiry = redis.call('ZSCORE', KEYS[3], ARGV[2])
+    if expiry and tonumber(expiry) > tonumber(ARGV[5]) then
+        return 0
+    end
+end
+redis.call('HSET', KEYS[1], ARGV[1], 'leased')
+redis.call('HSET', KEYS[2], 'lease_token', ARGV[3])
+redis.call('HINCRBY', KEYS[2], 'attempts', 1)
+redis.call('ZADD', KEYS[3], ARGV[4], ARGV[2])
+return 1
+"""
+
+# Extends a lease, but only for the holder of the current token.
+#   KEYS[2] = video:{id}:chunk:{chunk_id}, KEYS[3] = chunk_leases
+#   ARGV[2] = lease member, ARGV[3] = token, ARGV[4] = expiry
+RENEW_LEASE_LUA = """
+if redis.call('HGET', KEYS[2], 'lease_token') ~= ARGV[3] then
+    return 0
+end
+redis.call('ZADD', KEYS[3], 'XX', ARGV[4], ARGV[2])
+return 1
+"""
+
+# Gives a leased chunk back after a failed attempt (token given) or an expired
+# lease (empty token, reaper). Returns 1 if the chunk should be re-enqueued,
+# 2 if it has used up its attempts and is now failed, 0 if nothing changed.
+#   KEYS as ACQUIRE_LEASE_LUA; ARGV[1] = chunk_id, ARGV[2] = lease member,
+#   ARGV[3] = token or '', ARGV[4] = max attempts, ARGV[5] = now
+RELEASE_LEASE_LUA = """
+if redis.call('HGET', KEYS[1], ARGV[1]) ~= 'leased' then
+    return 0
+end
+if ARGV[3] ~= '' then
+    if redis.call('HGET', KEYS[2], 'lease_token') ~= ARGV[3] then
+        return 0
+    end
+else
+    local expiry = redis.call('ZSCORE', KEYS[3], ARGV[2])
+    if expiry and tonumber(expiry) > tonumber(ARGV[5]) then
+        return 0
+    end
+end
+redis.call('ZREM', KEYS[3], ARGV[2])
+if tonumber(redis.call('HGET', KEYS[2], 'attempts') or '0') >= tonumber(ARGV[4]) then
+    redis.call('HSET', KEYS[1], ARGV[1], 'failed')
+    return 2
+end
+redis.call('HSET', KEYS[1], ARGV[1], 'pending')
+return 1
+"""
+
+mark_chunk_processed = redis_conn.register_script(MARK_CHUNK_PROCESSED_LUA)
+acquire_lease_script = redis_conn.register_script(ACQUIRE_LEASE_LUA)
+renew_lease_script = redis_conn.register_script(RENEW_LEASE_LUA)
+release_lease_script = redis_conn.register_script(RELEASE_LEASE_LUA)
+
+chunk_cache = ContentCache(redis_conn, storage, 'processed_chunks', 'chunks', CHUNK_CACHE_MAX_MB * 1024 * 1024)
 
 # ===================
 # Presets for encoding
@@ -77,6 +224,22 @@ class CRFValue(enum.Enum):
     LOW = 35  # Very low quality, very small file size
     VERY_LOW = 40  # Extremely low quality, very small file size
 
+# ffmpeg encoder names for codecs whose enum value is not an encoder itself
+VIDEO_ENCODERS = {
+    VideoCodec.VP8: 'libvpx',
+    VideoCodec.VP9: 'libvpx-vp9',
+    VideoCodec.AV1: 'libaom-av1',
+}
+
+AUDIO_ENCODERS = {
+    AudioCodec.MP3: 'libmp3lame',
+    AudioCodec.OPUS: 'libopus',
+    AudioCodec.VORBIS: 'libvorbis',
+}
+
+# Encoders that understand the x264-style speed presets
+PRESET_CODECS = (VideoCodec.H264, VideoCodec.H265)
+
 # ===================
 # Helper functions
 # ===================
@@ -84,96 +247,510 @@ class CRFValue(enum.Enum):
 def ensure_dir(directory):
     os.makedirs(directory, exist_ok=True)
 
-def check_all_chunks_processed(video_id):
-    """Check if all chunks for a video are processed."""
-    redis_conn = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
-    chunks = redis_conn.hgetall(f"video:{video_id}:chunks")
-    return all(status == b'processed' for status in chunks.values())
-
-def process_chunk(input_chunk_path, output_chunk_path, video_metadata):
-    """Process a single video chunk with encoding parameters."""
-    
-    # Extract parameters from video_metadata
-    resolution = Resolution[video_metadata['resolution']]  # (Resolution Enum)
-    video_bitrate = VideoBitrate[video_metadata['video_bitrate']]  # (VideoBitrate Enum)
-    audio_bitrate = AudioBitrate[video_metadata['audio_bitrate']]  # (AudioBitrate Enum)
-    crf_value = CRFValue[video_metadata['crf_value']]  # (CRFValue Enum)
+def encoder_thread_budget():
+    """Number of encoder threads a single chunk job may use."""
+    if ENCODER_THREADS > 0:
+        return ENCODER_THREADS
+    return max(1, (os.cpu_count() or 1) // max(1, REPLICAS_PER_HOST))
+
+def parse_bitrate(value):
+    """Convert an ffmpeg bitrate string such as '500k' or '2M' to bits/s."""
+    multipliers = {'k': 1000, 'M': 1000 * 1000}
+    if value[-1] in multipliers:
+        return int(float(value[:-1]) * multipliers[value[-1]])
+    return int(value)
+
+def build_encode_args(video_metadata, threads, scale=1.0, rendition=None):
+    """
+    Build ffmpeg video output arguments for a real encode from the enum names
+    stored in the video:{uid} hash. Each rung of a ladder is encoded at its
+    own bitrate (see ladder_bitrate) rather than the job's video_bitrate.
+
+    The CRF drives quality and the video bitrate acts as a ceiling, so easy
+    content comes out smaller than the bitrate while hard content stays capped.
+    The ceiling is the video's bitrate times scale (the chunk's rate_scale,
+    allocated by the chunker), so the chunks of a video share its budget by
+    complexity. Target-size jobs carry
+    crf_override / video_bitrate_override chosen by the chunker, which win
+    over the enums.
+    """
+    if rendition and is_ladder(video_metadata):
+        budget = ladder_bitrate(video_metadata, rendition)
+    elif video_metadata.get('video_bitrate_override'):
+        budget = int(video_metadata['video_bitrate_override'])
+    else:
+        budget = parse_bitrate(VideoBitrate[video_metadata['video_bitrate']].value)  # (VideoBitrate Enum)
+    bitrate = str(int(budget * scale))
     preset = Preset[video_metadata['preset']]  # (Preset Enum)
     video_codec = VideoCodec[video_metadata['video_codec']]  # (e.g., 'libx264')
+
+    args = {
+        'vcodec': VIDEO_ENCODERS.get(video_codec, video_codec.value),
+        'threads': threads,
+    }
+
+    if video_codec == VideoCodec.MPEG4:
+        # mpeg4 has no CRF mode; fall back to plain average bitrate
+        args['b:v'] = bitrate
+    else:
+        args['crf'] = video_metadata.get('crf_override') or CRFValue[video_metadata['crf_value']].value  # (CRFValue Enum)
+        args['maxrate'] = bitrate
+        args['bufsize'] = bitrate
+        if video_codec in (VideoCodec.VP8, VideoCodec.VP9, VideoCodec.AV1):
+            # libvpx/libaom only honour CRF as constrained quality with a b:v cap
+            args['b:v'] = bitrate
+
+    if video_codec in PRESET_CODECS:
+        args['preset'] = preset.value
+        args['pix_fmt'] = 'yuv420p'
+    if video_codec == VideoCodec.H265:
+        # x265 sizes its own thread pools and ignores -threads
+        args['x265-params'] = f'pools={threads}'
+
+    return args
+
+def build_audio_args(video_metadata):
+    """Build ffmpeg audio output arguments from the video:{uid} hash."""
+    audio_bitrate = AudioBitrate[video_metadata['audio_bitrate']]  # (AudioBitrate Enum)
     audio_codec = AudioCodec[video_metadata['audio_codec']]  # (e.g., 'aac')
-    
-    ensure_dir(os.path.dirname(output_chunk_path))  # Ensure the output directory exists
 
-    try:
+    return {
+        'acodec': AUDIO_ENCODERS.get(audio_codec, audio_codec.value),
+        'b:a': audio_bitrate.value,
+    }
+
+def process_audio(input_audio_path, output_audio_path, video_metadata):
+    """
+    Encode a video's whole audio track as one continuous stream. Only the
+    first audio stream of the source is kept (see the chunker).
+    """
+    ensure_dir(os.path.dirname(output_audio_path))
+    (
+        ffmpeg_input(input_audio_path)
+        .output(output_audio_path, vn=None, **build_audio_args(video_metadata))
+        .overwrite_output()
+        .run()
+    )
+
+def process_chunk(input_chunk_path, output_paths, video_metadata, threads=None, duration=None, on_progress=None, seek=None, scale=1.0):
+    """
+    Process a single video chunk with encoding parameters. Chunks carry
+    video only; audio is encoded once per video by process_audio_task.
+
+    output_paths maps Resolution names to output files. The chunk is decoded
+    once and split into one scaled encode per rendition, so a ladder costs a
+    single decode. The thread budget is shared between the renditions.
+
+    With seek the input is a whole source and only [seek, seek + duration)
+    is decoded (a virtual chunk); input seeking reads from the keyframe the
+    range starts on. scale is the chunk's share of the bitrate budget.
+
+    When on_progress and the chunk duration are given, ffmpeg's -progress
+    output is parsed and on_progress is called with the percent encoded.
+    Raises ffmpeg.Error if the encode fails.
+    """
     
-        (
-            ffmpeg_input(input_chunk_path)
-            .filter('scale', resolution.value[0], resolution.value[1])  # Scaling based on resolution
-            .output(
-                output_chunk_path,
-                **{
-                    'vcodec': video_codec.value,  # Video codec (e.g., 'libx264')
-                    'crf': crf_value.value,  # CRF value for video quality
-                    'b:v': video_bitrate.value,  # Video bitrate (e.g., '2000k')
-                    'preset': preset.value,  # Encoding speed preset (e.g., 'fast')
-                    'acodec': audio_codec.value,  # Audio codec (e.g., 'aac')
-                    'b:a': audio_bitrate.value,  # Audio bitrate (e.g., '128k')
-                    'c:v': 'copy',  # Copy video stream without re-encoding
-                    'c:a': 'copy'   # Copy audio stream without re-encoding
-                }
-            )
-            .overwrite_output()  # Overwrite the output if exists
-            .run()  # Run the FFmpeg command
-        )
-    except Exception as e:
-        print(f'error occured while ffmpeg processing: {e}')
+    threads = threads or encoder_thread_budget()
+    rendition_threads = max(1, threads // len(output_paths))
+
+    source = ffmpeg_input(input_chunk_path) if seek is None else ffmpeg_input(input_chunk_path, ss=seek, t=duration)
+    if len(output_paths) > 1:
+        decoded = source.video.filter_multi_output('split', len(output_paths))
+        branches = [decoded[i] for i in range(len(output_paths))]
+    else:
+        branches = [source.video]
+
+    outputs = []
+    for branch, (rendition, output_chunk_path) in zip(branches, output_paths.items()):
+        resolution = Resolution[rendition]  # (Resolution Enum)
+        ensure_dir(os.path.dirname(output_chunk_path))  # Ensure the output directory exists
+        video = branch.filter('scale', **scale_filter_args(*resolution.value))  # Fit within the resolution, never upscale
+        encode_args = build_encode_args(video_metadata, rendition_threads, scale, rendition)
+        outputs.append(ffmpeg_output(video, output_chunk_path, an=None, **encode_args))
+
+    command = ffmpeg_merge_outputs(*outputs).overwrite_output()  # Overwrite the output if exists
+    if on_progress is None or not duration:
+        command.run()  # Run the FFmpeg command
+        return
+
+    process = command.global_args('-progress', 'pipe:1', '-nostats').run_async(pipe_stdout=True)
+    for line in process.stdout:
+        key, _, value = line.decode().strip().partition('=')
+        if key == 'out_time_us' and value.isdigit():  # N/A until the first frame is out
+            on_progress(min(100.0, int(value) / 1e6 / duration * 100))
+    if process.wait() != 0:
+        raise FFmpegError('ffmpeg', None, None)
+
+def record_encode_time(seconds):
+    """Keep a rolling window of chunk encode times for capacity planning."""
+    pipe = redis_conn.pipeline()
+    pipe.lpush(ENCODE_TIMES_KEY, seconds)
+    pipe.ltrim(ENCODE_TIMES_KEY, 0, ENCODE_TIMES_KEPT - 1)
+    pipe.execute()
+
+def validate_output(output_path, expected_duration):
+    """
+    Check an encoded chunk before it is marked processed: it must exist,
+    contain a video stream and roughly match the source chunk's duration.
+    Returns the ffprobe result; raises ValueError otherwise.
+    """
+    if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        raise ValueError(f"Encoded chunk is missing or empty: {output_path}")
+
+    probe = ffmpeg_probe(output_path)
+    if not any(stream.get('codec_type') == 'video' for stream in probe.get('streams', [])):
+        raise ValueError(f"Encoded chunk has no video stream: {output_path}")
+
+    if expected_duration:
+        duration = float(probe.get('format', {}).get('duration', 0))
+        tolerance = max(DURATION_TOLERANCE_S, expected_duration * 0.1)
+        if abs(duration - expected_duration) > tolerance:
+            raise ValueError(f"Encoded chunk lasts {duration:.2f}s, expected {expected_duration:.2f}s: {output_path}")
+
+    return probe
+
+def encoded_frames(probe):
+    """Frame count of the first video stream in an ffprobe result."""
+    for stream in probe.get('streams', []):
+        if stream.get('codec_type') == 'video':
+            return int(stream.get('nb_frames') or 0)
+    return 0
 
+# ===================
+# Chunk Leasing
+# ===================
+
+def lease_keys(video_id, chunk_id):
+    status_key = f"video:{video_id}:tracks" if chunk_id == AUDIO_TRACK_ID else f"video:{video_id}:chunks"
+    return [status_key, f"video:{video_id}:chunk:{chunk_id}", LEASES_KEY]
+
+def lease_member(video_id, chunk_id):
+    return f"{video_id}:{chunk_id}"
+
+def acquire_lease(video_id, chunk_id, token):
+    now = time.time()
+    return acquire_lease_script(
+        keys=lease_keys(video_id, chunk_id),
+        args=[chunk_id, lease_member(video_id, chunk_id), token, now + LEASE_TIMEOUT_S, now]
+    ) == 1
+
+def complete_lease(video_id, chunk_id, token):
+    """
+    Mark a chunk (or the audio track) processed if token still holds its
+    lease. Returns 1 if it was the video's last outstanding item, 0 if not,
+    and -1 if the lease was lost and the result must be left to its holder.
+    """
+    return mark_chunk_processed(
+        keys=lease_keys(video_id, chunk_id) + [f"video:{video_id}:remaining"],
+        args=[chunk_id, lease_member(video_id, chunk_id), token]
+    )
+
+def keep_lease_alive(video_id, chunk_id, token, stop_event):
+    """Renew a lease until stop_event is set or the lease is lost."""
+    while not stop_event.wait(LEASE_RENEW_INTERVAL_S):
+        renewed = renew_lease_script(
+            keys=lease_keys(video_id, chunk_id),
+            args=[chunk_id, lease_member(video_id, chunk_id), token, time.time() + LEASE_TIMEOUT_S]
+        )
+        if not renewed:
+            print(f"[Processor] ⚠️ Lost lease on chunk: {chunk_id}")
+            return
+
+def requeue_chunk(video_id, chunk_id):
+    """Hand a chunk back to the scheduler, rebuilt from its redis record."""
+    record = redis_conn.hgetall(f"video:{video_id}:chunk:{chunk_id}")
+    record = {key.decode(): value.decode() for key, value in record.items()}
+    if chunk_id == AUDIO_TRACK_ID:
+        # The audio track skips the scheduler, as when the chunker enqueued it
+        processing_queue.enqueue(PROCESSOR_AUDIO_METHOD, record['chunk_path'], video_id, job_timeout=PROCESSING_JOB_TIMEOUT)
+        return
+
+    video_metadata = redis_conn.hgetall(f'video:{video_id}')
+    video_metadata = {key.decode(): value.decode() for key, value in video_metadata.items()}
+
+    chunk_metadata = {
+        'video_id': video_id,
+        'chunk_id': chunk_id,
+        'chunk_path': record['chunk_path'],
+        'start_pts': float(record.get('start_pts', 0)),
+        'duration': float(record.get('duration', 0)),
+        'virtual': int(record.get('virtual', 0)),
+        'status': 'pending'
+    }
+    if 'complexity' in record:
+        chunk_metadata['complexity'] = float(record['complexity'])
+    if 'rate_scale' in record:
+        chunk_metadata['rate_scale'] = float(record['rate_scale'])
+    cost = estimate_chunk_cost(chunk_metadata['duration'], video_renditions(video_metadata), video_metadata.get('preset'))
+    submit_chunk(redis_conn, video_id, chunk_metadata, cost, video_priority(video_metadata))
+    dispatch(redis_conn, processing_queue, PROCESSOR_SERVICE_METHOD, SCHEDULER_QUEUE_DEPTH)
+
+def release_lease(video_id, chunk_id, token=''):
+    """
+    Give a leased chunk (or the audio track) back after a failure (token) or
+    lease expiry (no token): re-enqueue it, or mark the video errored once
+    attempts run out.
+    """
+    outcome = release_lease_script(
+        keys=lease_keys(video_id, chunk_id),
+        args=[chunk_id, lease_member(video_id, chunk_id), token, MAX_CHUNK_ATTEMPTS, time.time()]
+    )
+    # Chunk progress is only reported for video chunks
+    track_progress = chunk_id != AUDIO_TRACK_ID
+    if outcome == 1:
+        if track_progress:
+            clear_chunk_progress(redis_conn, video_id, chunk_id, 'pending')
+        requeue_chunk(video_id, chunk_id)
+        print(f"[Processor] 🔁 Re-enqueued chunk: {chunk_id} for video_id: {video_id}")
+    elif outcome == 2:
+        if track_progress:
+            clear_chunk_progress(redis_conn, video_id, chunk_id, 'failed')
+        redis_conn.hset(f"video:{video_id}", "status", "error")
+        set_stage(redis_conn, video_id, 'error')
+        reclaim_video(redis_conn, storage, video_id, GC_FAILED_RETENTION_S)
+        print(f"[Processor] 💀 Chunk {chunk_id} failed {MAX_CHUNK_ATTEMPTS} times, video_id: {video_id} errored")
+    return outcome
+
+def reap_expired_leases():
+    """Re-enqueue chunks whose processor stopped renewing its lease."""
+    expired = redis_conn.zrangebyscore(LEASES_KEY, '-inf', time.time())
+    for member in expired:
+        video_id, chunk_id = member.decode().split(':', 1)
+        release_lease(video_id, chunk_id)
+
+def run_reaper():
+    while True:
+        try:
+            reap_expired_leases()
+        except Exception as e:
+            print(f"[Processor] ❌ Lease reaper error: {str(e)}")
+        time.sleep(REAPER_INTERVAL_S)
 
 # ===================
 # Main Worker Task
 # ===================
 
 def process_chunk_task(chunk_metadata, video_id):
-    """Main RQ task function: Process a video chunk."""
-    try:
-        chunk_id = chunk_metadata['chunk_id']
-        chunk_path = chunk_metadata['chunk_path']
+    """Main RQ task function: Process a video chunk under a lease."""
+    chunk_id = chunk_metadata['chunk_id']
+    chunk_path = chunk_metadata['chunk_path']
+    token = uuid.uuid4().hex
+
+    if not acquire_lease(video_id, chunk_id, token):
+        # Already processed, failed, or actively leased by another replica.
+        # This job still used up a queue slot, so refill it
+        print(f"[Processor] ⏭️ Skipping chunk not available for lease: {chunk_id}")
+        dispatch(redis_conn, processing_queue, PROCESSOR_SERVICE_METHOD, SCHEDULER_QUEUE_DEPTH)
+        return {"status": "skipped"}
+
+    update_node(redis_conn, current_job=f"chunk:{video_id}:{chunk_id}")
+    record_queue_wait(redis_conn, 'processor', video_id, chunk_id)
+    stop_renewing = threading.Event()
+    renewer = threading.Thread(target=keep_lease_alive, args=(video_id, chunk_id, token, stop_renewing), daemon=True)
+    renewer.start()
 
+    try:
         print(f"[Processor] 🚀 Processing chunk: {chunk_id} for video_id: {video_id}")
 
         video_metadata = redis_conn.hgetall(f'video:{video_id}')
         video_metadata = {key.decode(): value.decode() for key, value in video_metadata.items()}
 
-        # Set up processed output path
-        chunk_filename = os.path.basename(chunk_path)
+        # Set up processed output paths, one per rendition
+        chunk_filename = chunk_id  # Chunk file name; virtual chunks share the source path
         processed_dir = os.path.join(PROCESSED_CHUNKS_DIR, video_id)
-        output_path = os.path.join(processed_dir, f"processed_{chunk_filename}")
-
-        process_chunk(chunk_path, output_path, video_metadata)
+        output_paths = {
+            rendition: os.path.join(processed_dir, rendition_subdir(video_metadata, rendition), f"processed_{chunk_filename}")
+            for rendition in video_renditions(video_metadata)
+        }
+
+        # A virtual chunk is decoded straight from the stored upload, reading
+        # only its range; a chunk file is staged here first
+        virtual = bool(int(chunk_metadata.get('virtual', 0)))
+        if virtual:
+            source = storage.input_url(storage.key(chunk_path))
+        else:
+            with timed(redis_conn, 'processor', 'fetch', video_id, chunk_id):
+                source = storage.fetch_file(chunk_path)
+
+        # Reuse earlier encodes of identical chunk content with the same parameters
+        if virtual:
+            # A range of the source: identified by the source hash and the range
+            range_id = f"{video_metadata['source_hash']}:{float(chunk_metadata['start_pts']):.6f}:{float(chunk_metadata['duration']):.6f}"
+            chunk_hash = hashlib.sha256(range_id.encode()).hexdigest()
+        else:
+            with timed(redis_conn, 'processor', 'hash', video_id, chunk_id) as stage:
+                stage['bytes_in'] = os.path.getsize(chunk_path)
+                chunk_hash = file_sha256(chunk_path)
+        # The allocated rate changes the output, so it is part of the cache key
+        scale = float(chunk_metadata.get('rate_scale', 1.0))
+        if scale != 1.0:
+            chunk_hash = hashlib.sha256(f"{chunk_hash}:rate_scale={scale}".encode()).hexdigest()
+        cache_keys = {
+            rendition: rendition_cache_key(chunk_hash, video_metadata, rendition)
+            for rendition in output_paths
+        }
+        missing = {
+            rendition: output_path
+            for rendition, output_path in output_paths.items()
+            if not chunk_cache.get(cache_keys[rendition], output_path)
+        }
+
+        if missing:
+            # Encode to per-attempt files so a stale worker can't clobber them
+            attempt_paths = {rendition: f"{output_path}.{token}.mp4" for rendition, output_path in missing.items()}
+            try:
+                with timed(redis_conn, 'processor', 'encode', video_id, chunk_id) as stage:
+                    if not virtual:
+                        stage['bytes_in'] = os.path.getsize(chunk_path)
+                    encode_started = time.time()
+                    process_chunk(
+                        source, attempt_paths, video_metadata,
+                        duration=float(chunk_metadata.get('duration') or 0),
+                        on_progress=chunk_progress_reporter(redis_conn, video_id, chunk_id),
+                        seek=float(chunk_metadata['start_pts']) if virtual else None,
+                        scale=scale
+                    )
+                    stage['rate_scale'] = scale
+                    encode_seconds = time.time() - encode_started
+                    stage['bytes_out'] = sum(os.path.getsize(attempt_path) for attempt_path in attempt_paths.values())
+
+                    # Seconds of video encoded per wall-clock second
+                    if chunk_metadata.get('duration'):
+                        stage['realtime_factor'] = round(float(chunk_metadata['duration']) / max(encode_seconds, 0.001), 3)
+                        set_gauge(redis_conn, REALTIME_FACTOR, stage['realtime_factor'], service='processor')
+
+                record_encode_time(encode_seconds)
+                with timed(redis_conn, 'processor', 'validate', video_id, chunk_id):
+                    probes = [validate_output(attempt_path, chunk_metadata.get('duration')) for attempt_path in attempt_paths.values()]
+                update_node(redis_conn, encode_fps=round(encoded_frames(probes[0]) / max(encode_seconds, 0.001), 2))
+                for rendition, attempt_path in attempt_paths.items():
+                    os.replace(attempt_path, missing[rendition])
+                    chunk_cache.put(cache_keys[rendition], missing[rendition])
+            finally:
+                for attempt_path in attempt_paths.values():
+                    if os.path.exists(attempt_path):
+                        os.remove(attempt_path)
+        else:
+            print(f"[Processor] ♻️ Cache hit for chunk: {chunk_id}")
+
+        with timed(redis_conn, 'processor', 'store', video_id, chunk_id):
+            for output_path in output_paths.values():
+                storage.store_file(output_path)
+                storage.release_file(output_path)
+
+        # Drop the staged input; virtual chunks never stage one
+        if not virtual:
+            storage.release_file(chunk_path)
 
-        video_key = f"video:{video_id}:chunks"
-        redis_conn.hset(video_key, chunk_id, 'processed')
+    except Exception as e:
+        stop_renewing.set()
+        print(f"[Processor] ❌ Error processing chunk: {str(e)}")
+        release_lease(video_id, chunk_id, token)
+        return {"status": "error", "error": str(e)}
 
-        all_chunks_processed = check_all_chunks_processed(video_id)
+    finally:
+        stop_renewing.set()
+        update_node(redis_conn, current_job=None)
+
+    with timed(redis_conn, 'processor', 'bookkeeping', video_id, chunk_id):
+        completed = complete_lease(video_id, chunk_id, token)
+        if completed == -1:
+            # Another processor holds the chunk now; its result is the one counted
+            print(f"[Processor] ⚠️ Lost lease before completing chunk: {chunk_id}")
+            return {"status": "lost_lease"}
+        if completed == 1:
+            # This was the last outstanding chunk, signal the assembler to finalize
+            assembly_queue.enqueue(ASSEMBLER_SERVICE_METHOD, video_id, job_timeout=ASSEMBLY_JOB_TIMEOUT)
+        else:
+            # Let the assembler publish whatever prefix is now contiguous
+            assembly_queue.enqueue(ASSEMBLER_APPEND_METHOD, video_id, job_timeout=ASSEMBLY_JOB_TIMEOUT)
+
+        # The encoded chunk is stored, so its input is no longer needed
+        if not virtual:
+            reclaim(redis_conn, storage, video_id, 'unprocessed_chunks', storage.key(chunk_path))
+
+        # A worker just freed up; top the processing queue back up
+        dispatch(redis_conn, processing_queue, PROCESSOR_SERVICE_METHOD, SCHEDULER_QUEUE_DEPTH)
+        clear_chunk_progress(redis_conn, video_id, chunk_id, 'processed')
+
+    print(f"[Processor] ✅ Finished processing: {chunk_id} ({len(output_paths)} rendition(s))")
+    return {"status": "success", "output_paths": list(output_paths.values())}
+
+def process_audio_task(audio_path, video_id):
+    """
+    RQ task: encode the single demuxed audio track of a video, under the
+    same lease, retry and failure handling as a chunk.
+    """
+    token = uuid.uuid4().hex
+    if not acquire_lease(video_id, AUDIO_TRACK_ID, token):
+        print(f"[Processor] ⏭️ Skipping audio track not available for lease, video_id: {video_id}")
+        return {"status": "skipped"}
+
+    update_node(redis_conn, current_job=f"audio:{video_id}")
+    record_queue_wait(redis_conn, 'processor', video_id, AUDIO_TRACK_ID)
+    stop_renewing = threading.Event()
+    renewer = threading.Thread(target=keep_lease_alive, args=(video_id, AUDIO_TRACK_ID, token, stop_renewing), daemon=True)
+    renewer.start()
 
-        if all_chunks_processed:
-            # If all chunks are processed, signal the assembler to start
-            assembly_queue.enqueue(ASSEMBLER_SERVICE_METHOD, video_id)
-            # redis_conn.sadd(f"video:{video_id}:all_chunks_processed", 'done')
+    try:
+        print(f"[Processor] 🎵 Processing audio track for video_id: {video_id}")
 
+        video_metadata = redis_conn.hgetall(f'video:{video_id}')
+        video_metadata = {key.decode(): value.decode() for key, value in video_metadata.items()}
 
-        print(f"[Processor] ✅ Finished processing: {output_path}")
-        return {"status": "success", "output_path": output_path}
+        output_path = os.path.join(PROCESSED_CHUNKS_DIR, video_id, 'audio.mka')
+        # The demuxed track is staged; with virtual chunks the track is read
+        # from the stored upload, which is never staged here
+        demuxed = storage.key(audio_path).startswith('unprocessed_chunks/')
+        with timed(redis_conn, 'processor', 'encode_audio', video_id, AUDIO_TRACK_ID) as stage:
+            if demuxed:
+                stage['bytes_in'] = os.path.getsize(storage.fetch_file(audio_path))
+                source = audio_path
+            else:
+                source = storage.input_url(storage.key(audio_path))
+            process_audio(source, output_path, video_metadata)
+            stage['bytes_out'] = os.path.getsize(storage.store_file(output_path))
+            storage.release_file(output_path)
+            if demuxed:
+                storage.release_file(audio_path)
 
     except Exception as e:
-        print(f"[Processor] ❌ Error processing chunk: {str(e)}")
+        stop_renewing.set()
+        print(f"[Processor] ❌ Error processing audio: {str(e)}")
+        release_lease(video_id, AUDIO_TRACK_ID, token)
         return {"status": "error", "error": str(e)}
 
+    finally:
+        stop_renewing.set()
+        update_node(redis_conn, current_job=None)
+
+    completed = complete_lease(video_id, AUDIO_TRACK_ID, token)
+    if completed == -1:
+        print(f"[Processor] ⚠️ Lost lease before completing audio for video_id: {video_id}")
+        return {"status": "lost_lease"}
+    if completed == 1:
+        assembly_queue.enqueue(ASSEMBLER_SERVICE_METHOD, video_id, job_timeout=ASSEMBLY_JOB_TIMEOUT)
+    else:
+        # Segments wait for the audio track, so publishing can start now
+        assembly_queue.enqueue(ASSEMBLER_APPEND_METHOD, video_id, job_timeout=ASSEMBLY_JOB_TIMEOUT)
+
+    # The demuxed track is done with; virtual chunks read the upload itself
+    audio_key = storage.key(audio_path)
+    if audio_key.startswith('unprocessed_chunks/'):
+        reclaim(redis_conn, storage, video_id, 'unprocessed_chunks', audio_key)
+
+    print(f"[Processor] ✅ Finished processing audio: {output_path}")
+    return {"status": "success", "output_path": output_path}
+
 # ===================
 # Worker Bootstrap
 # ===================
 
 def start_worker():
+    threading.Thread(target=run_reaper, daemon=True).start()
+    start_heartbeat(redis_conn, 'processor')
+    start_metrics_server(redis_conn)
+
     q = Queue(QUEUE_NAME, connection=redis_conn)
     worker = Worker(queues=[q], connection=redis_conn)
     print(f"[Processor] 🎧 Worker started, listening on queue: {QUEUE_NAME}")